@@ -0,0 +1,44 @@
+import json
+import os
+from datetime import datetime, timedelta
+
+FIXTURES_DIR = os.path.join(os.path.dirname(__file__), "fixtures")
+
+
+def load(name):
+    with open(os.path.join(FIXTURES_DIR, name)) as f:
+        return json.load(f)
+
+
+def geocode_response(text):
+    """Recorded geocoding response for ``text``, or None if none was recorded."""
+    path = os.path.join(FIXTURES_DIR, f"geocode_{text.strip().lower().replace(' ', '_')}.json")
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return json.load(f)
+
+
+def _shift(timestamp, delta):
+    value = datetime.fromisoformat(timestamp) - delta
+    return value.isoformat()
+
+
+def large_plan(edge_count):
+    """The recorded plan repeated ``edge_count`` times, each copy moved earlier.
+
+    Mirrors a large planConnection page: same leg shape and realtime states,
+    distinct departure times.
+    """
+    recorded = load("plan_aalto_keilaniemi.json")["data"]["planConnection"]["edges"]
+    edges = []
+    for i in range(edge_count):
+        source = recorded[i % len(recorded)]["node"]
+        delta = timedelta(minutes=15 * (i // len(recorded)))
+        legs = [
+            dict(leg, start={"scheduledTime": _shift(leg["start"]["scheduledTime"], delta)},
+                 end={"scheduledTime": _shift(leg["end"]["scheduledTime"], delta)})
+            for leg in source["legs"]
+        ]
+        edges.append({"node": {"start": _shift(source["start"], delta), "end": _shift(source["end"], delta), "legs": legs}})
+    return {"data": {"planConnection": {"edges": edges}}}
@@ -0,0 +1,121 @@
+"""Load-test the standalone server against the mock upstream.
+
+    python -m benchmarks.loadtest --workers 4 --clients 32 --requests 2000
+
+Starts the Digitransit/SMTP stand-ins, launches ``journey_service.server``
+in a subprocess pointed at them, then drives ``/journeys`` from
+``--clients`` keep-alive connections. ``--distinct`` controls how many
+different trips are asked for (i.e. the plan cache hit ratio). Prints
+throughput, latency percentiles and how many calls reached the upstream.
+"""
+import argparse
+import http.client
+import json
+import os
+import statistics
+import subprocess
+import sys
+import threading
+import time
+from urllib.parse import urlencode
+
+from benchmarks.mock_server import MockUpstream
+from benchmarks.run import percentile
+
+ROOT = os.path.join(os.path.dirname(__file__), "..")
+
+
+def start_server(env, workers):
+    process = subprocess.Popen(
+        [sys.executable, "-m", "journey_service.server", "--port", "0", "--workers", str(workers)],
+        cwd=ROOT, env=env, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True,
+    )
+    line = process.stdout.readline()
+    if "listening on" not in line:
+        process.kill()
+        raise RuntimeError(f"server did not start: {line!r}")
+    port = int(line.split("http://", 1)[1].split(" ", 1)[0].rsplit(":", 1)[1])
+    # Keep draining stdout (Powertools logs) so the workers never block on a full pipe
+    threading.Thread(target=process.stdout.read, daemon=True).start()
+    return process, port
+
+
+def paths(distinct):
+    return [
+        "/journeys?" + urlencode({
+            "origin": "Aalto-yliopisto", "destination": "Keilaniemi",
+            "arriveBy": f"20250915{8 + i // 60:02d}{i % 60:02d}00",
+        })
+        for i in range(distinct)
+    ]
+
+
+def drive(port, clients, total, targets):
+    """Send ``total`` GETs from ``clients`` threads; returns latencies (ms) and error count."""
+    latencies, errors, lock = [], [0], threading.Lock()
+    counter = iter(range(total))
+
+    def client():
+        connection = http.client.HTTPConnection("127.0.0.1", port, timeout=30)
+        for i in counter:
+            started = time.perf_counter()
+            try:
+                connection.request("GET", targets[i % len(targets)])
+                response = connection.getresponse()
+                response.read()
+                ok = response.status == 200
+            except (OSError, http.client.HTTPException):
+                ok = False
+                connection.close()
+                connection = http.client.HTTPConnection("127.0.0.1", port, timeout=30)
+            elapsed = (time.perf_counter() - started) * 1000
+            with lock:
+                latencies.append(elapsed)
+                errors[0] += not ok
+        connection.close()
+
+    threads = [threading.Thread(target=client) for _ in range(clients)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return latencies, errors[0]
+
+
+def run_load(workers=2, clients=16, total=500, distinct=20, latency=0.02):
+    with MockUpstream(latency=latency) as upstream:
+        env = dict(os.environ, **upstream.env())
+        env["PYTHONPATH"] = os.pathsep.join([os.path.join(ROOT, "src"), ROOT])
+        process, port = start_server(env, workers)
+        try:
+            started = time.perf_counter()
+            latencies, errors = drive(port, clients, total, paths(distinct))
+            elapsed = time.perf_counter() - started
+        finally:
+            process.terminate()
+            process.wait(10)
+        return {
+            "requests": total,
+            "errors": errors,
+            "requests_per_s": round(total / elapsed, 1),
+            "p50_ms": round(statistics.median(latencies), 3),
+            "p99_ms": round(percentile(latencies, 99), 3),
+            "upstream_geocode": upstream.http.requests["geocode"],
+            "upstream_plan": upstream.http.requests["plan"],
+            "emails": upstream.smtp.messages,
+        }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument("--clients", type=int, default=16)
+    parser.add_argument("--requests", type=int, default=500)
+    parser.add_argument("--distinct", type=int, default=20, help="distinct trips requested")
+    parser.add_argument("--latency", type=float, default=0.02, help="mock upstream latency in seconds")
+    args = parser.parse_args(argv)
+    print(json.dumps(run_load(args.workers, args.clients, args.requests, args.distinct, args.latency), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,137 @@
+"""Local stand-ins for the Digitransit APIs and the SMTP relay.
+
+Serves recorded fixtures so benchmarks (and load tests) exercise the real
+HTTP, JSON and SMTP code paths without touching the network.
+"""
+import json
+import re
+import socketserver
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+from benchmarks import fixtures
+
+ALIAS_PATTERN = re.compile(r"(\w+):\s*planConnection\(")
+
+
+class DigitransitHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *args):
+        pass
+
+    def _reply(self, status, payload):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        time.sleep(self.server.latency)
+        self.server.requests["geocode"] += 1
+        text = parse_qs(url.query).get("text", [""])[0]
+        response = fixtures.geocode_response(text)
+        if response is None:
+            # Unrecorded places resolve somewhere near the recorded ones
+            response = fixtures.geocode_response("Keilaniemi")
+        self._reply(200, response)
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        body = json.loads(self.rfile.read(length) or b"{}")
+        query = body.get("query")
+        time.sleep(self.server.latency)
+        self.server.requests["plan"] += 1
+        # Automatic persisted queries: learn documents by hash, then accept the hash alone
+        persisted = (body.get("extensions") or {}).get("persistedQuery")
+        if persisted and query:
+            self.server.persisted[persisted["sha256Hash"]] = query
+        elif persisted:
+            query = self.server.persisted.get(persisted["sha256Hash"])
+            if query is None:
+                self._reply(200, {"errors": [{"message": "PersistedQueryNotFound"}]})
+                return
+        query = query or ""
+        plan = self.server.plan["data"]["planConnection"]
+        aliases = ALIAS_PATTERN.findall(query)
+        if aliases:
+            self._reply(200, {"data": {alias: plan for alias in aliases}})
+        else:
+            self._reply(200, {"data": {"planConnection": plan}})
+
+
+class SMTPHandler(socketserver.StreamRequestHandler):
+    """Just enough SMTP for smtplib without STARTTLS/AUTH."""
+
+    def handle(self):
+        self.wfile.write(b"220 mock\r\n")
+        while line := self.rfile.readline():
+            verb = line.split(b" ")[0].strip().upper()
+            if verb == b"QUIT":
+                self.wfile.write(b"221 bye\r\n")
+                return
+            if verb == b"DATA":
+                self.wfile.write(b"354 go\r\n")
+                while self.rfile.readline() not in (b".\r\n", b""):
+                    pass
+                self.server.messages += 1
+            self.wfile.write(b"250 ok\r\n")
+
+
+class MockUpstream:
+    """Runs the HTTP and SMTP stand-ins on ephemeral localhost ports."""
+
+    def __init__(self, plan=None, latency=0.0):
+        self.http = ThreadingHTTPServer(("127.0.0.1", 0), DigitransitHandler)
+        self.http.daemon_threads = True
+        self.http.plan = plan or fixtures.load("plan_aalto_keilaniemi.json")
+        self.http.latency = latency
+        self.http.requests = {"geocode": 0, "plan": 0}
+        self.http.persisted = {}
+        self.smtp = socketserver.ThreadingTCPServer(("127.0.0.1", 0), SMTPHandler)
+        self.smtp.daemon_threads = True
+        self.smtp.messages = 0
+
+    @property
+    def base_url(self):
+        return f"http://127.0.0.1:{self.http.server_address[1]}"
+
+    def env(self):
+        """Settings that point journey_service at this mock."""
+        return {
+            "GEO_CODING_URL": f"{self.base_url}/geocoding/v1/search",
+            "ROUTING_URL": f"{self.base_url}/routing/v2/hsl/gtfs/v1",
+            "DIGITRANSIT_API_KEY": "benchmark",
+            "SMTP_HOST": "127.0.0.1",
+            "SMTP_PORT": str(self.smtp.server_address[1]),
+            "SMTP_USE_TLS": "false",
+            "FROM_EMAIL": "bench@example.com",
+            "TO_EMAIL": "bench@example.com",
+            # Measure the client, not the production request quota
+            "HTTP_RATE_LIMIT": "0",
+        }
+
+    def __enter__(self):
+        for server in (self.http, self.smtp):
+            threading.Thread(target=server.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *exc):
+        for server in (self.http, self.smtp):
+            server.shutdown()
+            server.server_close()
+
+
+if __name__ == "__main__":
+    with MockUpstream() as upstream:
+        for key, value in upstream.env().items():
+            print(f"{key}={value}")
+        try:
+            threading.Event().wait()
+        except KeyboardInterrupt:
+            pass
@@ -0,0 +1,150 @@
+"""Benchmark the hot path against recorded Digitransit fixtures.
+
+    python -m benchmarks.run                    # run and compare to baseline.json
+    python -m benchmarks.run --update-baseline  # record new baseline numbers
+
+Exits non-zero when a metric regresses by more than --tolerance.
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import statistics
+import sys
+import time
+
+from benchmarks import fixtures
+from benchmarks.mock_server import MockUpstream
+
+BASELINE_PATH = os.path.join(os.path.dirname(__file__), "baseline.json")
+EVENT = {
+    "queryStringParameters": {
+        "origin": "Aalto-yliopisto",
+        "destination": "Keilaniemi",
+        "arriveBy": "20250915084500",
+    }
+}
+
+
+class BenchContext:
+    function_name = "JourneyServiceFunction"
+    memory_limit_in_mb = 512
+    invoked_function_arn = "arn:aws:lambda:local:0:function:JourneyServiceFunction"
+    aws_request_id = "benchmark"
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+def timed(fn, iterations, before=None):
+    # Callers silence stdout around this: Powertools logs and flushes metrics there
+    samples = []
+    for _ in range(iterations):
+        if before:
+            before()
+        started = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - started) * 1000)
+    return samples
+
+
+def latency_metrics(name, samples):
+    return {
+        f"{name}.p50_ms": round(statistics.median(samples), 3),
+        f"{name}.p99_ms": round(percentile(samples, 99), 3),
+    }
+
+
+def bench_filter_journeys(iterations, edge_count):
+    from journey_service.filters import filter_journeys
+
+    plan = fixtures.large_plan(edge_count)
+    samples = timed(lambda: filter_journeys(plan, "Aalto-yliopisto", "Keilaniemi"), iterations)
+    return {"filter_journeys.ops_per_s": round(1000 / statistics.mean(samples), 1)}
+
+
+def bench_query_journeys(iterations):
+    from journey_service import digitransit
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        samples = timed(
+            lambda: digitransit.query_journeys([24.8268, 60.1848], [24.8275, 60.1755], "20250915084500"),
+            iterations,
+            before=digitransit.get_plan_cache().clear,
+        )
+    return latency_metrics("query_journeys", samples)
+
+
+def bench_lambda_handler(iterations):
+    from journey_service import digitransit, handler
+
+    def clear_caches():
+        digitransit.get_geocode_cache().clear()
+        digitransit.get_plan_cache().clear()
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        samples = timed(lambda: handler.lambda_handler(EVENT, BenchContext()), iterations, before=clear_caches)
+    return latency_metrics("lambda_handler", samples)
+
+
+def run(iterations=200, edge_count=500, latency=0.0):
+    with MockUpstream(plan=fixtures.large_plan(edge_count), latency=latency) as upstream:
+        os.environ.update(upstream.env())
+        results = {}
+        results.update(bench_filter_journeys(iterations, edge_count))
+        results.update(bench_query_journeys(iterations))
+        results.update(bench_lambda_handler(iterations))
+    return results
+
+
+def compare(results, baseline, tolerance):
+    """Metrics that are worse than baseline by more than ``tolerance`` (a fraction)."""
+    regressions = []
+    for name, value in results.items():
+        if name not in baseline:
+            continue
+        reference = baseline[name]
+        if name.endswith("_ms"):
+            worse = value > reference * (1 + tolerance)
+        else:
+            worse = value < reference * (1 - tolerance)
+        if worse:
+            regressions.append(f"{name}: {value} (baseline {reference})")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--iterations", type=int, default=200)
+    parser.add_argument("--edges", type=int, default=500, help="edges in the planConnection fixture")
+    parser.add_argument("--latency", type=float, default=0.0, help="simulated upstream latency in seconds")
+    parser.add_argument("--tolerance", type=float, default=0.25)
+    parser.add_argument("--baseline", default=BASELINE_PATH)
+    parser.add_argument("--update-baseline", action="store_true")
+    args = parser.parse_args(argv)
+
+    results = run(args.iterations, args.edges, args.latency)
+    print(json.dumps(results, indent=2))
+
+    if args.update_baseline:
+        with open(args.baseline, "w") as f:
+            json.dump(results, f, indent=2)
+            f.write("\n")
+        return 0
+
+    if not os.path.exists(args.baseline):
+        print("No baseline recorded; run with --update-baseline")
+        return 0
+    with open(args.baseline) as f:
+        regressions = compare(results, json.load(f), args.tolerance)
+    for regression in regressions:
+        print(f"REGRESSION {regression}")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -9,12 +9,21 @@ from aws_cdk import (
     aws_s3 as s3,
     aws_s3_deployment as s3deploy,
     RemovalPolicy,
+    Size,
 
 )
 from constructs import Construct
 import os
 
 
+def lead_cron(hour, minute, lead_minutes):
+    """Hour, minute and weekdays of a MON-FRI cron ``lead_minutes`` earlier (UTC)."""
+    at = int(hour) * 60 + int(minute) - lead_minutes
+    week_day = "MON-FRI" if at >= 0 else "SUN-THU"  # crossed midnight into the previous day
+    at %= 24 * 60
+    return str(at // 60), str(at % 60), week_day
+
+
 class RoutingStack(Stack):
     def __init__(self, scope: Construct, construct_id: str, **kwargs) -> None:
         super().__init__(scope, construct_id, **kwargs)
@@ -40,6 +49,9 @@ class RoutingStack(Stack):
                 "ROUTING_URL": os.getenv(
                     "ROUTING_URL", "https://api.digitransit.fi/routing/v2/hsl/gtfs/v1"
                 ),
+                # JSON list of {email, origin, destination, arriveAt} for the scheduled run
+                "SUBSCRIPTIONS": os.getenv("SUBSCRIPTIONS", ""),
+                "EMAIL_DELIVERY": os.getenv("EMAIL_DELIVERY", "sync"),
             },
         )
 
@@ -49,26 +61,88 @@ class RoutingStack(Stack):
             "JourneyApi",
             handler=journey_lambda,
             proxy=False,
+            # Gzip responses of at least 1 KiB for clients sending Accept-Encoding
+            min_compression_size=Size.kibibytes(1),
+            # Base64 bodies (matrix format=npz) go out as raw bytes to clients accepting them
+            binary_media_types=["application/octet-stream"],
         )
 
         # /journeys endpoint
         journeys = api.root.add_resource("journeys")
         journeys.add_method("GET")
 
+        # /journeys/batch endpoint (many trips per invocation)
+        journeys.add_resource("batch").add_method("POST")
+
+        # /journeys/matrix endpoint (origins x destinations travel times)
+        journeys.add_resource("matrix").add_method("POST")
+
         # Optional: Enable schedule if flag is set
         enable_schedule = os.getenv("ENABLE_SCHEDULE", "false").lower() == "true"
         if enable_schedule:
+            cron_hour = os.getenv("CRON_HOUR", "3")         # 06:00 EEST = 03:00 UTC
+            cron_minute = os.getenv("CRON_MINUTE", "0")
             rule = events.Rule(
                 self,
                 "DailyMorningRule",
                 schedule=events.Schedule.cron(
-                    minute=os.getenv("CRON_MINUTE", "0"),
-                    hour=os.getenv("CRON_HOUR", "3"),         # 06:00 EEST = 03:00 UTC
+                    minute=cron_minute,
+                    hour=cron_hour,
                     week_day="MON-FRI"
                 ),
             )
             rule.add_target(targets.LambdaFunction(journey_lambda))
 
+            # Prefetch phase: plan subscribed trips shortly before delivery, so
+            # delivery only refreshes and sends. The lead is kept short because
+            # the prefetched plans sit in the container's /tmp, which an idle
+            # container does not keep for long.
+            prefetch_hour, prefetch_minute, prefetch_days = lead_cron(
+                cron_hour, cron_minute, int(os.getenv("PREFETCH_LEAD_MINUTES", "3"))
+            )
+            prefetch_rule = events.Rule(
+                self,
+                "PrefetchRule",
+                schedule=events.Schedule.cron(
+                    minute=prefetch_minute,
+                    hour=prefetch_hour,
+                    week_day=prefetch_days
+                ),
+            )
+            prefetch_rule.add_target(targets.LambdaFunction(
+                journey_lambda,
+                event=events.RuleTargetInput.from_object({"action": "prefetch_subscriptions"}),
+            ))
+
+        # Optional: realtime refresh of subscribed trips every few minutes
+        if os.getenv("ENABLE_REALTIME_REFRESH", "false").lower() == "true":
+            refresh_rule = events.Rule(
+                self,
+                "RealtimeRefreshRule",
+                schedule=events.Schedule.cron(
+                    minute=os.getenv("REFRESH_CRON_MINUTE", "0/5"),
+                    hour=os.getenv("REFRESH_CRON_HOUR", "3-6"),
+                    week_day="MON-FRI"
+                ),
+            )
+            refresh_rule.add_target(targets.LambdaFunction(
+                journey_lambda,
+                event=events.RuleTargetInput.from_object({"action": "refresh_subscriptions"}),
+            ))
+
+        # Outbox delivery: drain queued mail on a schedule, so it does not wait
+        # for the next request to reuse the container that queued it
+        if os.getenv("EMAIL_DELIVERY", "sync") == "outbox":
+            drain_rule = events.Rule(
+                self,
+                "OutboxDrainRule",
+                schedule=events.Schedule.rate(Duration.minutes(int(os.getenv("OUTBOX_DRAIN_MINUTES", "1")))),
+            )
+            drain_rule.add_target(targets.LambdaFunction(
+                journey_lambda,
+                event=events.RuleTargetInput.from_object({"action": "drain_outbox"}),
+            ))
+
         
         # S3 bucket for OpenAPI docs
         # ----------------------------
@@ -0,0 +1,157 @@
+import json
+import threading
+import time
+from collections import OrderedDict
+
+
+class SqliteCache:
+    """On-disk key/value tier with expiry and LRU eviction, e.g. under /tmp."""
+
+    def __init__(self, path, maxsize=10000, ttl=86400, clock=time.time):
+        import sqlite3
+
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.clock = clock
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS cache ("
+            "key TEXT PRIMARY KEY, value TEXT NOT NULL, "
+            "expires_at REAL NOT NULL, accessed_at REAL NOT NULL)"
+        )
+
+    def get(self, key):
+        now = self.clock()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value, expires_at FROM cache WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None or row[1] <= now:
+                if row is not None:
+                    self._conn.execute("DELETE FROM cache WHERE key = ?", (key,))
+                self.misses += 1
+                return None
+            self._conn.execute("UPDATE cache SET accessed_at = ? WHERE key = ?", (now, key))
+            self.hits += 1
+            return json.loads(row[0])
+
+    def set(self, key, value, ttl=None):
+        now = self.clock()
+        expires_at = now + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO cache (key, value, expires_at, accessed_at) VALUES (?, ?, ?, ?)",
+                (key, json.dumps(value), expires_at, now),
+            )
+            self._evict(now)
+
+    def _evict(self, now):
+        self._conn.execute("DELETE FROM cache WHERE expires_at <= ?", (now,))
+        (count,) = self._conn.execute("SELECT COUNT(*) FROM cache").fetchone()
+        if count > self.maxsize:
+            self._conn.execute(
+                "DELETE FROM cache WHERE key IN "
+                "(SELECT key FROM cache ORDER BY accessed_at LIMIT ?)",
+                (count - self.maxsize,),
+            )
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM cache")
+            self.hits = self.misses = 0
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM cache").fetchone()[0]
+
+    def stats(self):
+        return {"hits": self.hits, "misses": self.misses, "size": len(self)}
+
+
+class TTLCache:
+    """Thread-safe in-process LRU cache with TTL and an optional disk tier.
+
+    Lives at module level so entries survive across warm Lambda invocations.
+    Misses on the memory tier fall through to ``disk`` and are promoted on hit.
+    Expired entries are kept for a further ``stale_ttl`` seconds, invisible
+    to ``get`` but available to ``get_stale`` as a fallback.
+    """
+
+    def __init__(self, maxsize=256, ttl=3600, disk=None, clock=time.monotonic, stale_ttl=0):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.disk = disk
+        self.clock = clock
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        now = self.clock()
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None and entry[1] > now:
+                self._data.move_to_end(key)
+                self.hits += 1
+                return entry[0]
+            if entry is not None and entry[1] + self.stale_ttl <= now:
+                del self._data[key]
+        value = self.disk.get(key) if self.disk is not None else None
+        with self._lock:
+            if value is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._store(key, value, now + self.ttl)
+        return value
+
+    def get_stale(self, key):
+        """Value for ``key`` even if expired, within the stale window; None otherwise."""
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None and entry[1] + self.stale_ttl > self.clock():
+                return entry[0]
+        return None
+
+    def set(self, key, value, ttl=None):
+        expires_at = self.clock() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            self._store(key, value, expires_at)
+        if self.disk is not None:
+            self.disk.set(key, value, ttl=ttl)
+
+    def discard(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def _store(self, key, value, expires_at):
+        self._data[key] = (value, expires_at)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self.hits = self.misses = 0
+        if self.disk is not None:
+            self.disk.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+    def stats(self):
+        stats = {"hits": self.hits, "misses": self.misses, "size": len(self)}
+        if self.disk is not None:
+            stats["disk"] = self.disk.stats()
+        return stats
+
+
+def normalize_query(text):
+    """Normalize free-text place queries so trivial variants share a cache key."""
+    return " ".join(text.split()).casefold()
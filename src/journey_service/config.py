@@ -1,25 +1,137 @@
 import os
-from dotenv import load_dotenv
+from functools import lru_cache
 
-env = os.getenv("ENV", "dev")
+# Settings are resolved on first attribute access rather than at import, so
+# cold starts skip the .env probe (and the dotenv import) until a value is
+# actually needed. `config.X` reads go through the module __getattr__ below.
 
-# Try local first, then default to .env.dev
-dotenv_path = f".env.{env}"
-if os.path.exists(dotenv_path):
+
+def _load_dotenv(env):
+    # Try local first, then default to .env.dev
+    dotenv_path = f".env.{env}"
+    if not os.path.exists(dotenv_path):
+        # When running inside Docker, look inside Lambda root
+        dotenv_path = os.path.join(os.getcwd(), f".env.{env}")
+        if not os.path.exists(dotenv_path):
+            return
+    from dotenv import load_dotenv
     load_dotenv(dotenv_path)
-else:
-    # When running inside Docker, look inside Lambda root
-    lambda_path = os.path.join(os.getcwd(), f".env.{env}")
-    if os.path.exists(lambda_path):
-        load_dotenv(lambda_path)
 
-API_KEY = os.getenv("DIGITRANSIT_API_KEY")
-FROM_EMAIL = os.getenv("FROM_EMAIL")
-TO_EMAIL = os.getenv("TO_EMAIL")
-GMAIL_APP_PASSWORD = os.getenv("GMAIL_APP_PASSWORD")
-GEO_CODING_URL = os.getenv("GEO_CODING_URL")
-ROUTING_URL = os.getenv("ROUTING_URL")
-JOURNEY_COUNT = int(os.getenv("JOURNEY_COUNT", "5"))
-CRON_HOUR = os.getenv("CRON_HOUR")
-CRON_MINUTE = os.getenv("CRON_MINUTE")
-ENABLE_SCHEDULE = os.getenv("ENABLE_SCHEDULE")
+
+@lru_cache(maxsize=None)
+def load():
+    """Resolve every setting once and memoize the result."""
+    env = os.getenv("ENV", "dev")
+    _load_dotenv(env)
+    return {
+        "ENV": env,
+        "API_KEY": os.getenv("DIGITRANSIT_API_KEY"),
+        "FROM_EMAIL": os.getenv("FROM_EMAIL"),
+        "TO_EMAIL": os.getenv("TO_EMAIL"),
+        "GMAIL_APP_PASSWORD": os.getenv("GMAIL_APP_PASSWORD"),
+        "GEO_CODING_URL": os.getenv("GEO_CODING_URL"),
+        "ROUTING_URL": os.getenv("ROUTING_URL"),
+        "JOURNEY_COUNT": int(os.getenv("JOURNEY_COUNT", "5")),
+        "CRON_HOUR": os.getenv("CRON_HOUR"),
+        "CRON_MINUTE": os.getenv("CRON_MINUTE"),
+        "ENABLE_SCHEDULE": os.getenv("ENABLE_SCHEDULE"),
+        "GEOCODE_CACHE_SIZE": int(os.getenv("GEOCODE_CACHE_SIZE", "512")),
+        "GEOCODE_CACHE_TTL": int(os.getenv("GEOCODE_CACHE_TTL", "86400")),
+        "GEOCODE_CACHE_PATH": os.getenv("GEOCODE_CACHE_PATH"),
+        "GEOCODE_CACHE_DISK_SIZE": int(os.getenv("GEOCODE_CACHE_DISK_SIZE", "10000")),
+        "PLACE_INDEX_ENABLED": os.getenv("PLACE_INDEX_ENABLED", "true").lower() == "true",
+        "PLACE_INDEX_PATH": os.getenv("PLACE_INDEX_PATH"),
+        "GAZETTEER_PATH": os.getenv("GAZETTEER_PATH"),
+        "PLACE_FUZZY_CUTOFF": float(os.getenv("PLACE_FUZZY_CUTOFF", "0.85")),
+        "PLACE_MERGE_RADIUS": float(os.getenv("PLACE_MERGE_RADIUS", "500")),
+        "HTTP_POOL_SIZE": int(os.getenv("HTTP_POOL_SIZE", "10")),
+        "HTTP_MAX_WORKERS": int(os.getenv("HTTP_MAX_WORKERS", "8")),
+        "SERVER_HOST": os.getenv("SERVER_HOST", "127.0.0.1"),
+        "SERVER_PORT": int(os.getenv("SERVER_PORT", "8080")),
+        "SERVER_WORKERS": int(os.getenv("SERVER_WORKERS", "1")),
+        "SERVER_THREADS": int(os.getenv("SERVER_THREADS", "32")),
+        "SERVER_MAX_BODY": int(os.getenv("SERVER_MAX_BODY", "1048576")),
+        "SERVER_GZIP_MIN_BYTES": int(os.getenv("SERVER_GZIP_MIN_BYTES", "1024")),
+        "HTTP_CONNECT_TIMEOUT": float(os.getenv("HTTP_CONNECT_TIMEOUT", "3.05")),
+        "HTTP_RATE_LIMIT": float(os.getenv("HTTP_RATE_LIMIT", "10")),
+        "HTTP_RATE_BURST": int(os.getenv("HTTP_RATE_BURST", "20")),
+        "HTTP_RATE_WAIT_MAX": float(os.getenv("HTTP_RATE_WAIT_MAX", "5")),
+        "HTTP_RETRIES": int(os.getenv("HTTP_RETRIES", "3")),
+        "HTTP_BACKOFF_BASE": float(os.getenv("HTTP_BACKOFF_BASE", "0.2")),
+        "HTTP_BACKOFF_MAX": float(os.getenv("HTTP_BACKOFF_MAX", "5")),
+        "BREAKER_THRESHOLD": int(os.getenv("BREAKER_THRESHOLD", "5")),
+        "BREAKER_RESET_SECONDS": float(os.getenv("BREAKER_RESET_SECONDS", "30")),
+        "COALESCE_ENABLED": os.getenv("COALESCE_ENABLED", "true").lower() == "true",
+        "COALESCE_DIR": os.getenv("COALESCE_DIR"),
+        "COALESCE_RECORD_TTL": float(os.getenv("COALESCE_RECORD_TTL", "60")),
+        "GEOCODE_TIMEOUT": float(os.getenv("GEOCODE_TIMEOUT", "5")),
+        "ROUTING_TIMEOUT": float(os.getenv("ROUTING_TIMEOUT", "15")),
+        "ROUTER_SELECTION": os.getenv("ROUTER_SELECTION", "false").lower() == "true",
+        "ROUTERS_FILE": os.getenv("ROUTERS_FILE"),
+        "ROUTER_MAX_CONCURRENCY": int(os.getenv("ROUTER_MAX_CONCURRENCY", "8")),
+        "ROUTER_QUEUE_SECONDS": float(os.getenv("ROUTER_QUEUE_SECONDS", "2")),
+        "ROUTER_GRID_DEGREES": float(os.getenv("ROUTER_GRID_DEGREES", "0.5")),
+        "GRAPHQL_PERSISTED_QUERIES": os.getenv("GRAPHQL_PERSISTED_QUERIES", "false").lower() == "true",
+        "ROUTING_BACKEND": os.getenv("ROUTING_BACKEND", "remote"),
+        "GTFS_PATH": os.getenv("GTFS_PATH", "/opt/gtfs/hsl.zip"),
+        "TIMETABLE_PATH": os.getenv("TIMETABLE_PATH"),
+        "LOCAL_ITINERARIES": int(os.getenv("LOCAL_ITINERARIES", "5")),
+        "LOCAL_MAX_ROUNDS": int(os.getenv("LOCAL_MAX_ROUNDS", "4")),
+        "LOCAL_ACCESS_RADIUS": float(os.getenv("LOCAL_ACCESS_RADIUS", "800")),
+        "LOCAL_TRANSFER_RADIUS": float(os.getenv("LOCAL_TRANSFER_RADIUS", "200")),
+        "LOCAL_WALK_SPEED": float(os.getenv("LOCAL_WALK_SPEED", "1.3")),
+        "LOCAL_MIN_TRANSFER_SECONDS": int(os.getenv("LOCAL_MIN_TRANSFER_SECONDS", "60")),
+        "ROUTING_BATCH_SIZE": int(os.getenv("ROUTING_BATCH_SIZE", "10")),
+        "MATRIX_MAX_PAIRS": int(os.getenv("MATRIX_MAX_PAIRS", "2500")),
+        "SWEEP_STEP_MINUTES": int(os.getenv("SWEEP_STEP_MINUTES", "5")),
+        "SWEEP_MAX_STEPS": int(os.getenv("SWEEP_MAX_STEPS", "36")),
+        "SWEEP_CONCURRENCY": int(os.getenv("SWEEP_CONCURRENCY", "4")),
+        "PAGE_SIZE": int(os.getenv("PAGE_SIZE", "5")),
+        "PAGE_MAX_PAGES": int(os.getenv("PAGE_MAX_PAGES", "10")),
+        "STREAM_MAX_ITINERARIES": int(os.getenv("STREAM_MAX_ITINERARIES", "50")),
+        "BATCH_MAX_TRIPS": int(os.getenv("BATCH_MAX_TRIPS", "50")),
+        "PLAN_CACHE_SIZE": int(os.getenv("PLAN_CACHE_SIZE", "256")),
+        "PLAN_CACHE_SCHEDULED_TTL": int(os.getenv("PLAN_CACHE_SCHEDULED_TTL", "900")),
+        "PLAN_CACHE_STALE_TTL": int(os.getenv("PLAN_CACHE_STALE_TTL", "3600")),
+        "PLAN_CACHE_REALTIME_TTL": int(os.getenv("PLAN_CACHE_REALTIME_TTL", "60")),
+        "HISTORY_DIR": os.getenv("HISTORY_DIR"),
+        "REALTIME_TRACK_TTL": int(os.getenv("REALTIME_TRACK_TTL", "10800")),
+        "REALTIME_NOTIFY_SECONDS": int(os.getenv("REALTIME_NOTIFY_SECONDS", "120")),
+        "PLAN_CACHE_BUCKET_SECONDS": int(os.getenv("PLAN_CACHE_BUCKET_SECONDS", "60")),
+        "PLAN_CACHE_PRECISION": int(os.getenv("PLAN_CACHE_PRECISION", "4")),
+        "SMTP_HOST": os.getenv("SMTP_HOST", "smtp.gmail.com"),
+        "SMTP_PORT": int(os.getenv("SMTP_PORT", "587")),
+        "SMTP_USE_TLS": os.getenv("SMTP_USE_TLS", "true").lower() == "true",
+        "SMTP_TIMEOUT": float(os.getenv("SMTP_TIMEOUT", "10")),
+        "EMAIL_DELIVERY": os.getenv("EMAIL_DELIVERY", "sync"),
+        "OUTBOX_PATH": os.getenv("OUTBOX_PATH", "/tmp/outbox.sqlite"),
+        "OUTBOX_BATCH_SIZE": int(os.getenv("OUTBOX_BATCH_SIZE", "20")),
+        "OUTBOX_MAX_ATTEMPTS": int(os.getenv("OUTBOX_MAX_ATTEMPTS", "5")),
+        "OUTBOX_BACKOFF_SECONDS": float(os.getenv("OUTBOX_BACKOFF_SECONDS", "30")),
+        "OUTBOX_BACKOFF_MAX_SECONDS": float(os.getenv("OUTBOX_BACKOFF_MAX_SECONDS", "900")),
+        "OUTBOX_LEASE_SECONDS": float(os.getenv("OUTBOX_LEASE_SECONDS", "60")),
+        "PREFETCH_PATH": os.getenv("PREFETCH_PATH", "/tmp/prefetch.sqlite"),
+        "PREFETCH_VALID_SECONDS": int(os.getenv("PREFETCH_VALID_SECONDS", "5400")),
+        "PREFETCH_REFRESH_AFTER": int(os.getenv("PREFETCH_REFRESH_AFTER", "600")),
+        "SUBSCRIPTIONS": os.getenv("SUBSCRIPTIONS"),
+        "SUBSCRIPTIONS_FILE": os.getenv("SUBSCRIPTIONS_FILE"),
+        "DEFAULT_ORIGIN": os.getenv("DEFAULT_ORIGIN", "Aalto-yliopisto"),
+        "DEFAULT_DESTINATION": os.getenv("DEFAULT_DESTINATION", "Keilaniemi"),
+        "DEFAULT_ARRIVE_AT": os.getenv("DEFAULT_ARRIVE_AT", "08:45"),
+        "METRICS_SINK_PATH": os.getenv("METRICS_SINK_PATH"),
+        "PROFILE_ENABLED": os.getenv("PROFILE_ENABLED", "false").lower() == "true",
+        "PROFILE_SAMPLE_RATE": float(os.getenv("PROFILE_SAMPLE_RATE", "0.01")),
+        "PROFILE_TOKEN": os.getenv("PROFILE_TOKEN"),
+        "PROFILE_DIR": os.getenv("PROFILE_DIR", "/tmp/profiles"),
+        "PROFILE_KEEP": int(os.getenv("PROFILE_KEEP", "20")),
+        "PROFILE_TOP": int(os.getenv("PROFILE_TOP", "15")),
+        "PROFILE_TRACEMALLOC_FRAMES": int(os.getenv("PROFILE_TRACEMALLOC_FRAMES", "1")),
+        "TIMEZONE": os.getenv("TIMEZONE", "Europe/Helsinki"),
+    }
+
+
+def __getattr__(name):
+    try:
+        return load()[name]
+    except KeyError:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}") from None
@@ -1,23 +1,116 @@
-import requests
 from datetime import datetime, timedelta
-from .config import API_KEY,GEO_CODING_URL,ROUTING_URL
+import threading
+from journey_service import config
+from . import http_client, queries, routers
+from .cache import SqliteCache, TTLCache, normalize_query
+from .instrumentation import emit
+from .resilience import UpstreamUnavailable
+from .singleflight import coalesce
 
-def get_coordinates(origin, destination):
-    url = GEO_CODING_URL
-    headers = {"Accept": "application/json", "digitransit-subscription-key": API_KEY}
+# Module level so warm Lambda invocations reuse earlier lookups; built on
+# first use so importing this module does not resolve config
+_geocode_cache = None
+_plan_cache = None
+_cache_lock = threading.Lock()
+# (router, persisted-query hash) pairs acknowledged in this container
+_persisted_hashes = set()
 
-    origin_response = requests.get(url, headers=headers, params={"text": origin}).json()
-    destination_response = requests.get(url, headers=headers, params={"text": destination}).json()
 
-    origin_coordinates = origin_response['features'][0]['geometry']['coordinates']
-    destination_coordinates = destination_response['features'][0]['geometry']['coordinates']
+class PlaceNotFound(ValueError):
+    """The geocoder returned no match for a place name."""
 
+
+def get_geocode_cache():
+    global _geocode_cache
+    if _geocode_cache is None:
+        with _cache_lock:
+            if _geocode_cache is None:
+                disk = None
+                if config.GEOCODE_CACHE_PATH:
+                    disk = SqliteCache(config.GEOCODE_CACHE_PATH, maxsize=config.GEOCODE_CACHE_DISK_SIZE,
+                                       ttl=config.GEOCODE_CACHE_TTL)
+                _geocode_cache = TTLCache(maxsize=config.GEOCODE_CACHE_SIZE, ttl=config.GEOCODE_CACHE_TTL, disk=disk)
+    return _geocode_cache
+
+
+def get_plan_cache():
+    global _plan_cache
+    if _plan_cache is None:
+        with _cache_lock:
+            if _plan_cache is None:
+                _plan_cache = TTLCache(maxsize=config.PLAN_CACHE_SIZE, ttl=config.PLAN_CACHE_SCHEDULED_TTL,
+                                       stale_ttl=config.PLAN_CACHE_STALE_TTL)
+    return _plan_cache
+
+
+def geocode(text, timeout=None):
+    key = normalize_query(text)
+    coordinates = get_geocode_cache().get(key)
+    if coordinates is not None:
+        return coordinates
+
+    # Well-known stops and gazetteer places resolve in-process; HTTP only on a miss
+    from .places import get_place_index
+
+    index = get_place_index()
+    coordinates = index.lookup(text) if index is not None else None
+    if coordinates is not None:
+        get_geocode_cache().set(key, coordinates)
+        return coordinates
+
+    # Concurrent lookups of the same place share one upstream request
+    return coalesce("geocode:" + key, _geocode_remote, text, key, timeout)
+
+
+def _geocode_remote(text, key, timeout):
+    headers = {"Accept": "application/json", "digitransit-subscription-key": config.API_KEY}
+    response = http_client.get(
+        config.GEO_CODING_URL,
+        timeout=timeout or config.GEOCODE_TIMEOUT,
+        service="geocode",
+        headers=headers,
+        params={"text": text},
+    )
+    response.raise_for_status()
+    features = response.json().get("features")
+    if not features:
+        raise PlaceNotFound(f"No location found for '{text}'")
+    coordinates = features[0]['geometry']['coordinates']
+    get_geocode_cache().set(key, coordinates)
+    return coordinates
+
+
+def get_coordinates(origin, destination, timeout=None):
+    # Both lookups go out in parallel over the shared connection pool
+    origin_coordinates, destination_coordinates = http_client.run_concurrently(
+        geocode, [(origin, timeout), (destination, timeout)]
+    )
     return origin_coordinates, destination_coordinates
 
 
-def query_journeys(origin_coordinates, destination_coordinates, arrive_by):
-    origin = f"origin: {{ location: {{ coordinate: {{ latitude: {origin_coordinates[1]}, longitude: {origin_coordinates[0]} }} }} }}"
-    destination = f"destination: {{ location: {{ coordinate: {{ latitude: {destination_coordinates[1]}, longitude: {destination_coordinates[0]} }} }} }}"
+def _geocode_or_error(text, timeout=None):
+    try:
+        return geocode(text, timeout)
+    except (PlaceNotFound, UpstreamUnavailable) as e:
+        return e
+
+
+def get_coordinates_many(names, timeout=None, errors=False):
+    """Geocode many place names, looking up each distinct (normalized) name once.
+
+    With ``errors``, a name that is unknown or could not be geocoded maps to
+    its PlaceNotFound or UpstreamUnavailable instead of failing every name.
+    """
+    unique = {}
+    for name in names:
+        unique.setdefault(normalize_query(name), name)
+    lookup = _geocode_or_error if errors else geocode
+    coordinates = http_client.run_concurrently(lookup, [(name, timeout) for name in unique.values()])
+    by_key = dict(zip(unique, coordinates))
+    return {name: by_key[normalize_query(name)] for name in names}
+
+
+def snap_arrival(arrive_by):
     arrive_by = datetime.strptime(arrive_by, "%Y%m%d%H%M%S")
 
     # If input is weekend, shift to Monday
@@ -26,46 +119,250 @@ def query_journeys(origin_coordinates, destination_coordinates, arrive_by):
     elif arrive_by.weekday() == 6:
         arrive_by += timedelta(days=1)
 
-    latest_arrival = '"' + arrive_by.strftime("%Y-%m-%dT%H:%M:%S+03:00") + '"'
-
-    query = """
-    {
-        planConnection("""+ origin + destination +"""
-            dateTime:  {
-            latestArrival: """ + latest_arrival + """
-            }
-        ) {
-        edges {
-            node {
-                start
-                end
-                legs {
-                    from {
-                        name
-                    }
-                    to {
-                        name
-                    }
-                    start {
-                        scheduledTime
-                    }
-                    end {
-                        scheduledTime
-                        }
-                    mode
-                    duration
-                    realtimeState
-                    }
-                }
-            }
-        }
-    }"""
-
-
-    response = requests.post(
-        url=ROUTING_URL,
-        headers={"Content-Type": "application/json", "digitransit-subscription-key": API_KEY},
-        json={"query": query}
-    )
+    # Floor to the plan-cache bucket, so a cached plan never arrives later
+    # than any request that maps to the same bucket
+    seconds = arrive_by.hour * 3600 + arrive_by.minute * 60 + arrive_by.second
+    return arrive_by - timedelta(seconds=seconds % config.PLAN_CACHE_BUCKET_SECONDS)
+
+
+def _latest_arrival(arrive_by):
+    return snap_arrival(arrive_by).strftime("%Y-%m-%dT%H:%M:%S+03:00")
+
+
+def plan_cache_key(origin_coordinates, destination_coordinates, arrive_by, fields="text"):
+    points = [round(c, config.PLAN_CACHE_PRECISION) for c in (*origin_coordinates, *destination_coordinates)]
+    key = "{},{}>{},{}@".format(*points) + snap_arrival(arrive_by).strftime("%Y%m%d%H%M%S")
+    # Plans fetched with another field selection are cached separately
+    return key if fields == "text" else f"{key}#{fields}"
+
+
+def plan_ttl(result):
+    """Scheduled-only plans stay valid longer than ones carrying realtime updates."""
+    for edge in result["data"]["planConnection"]["edges"]:
+        for leg in edge["node"]["legs"]:
+            if leg.get("realtimeState") not in (None, "SCHEDULED"):
+                return config.PLAN_CACHE_REALTIME_TTL
+    return config.PLAN_CACHE_SCHEDULED_TTL
+
+
+def _cache_plan(key, result):
+    if result.get("errors") or not (result.get("data") or {}).get("planConnection"):
+        return
+    get_plan_cache().set(key, result, ttl=plan_ttl(result))
+
+
+def _record_history(origin_coordinates, destination_coordinates, arrive_by, result, fields):
+    """Append a freshly fetched plan to the history store, when one is configured."""
+    from .history import RECORDED_FIELDS, get_history
+
+    history = get_history()
+    if history is None or fields not in RECORDED_FIELDS:
+        return
+    if result.get("errors") or not (result.get("data") or {}).get("planConnection"):
+        return
+    from zoneinfo import ZoneInfo
+
+    try:
+        arrival = snap_arrival(arrive_by).replace(tzinfo=ZoneInfo(config.TIMEZONE))
+        history.record(result, origin_coordinates, destination_coordinates, arrival)
+    except (OSError, KeyError, ValueError):
+        # History is best effort; never fail a plan over it
+        emit("HistoryWriteErrors", 1)
+
+
+def post_query(query, variables, timeout=None, router=None):
+    """POST a GraphQL document with its variables to ``router`` (ROUTING_URL by default).
+
+    With GRAPHQL_PERSISTED_QUERIES the document's hash is sent along and,
+    once the router has seen it, the text is left out of later requests;
+    a PersistedQueryNotFound reply resends it in full.
+    """
+    router = router or routers.default_router()
+    persisted = config.GRAPHQL_PERSISTED_QUERIES
+    known = (router.name, queries.query_hash(query))
+    hash_only = persisted and known in _persisted_hashes
+    result = _post_body(queries.request_body(query, variables, persisted, include_query=not hash_only), timeout, router)
+    if hash_only and queries.persisted_query_missing(result):
+        _persisted_hashes.discard(known)
+        result = _post_body(queries.request_body(query, variables, persisted), timeout, router)
+    if persisted and not queries.persisted_query_missing(result):
+        _persisted_hashes.add(known)
+    return result
+
+
+def _post_body(body, timeout, router):
+    with router.slot():
+        response = http_client.post(
+            router.url,
+            timeout=timeout or config.ROUTING_TIMEOUT,
+            service=router.service,
+            pool=router.pool,
+            headers={"Content-Type": "application/json", "digitransit-subscription-key": config.API_KEY},
+            json=body,
+        )
     response.raise_for_status()
     return response.json()
+
+
+def _post_with_fallback(chain, query, variables, timeout):
+    """Post to the first router of ``chain`` that is available; returns (result, router).
+
+    A router that is unavailable, saturated or answers with GraphQL errors
+    hands the request to the next (larger) one; the last one's outcome stands.
+    """
+    for router in chain[:-1]:
+        try:
+            result = post_query(query, variables, timeout, router)
+        except UpstreamUnavailable:
+            emit("RouterFallbacks", 1)
+            continue
+        if not result.get("errors"):
+            return result, router
+        emit("RouterFallbacks", 1)
+    return post_query(query, variables, timeout, chain[-1]), chain[-1]
+
+
+def _tag_router(result, router):
+    # Lets later requests about this plan (realtime refresh) go to the same router
+    if config.ROUTER_SELECTION:
+        result["router"] = router.name
+    return result
+
+
+def _stale_plan(key):
+    """An expired cached plan to answer with while the router is unavailable."""
+    stale = get_plan_cache().get_stale(key)
+    if stale is not None:
+        emit("PlanStaleServed", 1)
+    return stale
+
+
+def _plan_locally(origin_coordinates, destination_coordinates, arrive_by):
+    from . import raptor
+
+    return raptor.plan(origin_coordinates, destination_coordinates, snap_arrival(arrive_by))
+
+
+def query_journeys(origin_coordinates, destination_coordinates, arrive_by, timeout=None, fields="text"):
+    """Plan one trip; ``fields`` picks the leg selection (see ``queries.LEG_FIELDS``)."""
+    key = plan_cache_key(origin_coordinates, destination_coordinates, arrive_by, fields)
+    cached = get_plan_cache().get(key)
+    if cached is not None:
+        return cached
+    return coalesce(
+        "plan:" + key, _fetch_plan, key, origin_coordinates, destination_coordinates, arrive_by, timeout, fields
+    )
+
+
+def _fetch_plan(key, origin_coordinates, destination_coordinates, arrive_by, timeout, fields):
+    if config.ROUTING_BACKEND == "local":
+        result = _plan_locally(origin_coordinates, destination_coordinates, arrive_by)
+    else:
+        variables = queries.plan_variables(origin_coordinates, destination_coordinates, _latest_arrival(arrive_by))
+        chain = routers.chain(origin_coordinates, destination_coordinates)
+        try:
+            result = _tag_router(*_post_with_fallback(chain, queries.PLAN_QUERIES[fields], variables, timeout))
+        except UpstreamUnavailable:
+            stale = _stale_plan(key)
+            if stale is None:
+                raise
+            return stale
+    _cache_plan(key, result)
+    _record_history(origin_coordinates, destination_coordinates, arrive_by, result, fields)
+    return result
+
+
+def iter_plan_pages(origin_coordinates, destination_coordinates, arrive_by, page_size=None, timeout=None,
+                    fields="text", max_pages=None):
+    """Yield ``planConnection`` pages lazily, following ``pageInfo.endCursor``.
+
+    Each page is requested only when the previous one has been consumed, so
+    a caller that stops iterating stops the requests. Pages are not cached.
+    """
+    if config.ROUTING_BACKEND == "local":
+        yield _plan_locally(origin_coordinates, destination_coordinates, arrive_by)["data"]["planConnection"]
+        return
+    latest_arrival = _latest_arrival(arrive_by)
+    chain = routers.chain(origin_coordinates, destination_coordinates)
+    after = None
+    for _ in range(max_pages or config.PAGE_MAX_PAGES):
+        variables = queries.page_variables(origin_coordinates, destination_coordinates, latest_arrival,
+                                           page_size or config.PAGE_SIZE, after)
+        emit("PlanPagesFetched", 1)
+        # Cursors belong to the router that issued them, so only the first page falls back
+        result, router = _post_with_fallback(chain, queries.PAGE_QUERIES[fields], variables, timeout)
+        chain = [router]
+        connection = (result.get("data") or {}).get("planConnection")
+        if connection is None:
+            return
+        yield connection
+        page_info = connection.get("pageInfo") or {}
+        after = page_info.get("endCursor")
+        if not page_info.get("hasNextPage") or not after:
+            return
+
+
+def query_journeys_batch(trips, timeout=None, batch_size=None, fields="text"):
+    """Plan many (origin_coordinates, destination_coordinates, arrive_by) trips.
+
+    Identical trips are planned once and cached plans are reused. The rest
+    are grouped by router chain and packed into aliased ``planConnection``
+    fields, ``batch_size`` per GraphQL request, and the chunks are posted
+    concurrently. Returns one ``query_journeys``-shaped result per input
+    trip; a trip the router failed on carries ``errors``.
+    """
+    batch_size = batch_size or config.ROUTING_BATCH_SIZE
+    results = {}
+    pending = []
+    for trip in dict.fromkeys((tuple(o), tuple(d), a) for o, d, a in trips):
+        cached = get_plan_cache().get(plan_cache_key(*trip, fields))
+        if cached is not None:
+            results[trip] = cached
+        else:
+            pending.append(trip)
+
+    if config.ROUTING_BACKEND == "local":
+        for trip in pending:
+            results[trip] = _plan_locally(*trip)
+            _cache_plan(plan_cache_key(*trip, fields), results[trip])
+            _record_history(*trip, results[trip], fields)
+        return [results[(tuple(o), tuple(d), a)] for o, d, a in trips]
+
+    groups = {}
+    for trip in pending:
+        chain = routers.chain(trip[0], trip[1])
+        groups.setdefault(tuple(router.name for router in chain), (chain, []))[1].append(trip)
+    chunks = [
+        (chain, trips[i:i + batch_size]) for chain, trips in groups.values() for i in range(0, len(trips), batch_size)
+    ]
+
+    def run_chunk(chain, chunk):
+        query, variables = queries.batch_query(len(chunk), fields), {}
+        for i, (o, d, a) in enumerate(chunk):
+            variables.update(queries.plan_variables(o, d, _latest_arrival(a), index=i))
+        # Only a router that is down is skipped; per-trip errors stay with the trip
+        for router in chain:
+            try:
+                return _tag_router(post_query(query, variables, timeout, router), router)
+            except UpstreamUnavailable as e:
+                error = e
+                if router is not chain[-1]:
+                    emit("RouterFallbacks", 1)
+        return {"errors": [{"message": str(error)}], "unavailable": True}
+
+    for (_, chunk), response in zip(chunks, http_client.run_concurrently(run_chunk, chunks)):
+        data = response.get("data") or {}
+        router = routers.get_router(response.get("router"))
+        for i, trip in enumerate(chunk):
+            plan = data.get(f"p{i}")
+            stale = _stale_plan(plan_cache_key(*trip, fields)) if response.get("unavailable") else None
+            if stale is not None:
+                results[trip] = stale
+            elif plan is None:
+                errors = [e for e in response.get("errors", []) if e.get("path", [f"p{i}"])[0] == f"p{i}"]
+                results[trip] = {"data": {"planConnection": None}, "errors": errors or [{"message": "No plan returned"}]}
+            else:
+                results[trip] = _tag_router({"data": {"planConnection": plan}}, router)
+                _cache_plan(plan_cache_key(*trip, fields), results[trip])
+                _record_history(*trip, results[trip], fields)
+    return [results[(tuple(o), tuple(d), a)] for o, d, a in trips]
@@ -1,29 +1,102 @@
+import heapq
 from datetime import datetime, timedelta
-from .utils import format_arrival_time
-from .config import JOURNEY_COUNT
+from journey_service import config
+from .instrumentation import stage
+from .models import Itinerary
 
-def filter_journeys(result, origin, destination):
-    journeys = []
+
+def select_itineraries(result, count=None):
+    """The ``count`` latest-departing itineraries, in ascending start order.
+
+    Uses a bounded heap instead of sorting every edge, and only builds
+    ``Itinerary`` objects (parsing leg timestamps) for the edges it keeps.
+    """
     edges = result["data"]["planConnection"]["edges"]
-    sorted_edges = sorted(edges, key=lambda e: datetime.fromisoformat(e["node"]["start"]))[-JOURNEY_COUNT:]
-    for i in sorted_edges:
-        journeys.append("Route Details :-")
-        journey_duration = 0
-        for j in i['node']['legs']:
-            start_time = datetime.fromisoformat(j['start']['scheduledTime'].split("+")[0]).strftime("%H:%M:%S")
-            end_time = datetime.fromisoformat(j['end']['scheduledTime'].split("+")[0]).strftime("%H:%M:%S")
-            duration = j['duration']
-            from_loc = j['from']['name']
-            if from_loc == "Origin":
-                from_loc = origin
-            to_loc = j['to']['name']
-            if to_loc == "Destination":
-                to_loc = destination
-            journeys.append("Time to leave from " + from_loc + " : " + start_time)
-            journey = from_loc + ":"+start_time + "  --TO-->  " + to_loc + ":"+end_time + "  BY-->  " + j['mode'] + " " + str(timedelta(seconds=duration))+" min"
-            journeys.append(journey)
-            journey_duration += duration
-        journeys.append("Total Journey Duration = " + str(timedelta(seconds=journey_duration))+" min")
-        journeys.append("")
-        journeys.append("")
+    count = count or config.JOURNEY_COUNT
+    # Edge index breaks ties so equal start times keep their response order
+    latest = heapq.nlargest(
+        count,
+        ((datetime.fromisoformat(edge["node"]["start"]), i) for i, edge in enumerate(edges)),
+    )
+    return [Itinerary.from_node(edges[i]["node"], start) for start, i in reversed(latest)]
+
+
+def iter_itineraries(pages, limit=None, latest_departure=None, max_duration=None):
+    """Yield qualifying itineraries from ``planConnection`` pages as they arrive.
+
+    ``latest_departure`` (datetime) and ``max_duration`` (seconds, door to
+    door) filter itineraries; iteration stops, without fetching further
+    pages, once ``limit`` have been yielded.
+    """
+    if limit is not None and limit <= 0:
+        return
+    seen = 0
+    for page in pages:
+        for edge in page.get("edges", []):
+            node = edge["node"]
+            start = datetime.fromisoformat(node["start"])
+            if latest_departure is not None and start > latest_departure:
+                continue
+            if max_duration is not None and (datetime.fromisoformat(node["end"]) - start).total_seconds() > max_duration:
+                continue
+            yield Itinerary.from_node(node, start)
+            seen += 1
+            if seen == limit:
+                return
+
+
+def render_text(itineraries, origin, destination):
+    """Yield the human-readable lines used by the API and email body."""
+    for itinerary in itineraries:
+        yield "Route Details :-"
+        for leg in itinerary.legs:
+            start_time = leg.start.strftime("%H:%M:%S")
+            end_time = leg.end.strftime("%H:%M:%S")
+            from_loc = origin if leg.from_name == "Origin" else leg.from_name
+            to_loc = destination if leg.to_name == "Destination" else leg.to_name
+            yield f"Time to leave from {from_loc} : {start_time}"
+            yield f"{from_loc}:{start_time}  --TO-->  {to_loc}:{end_time}  BY-->  {leg.mode} {timedelta(seconds=leg.duration)} min"
+        yield f"Total Journey Duration = {timedelta(seconds=itinerary.duration)} min"
+        yield ""
+        yield ""
+
+
+def render_json(itineraries, origin, destination):
+    journeys = []
+    for itinerary in itineraries:
+        journey = itinerary.to_dict()
+        for leg in journey["legs"]:
+            if leg["from"] == "Origin":
+                leg["from"] = origin
+            if leg["to"] == "Destination":
+                leg["to"] = destination
+        journeys.append(journey)
     return journeys
+
+
+COMPACT_LEG_FIELDS = ["from", "to", "start", "end", "mode", "duration", "realtimeState"]
+
+
+def render_compact(itineraries, origin, destination):
+    """Positional encoding: epoch-second times and one array per leg (see ``fields``)."""
+    journeys = []
+    for itinerary in itineraries:
+        legs = [[
+            origin if leg.from_name == "Origin" else leg.from_name,
+            destination if leg.to_name == "Destination" else leg.to_name,
+            int(leg.start.timestamp()), int(leg.end.timestamp()), leg.mode, leg.duration, leg.realtime_state,
+        ] for leg in itinerary.legs]
+        end = int(itinerary.end.timestamp()) if itinerary.end else None
+        journeys.append([int(itinerary.start.timestamp()), end, legs])
+    return {"fields": COMPACT_LEG_FIELDS, "journeys": journeys}
+
+
+def render_email(itineraries, origin, destination):
+    return "\n".join(render_text(itineraries, origin, destination))
+
+
+def filter_journeys(result, origin, destination):
+    with stage("filter"):
+        itineraries = select_itineraries(result)
+    with stage("render"):
+        return list(render_text(itineraries, origin, destination))
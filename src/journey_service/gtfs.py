@@ -0,0 +1,318 @@
+import array
+import csv
+import io
+import json
+import math
+import mmap
+import os
+import sys
+import tempfile
+import zipfile
+
+MAGIC = b"RPTT0001"
+
+# GTFS route_type (basic and extended) to the mode names Digitransit returns
+ROUTE_TYPE_MODES = {0: "TRAM", 1: "SUBWAY", 2: "RAIL", 3: "BUS", 4: "FERRY", 5: "CABLE_CAR", 6: "GONDOLA", 7: "FUNICULAR"}
+EXTENDED_ROUTE_TYPE_MODES = {1: "RAIL", 2: "BUS", 4: "SUBWAY", 7: "BUS", 9: "TRAM", 10: "FERRY", 11: "AIRPLANE"}
+
+# name -> typecode of every array section in a compiled timetable
+ARRAYS = {
+    "stop_lat": "d",
+    "stop_lon": "d",
+    "pattern_route": "i",
+    "pattern_stops_offset": "i",   # pattern p's stops: pattern_stops[offset[p]:offset[p + 1]]
+    "pattern_stops": "i",
+    "pattern_trips_offset": "i",   # pattern p's trips: range(offset[p], offset[p + 1]), sorted by time
+    "trip_service": "i",
+    "trip_times_offset": "i",      # trip t's times: arrivals/departures[offset[t]:offset[t] + len(stops)]
+    "arrivals": "i",
+    "departures": "i",
+    "stop_patterns_offset": "i",   # stop s's (pattern, position) pairs
+    "stop_patterns": "i",
+    "stop_positions": "i",
+    "transfers_offset": "i",       # stop s's footpaths: (transfer_stops, transfer_seconds)
+    "transfer_stops": "i",
+    "transfer_seconds": "i",
+}
+
+
+def route_mode(route_type):
+    route_type = int(route_type)
+    if route_type in ROUTE_TYPE_MODES:
+        return ROUTE_TYPE_MODES[route_type]
+    return EXTENDED_ROUTE_TYPE_MODES.get(route_type // 100, "BUS")
+
+
+def distance_m(lat1, lon1, lat2, lon2):
+    """Equirectangular distance; accurate to well under 1% at city scale."""
+    x = math.radians(lon2 - lon1) * math.cos(math.radians((lat1 + lat2) / 2))
+    y = math.radians(lat2 - lat1)
+    return 6371000 * math.hypot(x, y)
+
+
+def _seconds(hms):
+    hours, minutes, seconds = hms.strip().split(":")
+    return int(hours) * 3600 + int(minutes) * 60 + int(seconds)
+
+
+def _rows(feed, name):
+    if name not in feed.namelist():
+        return
+    with feed.open(name) as f:
+        yield from csv.DictReader(io.TextIOWrapper(f, "utf-8-sig"))
+
+
+class Timetable:
+    """Array-backed timetable laid out for RAPTOR scans.
+
+    Trips with the same route and stop sequence form a pattern; a pattern's
+    trips are stored consecutively and ordered by time so the router can
+    binary-search them. Arrays are ``array.array`` when built from a feed and
+    zero-copy ``memoryview`` casts over an mmap when loaded from disk.
+    """
+
+    def __init__(self, meta, arrays, buffer=None):
+        self.meta = meta
+        self.stop_ids = meta["stop_ids"]
+        self.stop_names = meta["stop_names"]
+        self.trip_ids = meta["trip_ids"]
+        self.route_names = meta["route_names"]
+        self.route_modes = meta["route_modes"]
+        self.services = meta["services"]
+        self._buffer = buffer
+        for name in ARRAYS:
+            setattr(self, name, arrays[name])
+
+    # -- building ---------------------------------------------------------
+
+    @classmethod
+    def from_gtfs(cls, path, transfer_radius=200, walk_speed=1.3):
+        with zipfile.ZipFile(path) as feed:
+            return cls._build(feed, transfer_radius, walk_speed)
+
+    @classmethod
+    def _build(cls, feed, transfer_radius, walk_speed):
+        stop_index, stop_ids, stop_names = {}, [], []
+        stop_lat, stop_lon = array.array("d"), array.array("d")
+        for row in _rows(feed, "stops.txt"):
+            stop_index[row["stop_id"]] = len(stop_ids)
+            stop_ids.append(row["stop_id"])
+            stop_names.append(row["stop_name"])
+            stop_lat.append(float(row["stop_lat"]))
+            stop_lon.append(float(row["stop_lon"]))
+
+        route_index, route_names, route_modes = {}, [], []
+        for row in _rows(feed, "routes.txt"):
+            route_index[row["route_id"]] = len(route_names)
+            route_names.append(row.get("route_short_name") or row.get("route_long_name") or row["route_id"])
+            route_modes.append(route_mode(row["route_type"]))
+
+        services, service_index = cls._read_services(feed)
+        trip_meta = {}
+        for row in _rows(feed, "trips.txt"):
+            service = row["service_id"]
+            if service not in service_index:
+                service_index[service] = len(services)
+                services.append({"id": service, "days": [0] * 7, "start": 0, "end": 0, "added": [], "removed": []})
+            trip_meta[row["trip_id"]] = (route_index[row["route_id"]], service_index[service])
+
+        stop_times = {}
+        for row in _rows(feed, "stop_times.txt"):
+            stop_times.setdefault(row["trip_id"], []).append((
+                int(row["stop_sequence"]),
+                stop_index[row["stop_id"]],
+                _seconds(row["arrival_time"] or row["departure_time"]),
+                _seconds(row["departure_time"] or row["arrival_time"]),
+            ))
+
+        patterns = {}
+        for trip_id, times in stop_times.items():
+            if trip_id not in trip_meta or len(times) < 2:
+                continue
+            times.sort()
+            key = (trip_meta[trip_id][0], tuple(stop for _, stop, _, _ in times))
+            patterns.setdefault(key, []).append((times[0][3], trip_id, times))
+
+        arrays = {name: array.array(code) for name, code in ARRAYS.items()}
+        arrays["stop_lat"], arrays["stop_lon"] = stop_lat, stop_lon
+        trip_ids = []
+        stop_patterns = [[] for _ in stop_ids]
+        arrays["pattern_stops_offset"].append(0)
+        arrays["pattern_trips_offset"].append(0)
+        for p, ((route, stops), trips) in enumerate(patterns.items()):
+            arrays["pattern_route"].append(route)
+            arrays["pattern_stops"].extend(stops)
+            arrays["pattern_stops_offset"].append(len(arrays["pattern_stops"]))
+            for position, stop in enumerate(stops):
+                stop_patterns[stop].append((p, position))
+            # Ordered by first departure; the router assumes trips of a pattern do not overtake
+            for _, trip_id, times in sorted(trips):
+                arrays["trip_service"].append(trip_meta[trip_id][1])
+                arrays["trip_times_offset"].append(len(arrays["arrivals"]))
+                arrays["arrivals"].extend(arr for _, _, arr, _ in times)
+                arrays["departures"].extend(dep for _, _, _, dep in times)
+                trip_ids.append(trip_id)
+            arrays["pattern_trips_offset"].append(len(trip_ids))
+
+        arrays["stop_patterns_offset"].append(0)
+        for entries in stop_patterns:
+            for p, position in entries:
+                arrays["stop_patterns"].append(p)
+                arrays["stop_positions"].append(position)
+            arrays["stop_patterns_offset"].append(len(arrays["stop_patterns"]))
+
+        arrays["transfers_offset"].append(0)
+        for stop, neighbours in enumerate(cls._footpaths(stop_lat, stop_lon, transfer_radius)):
+            for other, metres in neighbours:
+                arrays["transfer_stops"].append(other)
+                arrays["transfer_seconds"].append(int(metres / walk_speed))
+            arrays["transfers_offset"].append(len(arrays["transfer_stops"]))
+
+        meta = {
+            "stop_ids": stop_ids,
+            "stop_names": stop_names,
+            "trip_ids": trip_ids,
+            "route_names": route_names,
+            "route_modes": route_modes,
+            "services": services,
+        }
+        return cls(meta, arrays)
+
+    @staticmethod
+    def _read_services(feed):
+        services, service_index = [], {}
+        for row in _rows(feed, "calendar.txt"):
+            service_index[row["service_id"]] = len(services)
+            services.append({
+                "id": row["service_id"],
+                "days": [int(row[day]) for day in
+                         ("monday", "tuesday", "wednesday", "thursday", "friday", "saturday", "sunday")],
+                "start": int(row["start_date"]),
+                "end": int(row["end_date"]),
+                "added": [],
+                "removed": [],
+            })
+        for row in _rows(feed, "calendar_dates.txt"):
+            service = row["service_id"]
+            if service not in service_index:
+                service_index[service] = len(services)
+                services.append({"id": service, "days": [0] * 7, "start": 0, "end": 0, "added": [], "removed": []})
+            key = "added" if row["exception_type"] == "1" else "removed"
+            services[service_index[service]][key].append(int(row["date"]))
+        return services, service_index
+
+    @staticmethod
+    def _footpaths(stop_lat, stop_lon, radius):
+        """Walking links between stops within ``radius`` metres (grid-bucketed)."""
+        cell = radius / 111000 or 1
+        grid = {}
+        for stop, (lat, lon) in enumerate(zip(stop_lat, stop_lon)):
+            grid.setdefault((int(lat // cell), int(lon // cell)), []).append(stop)
+        for stop, (lat, lon) in enumerate(zip(stop_lat, stop_lon)):
+            row, col = int(lat // cell), int(lon // cell)
+            neighbours = []
+            # Longitude degrees are shorter than latitude ones this far north, so widen the search
+            span = max(1, math.ceil(1 / max(math.cos(math.radians(lat)), 0.1)))
+            for dr in (-1, 0, 1):
+                for dc in range(-span, span + 1):
+                    for other in grid.get((row + dr, col + dc), ()):
+                        if other != stop:
+                            metres = distance_m(lat, lon, stop_lat[other], stop_lon[other])
+                            if metres <= radius:
+                                neighbours.append((other, metres))
+            yield neighbours
+
+    # -- queries ----------------------------------------------------------
+
+    def active_services(self, day):
+        """Indices of services running on ``day`` (a ``datetime.date``)."""
+        ymd = int(day.strftime("%Y%m%d"))
+        weekday = day.weekday()
+        active = set()
+        for index, service in enumerate(self.services):
+            running = service["days"][weekday] and service["start"] <= ymd <= service["end"]
+            if ymd in service["added"]:
+                running = True
+            elif ymd in service["removed"]:
+                running = False
+            if running:
+                active.add(index)
+        return active
+
+    def stops_near(self, lat, lon, radius):
+        """(stop, metres) pairs within ``radius`` of a point."""
+        lat_margin = radius / 111000
+        lon_margin = lat_margin / max(math.cos(math.radians(lat)), 0.1)
+        near = []
+        for stop in range(len(self.stop_ids)):
+            stop_lat, stop_lon = self.stop_lat[stop], self.stop_lon[stop]
+            if abs(stop_lat - lat) <= lat_margin and abs(stop_lon - lon) <= lon_margin:
+                metres = distance_m(lat, lon, stop_lat, stop_lon)
+                if metres <= radius:
+                    near.append((stop, metres))
+        return near
+
+    # -- persistence ------------------------------------------------------
+
+    def save(self, path):
+        """Write the compact binary form: magic, JSON header, 8-byte aligned arrays."""
+        sections, blobs, offset = {}, [], 0
+        for name, code in ARRAYS.items():
+            data = bytes(memoryview(getattr(self, name)).cast("B"))
+            sections[name] = [offset, code, len(data) // array.array(code).itemsize]
+            blobs.append(data + b"\0" * (-len(data) % 8))
+            offset += len(blobs[-1])
+        header = json.dumps({"byteorder": sys.byteorder, "sections": sections, **self.meta}).encode()
+        header += b" " * (-len(header) % 8)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(MAGIC)
+            f.write(len(header).to_bytes(8, "little"))
+            f.write(header)
+            for blob in blobs:
+                f.write(blob)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        """Memory-map a compiled timetable; arrays are views, nothing is copied."""
+        with open(path, "rb") as f:
+            buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if buffer[:8] != MAGIC:
+            raise ValueError(f"{path} is not a compiled timetable")
+        header_length = int.from_bytes(buffer[8:16], "little")
+        meta = json.loads(buffer[16:16 + header_length])
+        if meta.pop("byteorder") != sys.byteorder:
+            raise ValueError(f"{path} was compiled on a machine with different byte order")
+        base = 16 + header_length
+        view = memoryview(buffer)
+        arrays = {}
+        for name, (offset, code, count) in meta.pop("sections").items():
+            size = count * array.array(code).itemsize
+            arrays[name] = view[base + offset:base + offset + size].cast(code)
+        return cls(meta, arrays, buffer=buffer)
+
+
+def is_fresh(path, sources):
+    """Whether ``path`` exists and is no older than any existing source file."""
+    return os.path.exists(path) and all(
+        os.path.getmtime(path) >= os.path.getmtime(source) for source in sources if os.path.exists(source)
+    )
+
+
+def writable_path(path, sources):
+    """``path`` when it is up to date or can be (re)written; otherwise the same
+    name in the temp directory, e.g. next to a GTFS zip under read-only ``/opt``."""
+    if is_fresh(path, sources) or os.access(os.path.dirname(path) or ".", os.W_OK):
+        return path
+    return os.path.join(tempfile.gettempdir(), os.path.basename(path))
+
+
+def load_timetable(gtfs_path, timetable_path=None, transfer_radius=200, walk_speed=1.3):
+    """Compiled timetable for a GTFS zip, compiling (and caching) it if stale."""
+    timetable_path = timetable_path or writable_path(f"{gtfs_path}.timetable", [gtfs_path])
+    if is_fresh(timetable_path, [gtfs_path]):
+        return Timetable.load(timetable_path)
+    timetable = Timetable.from_gtfs(gtfs_path, transfer_radius=transfer_radius, walk_speed=walk_speed)
+    timetable.save(timetable_path)
+    return Timetable.load(timetable_path)
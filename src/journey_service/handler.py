@@ -1,20 +1,28 @@
+import hashlib
 import json
-from aws_lambda_powertools import Logger, Tracer, Metrics
-from aws_lambda_powertools.metrics import MetricUnit
-from aws_lambda_powertools.event_handler.api_gateway import ApiGatewayResolver
 from datetime import datetime, timedelta
 
-from .digitransit import get_coordinates, query_journeys
-from .filters import filter_journeys
-from .notifier import send_email
+from journey_service import config
+from .digitransit import (
+    PlaceNotFound, get_coordinates, get_coordinates_many, get_geocode_cache, get_plan_cache, iter_plan_pages,
+    query_journeys, query_journeys_batch,
+)
+from .filters import (
+    filter_journeys, iter_itineraries, render_compact, render_json, render_text, select_itineraries,
+)
+from .instrumentation import emit, logger, metrics, record_cache, stage, tracer
+from .models import Itinerary
+from .notifier import queue_email, send_email
+from .profiling import maybe_profile
+from .resilience import UpstreamUnavailable
+from .subscriptions import run_prefetch, run_refresh, run_scheduled
+from .sweep import step_count, sweep
 
-logger = Logger()
-tracer = Tracer()
-metrics = Metrics(namespace="JourneyNotification", service="JourneyService")
+# Accept type selecting the compact structured body
+COMPACT_TYPE = "application/vnd.journeys.compact+json"
 
 
-def start(origin, destination, arrive_by):
-
+def adjust_weekend(arrive_by):
     # Parse incoming arrive_by string (yyyyMMddHHmmss)
     dt = datetime.strptime(arrive_by, "%Y%m%d%H%M%S")
 
@@ -26,33 +34,349 @@ def start(origin, destination, arrive_by):
         dt += timedelta(days=1)
         logger.info("Adjusted arriveBy from Sunday -> Monday")
 
-    arrive_by = dt.strftime("%Y%m%d%H%M%S")
+    return dt.strftime("%Y%m%d%H%M%S")
 
-    origin_coordinates, destination_coordinates = get_coordinates(origin, destination)
-    api_response = query_journeys(origin_coordinates, destination_coordinates, arrive_by)
-    journeys = filter_journeys(result=api_response, origin=origin, destination=destination)
-    email_status = send_email(body_text=journeys)
+
+def _valid_arrive_by(arrive_by):
+    """Whether ``arrive_by`` is a yyyyMMddHHmmss string."""
+    try:
+        datetime.strptime(arrive_by, "%Y%m%d%H%M%S")
+    except (TypeError, ValueError):
+        return False
+    return True
+
+
+def _error(status_code, message):
+    return {"statusCode": status_code, "body": json.dumps({"error": message})}
+
+
+def plan_journeys(origin, destination, arrive_by):
+    """Geocode both places and plan the (weekend-adjusted) trip."""
+    arrive_by = adjust_weekend(arrive_by)
+
+    with stage("geocode"):
+        origin_coordinates, destination_coordinates = get_coordinates(origin, destination)
+    with stage("plan"):
+        return query_journeys(origin_coordinates, destination_coordinates, arrive_by)
+
+
+def deliver_journeys(origin, destination, api_response, compact=False):
+    """Render a plan, email its text lines and return the response message."""
+    if compact:
+        with stage("filter"):
+            itineraries = select_itineraries(api_response)
+        with stage("render"):
+            journeys = list(render_text(itineraries, origin, destination))
+    else:
+        journeys = filter_journeys(result=api_response, origin=origin, destination=destination)
+    with stage("email"):
+        if config.EMAIL_DELIVERY == "outbox":
+            email_status = queue_email(body_text=journeys)
+        else:
+            email_status = send_email(body_text=journeys)
+    if compact:
+        return dict(render_compact(itineraries, origin, destination), emailStatus=email_status)
     return {"Journeys": journeys, "Email Status": email_status}
 
+
+def start(origin, destination, arrive_by):
+    return deliver_journeys(origin, destination, plan_journeys(origin, destination, arrive_by))
+
+
+def plan_etag(result, *variant):
+    """Strong ETag over the normalized plan plus whatever else shapes the body."""
+    digest = hashlib.blake2b(json.dumps(result, sort_keys=True, separators=(",", ":")).encode(), digest_size=16)
+    for part in variant:
+        digest.update(b"\0" + part.encode())
+    return f'"{digest.hexdigest()}"'
+
+
+def etag_matches(if_none_match, etag):
+    """If-None-Match check; weak tags and a transport ``-gzip`` suffix still match."""
+    if not if_none_match:
+        return False
+    tags = {tag.strip().removeprefix("W/").replace('-gzip"', '"') for tag in if_none_match.split(",")}
+    return "*" in tags or etag in tags
+
+
+def _journeys_response(origin, destination, arrive_by, headers):
+    compact = COMPACT_TYPE in headers.get("accept", "")
+    api_response = plan_journeys(origin, destination, arrive_by)
+    etag = plan_etag(api_response, origin, destination, COMPACT_TYPE if compact else "application/json")
+    response_headers = {"ETag": etag, "Cache-Control": "no-cache", "Vary": "Accept"}
+    # An unchanged plan is neither rendered nor emailed again
+    if etag_matches(headers.get("if-none-match"), etag):
+        emit("JourneyNotModified", 1)
+        return {"statusCode": 304, "headers": response_headers, "body": ""}
+
+    result = deliver_journeys(origin, destination, api_response, compact)
+    emit("JourneyEmailsSent", 1)
+    if compact:
+        response_headers["Content-Type"] = COMPACT_TYPE
+        return {"statusCode": 200, "headers": response_headers, "body": json.dumps(result, separators=(",", ":"))}
+    return {"statusCode": 200, "headers": response_headers, "body": json.dumps({"message": result})}
+
+
+def start_batch(trips):
+    """Plan a list of {origin, destination, arriveBy} trips in one invocation.
+
+    Place names are geocoded once each and the plans go out as aliased,
+    chunked GraphQL requests. A trip that cannot be geocoded or planned
+    carries an ``error`` instead of journeys. Batch results are returned
+    only, not emailed.
+    """
+    arrive_bys = [adjust_weekend(trip["arriveBy"]) for trip in trips]
+    with stage("geocode"):
+        coordinates = get_coordinates_many(
+            [trip["origin"] for trip in trips] + [trip["destination"] for trip in trips], errors=True
+        )
+    located = [
+        (i, coordinates[trip["origin"]], coordinates[trip["destination"]]) for i, trip in enumerate(trips)
+        if not isinstance(coordinates[trip["origin"]], Exception)
+        and not isinstance(coordinates[trip["destination"]], Exception)
+    ]
+    with stage("plan"):
+        planned = query_journeys_batch([
+            (origin_coordinates, destination_coordinates, arrive_bys[i])
+            for i, origin_coordinates, destination_coordinates in located
+        ])
+    plans = dict(zip((i for i, _, _ in located), planned))
+
+    results = []
+    for i, (trip, arrive_by) in enumerate(zip(trips, arrive_bys)):
+        result = {"origin": trip["origin"], "destination": trip["destination"], "arriveBy": arrive_by}
+        plan = plans.get(i)
+        if plan is None:
+            result["error"] = "; ".join(
+                str(coordinates[name]) for name in (trip["origin"], trip["destination"])
+                if isinstance(coordinates[name], Exception)
+            )
+        elif plan["data"]["planConnection"] is None:
+            result["error"] = "; ".join(e.get("message", "") for e in plan["errors"])
+        else:
+            result["Journeys"] = filter_journeys(result=plan, origin=trip["origin"], destination=trip["destination"])
+        results.append(result)
+    return results
+
+
+def _batch_response(body):
+    try:
+        trips = json.loads(body).get("trips")
+    except (TypeError, ValueError, AttributeError):
+        trips = None
+    if not isinstance(trips, list) or not trips:
+        return _error(400, "Body must contain a non-empty trips list")
+    if len(trips) > config.BATCH_MAX_TRIPS:
+        return _error(400, f"At most {config.BATCH_MAX_TRIPS} trips per batch")
+    if not all(isinstance(t, dict) and t.get("origin") and t.get("destination") and t.get("arriveBy") for t in trips):
+        return _error(400, "Every trip needs origin, destination and arriveBy")
+    if not all(isinstance(t["origin"], str) and isinstance(t["destination"], str) for t in trips):
+        return _error(400, "Trip origins and destinations must be place names")
+    if not all(_valid_arrive_by(t["arriveBy"]) for t in trips):
+        return _error(400, "Every arriveBy must be yyyyMMddHHmmss")
+
+    results = start_batch(trips)
+    emit("JourneyBatchTrips", len(trips))
+    return {"statusCode": 200, "body": json.dumps({"message": results})}
+
+def start_sweep(origin, destination, window_start, window_end, step_minutes=None):
+    """Every distinct itinerary arriving within a window of deadlines, departure ordered.
+
+    Sweep results are returned only, not emailed.
+    """
+    window_start, window_end = adjust_weekend(window_start), adjust_weekend(window_end)
+    with stage("geocode"):
+        origin_coordinates, destination_coordinates = get_coordinates(origin, destination)
+    with stage("plan"):
+        merged = sweep(origin_coordinates, destination_coordinates, window_start, window_end, step_minutes)
+    itineraries = [Itinerary.from_node(edge["node"]) for edge in merged["data"]["planConnection"]["edges"]]
+    return {"Journeys": render_json(itineraries, origin, destination)}
+
+
+def _sweep_response(params):
+    origin, destination = params.get("origin"), params.get("destination")
+    try:
+        step_minutes = int(params.get("step") or config.SWEEP_STEP_MINUTES)
+        # Counted on the weekend-shifted window that is actually swept, before building it
+        window_start, window_end = adjust_weekend(params["windowStart"]), adjust_weekend(params["windowEnd"])
+        steps = step_count(window_start, window_end, step_minutes)
+    except (KeyError, ValueError):
+        steps = 0
+    if not origin or not destination or not steps:
+        return {"statusCode": 400, "body": json.dumps(
+            {"error": "Sweep needs origin, destination, windowStart <= windowEnd and a positive step"})}
+    if steps > config.SWEEP_MAX_STEPS:
+        return {"statusCode": 400, "body": json.dumps({"error": f"At most {config.SWEEP_MAX_STEPS} steps per sweep"})}
+
+    result = start_sweep(origin, destination, window_start, window_end, step_minutes)
+    emit("JourneySweepSteps", steps)
+    return {"statusCode": 200, "body": json.dumps({"message": result})}
+
+
+def _matrix_response(body):
+    try:
+        request = json.loads(body)
+        origins, destinations = request["origins"], request["destinations"]
+        arrive_by, output = request["arriveBy"], request.get("format", "json")
+    except (TypeError, ValueError, KeyError):
+        return _error(400, "Body needs origins, destinations and arriveBy")
+    if not isinstance(origins, list) or not isinstance(destinations, list) or not origins or not destinations:
+        return _error(400, "origins and destinations must be non-empty lists")
+    if not all(isinstance(place, str) and place for place in origins + destinations):
+        return _error(400, "origins and destinations must be place names")
+    if len(origins) * len(destinations) > config.MATRIX_MAX_PAIRS:
+        return _error(400, f"At most {config.MATRIX_MAX_PAIRS} pairs per matrix")
+    if not _valid_arrive_by(arrive_by):
+        return _error(400, "arriveBy must be yyyyMMddHHmmss")
+    if output not in ("json", "npz"):
+        return _error(400, "format must be json or npz")
+
+    from . import matrix
+
+    arrive_by = adjust_weekend(arrive_by)
+    with stage("matrix"):
+        matrices = matrix.travel_time_matrix(origins, destinations, arrive_by)
+    emit("JourneyMatrixPairs", len(origins) * len(destinations))
+    if output == "npz":
+        return {
+            "statusCode": 200,
+            "headers": {"Content-Type": "application/octet-stream"},
+            "isBase64Encoded": True,
+            "body": matrix.to_npz(matrices, origins, destinations),
+        }
+    return {"statusCode": 200, "body": json.dumps({"message": matrix.to_json(matrices, origins, destinations, arrive_by)})}
+
+
+def stream_journeys(origin, destination, origin_coordinates, destination_coordinates, arrive_by, limit,
+                    latest_departure=None, max_duration=None):
+    """NDJSON lines, one itinerary each, produced as planConnection pages arrive."""
+    pages = iter_plan_pages(origin_coordinates, destination_coordinates, arrive_by, fields="expanded")
+    try:
+        for itinerary in iter_itineraries(pages, limit, latest_departure, max_duration):
+            yield json.dumps(render_json([itinerary], origin, destination)[0]) + "\n"
+    except Exception as e:
+        # Headers are already out, so failures end the stream with an error line
+        logger.exception("Error streaming itineraries")
+        yield json.dumps({"error": str(e)}) + "\n"
+    finally:
+        pages.close()
+
+
+def _stream_response(params):
+    origin, destination, arrive_by = params.get("origin"), params.get("destination"), params.get("arriveBy")
+    if not origin or not destination or not arrive_by:
+        return {"statusCode": 400, "body": json.dumps({"error": "Missing origin, destination, or arriveBy"})}
+    try:
+        limit = min(int(params.get("count") or config.JOURNEY_COUNT), config.STREAM_MAX_ITINERARIES)
+        max_duration = int(params["maxDuration"]) * 60 if params.get("maxDuration") else None
+        latest_departure = None
+        if params.get("latestDeparture"):
+            from zoneinfo import ZoneInfo
+
+            latest_departure = datetime.strptime(params["latestDeparture"], "%Y%m%d%H%M%S").replace(
+                tzinfo=ZoneInfo(config.TIMEZONE)
+            )
+    except ValueError:
+        return {"statusCode": 400, "body": json.dumps({"error": "Invalid count, maxDuration or latestDeparture"})}
+
+    arrive_by = adjust_weekend(arrive_by)
+    # Geocoding happens before the first byte so unknown places are still a 404
+    origin_coordinates, destination_coordinates = get_coordinates(origin, destination)
+    return {
+        "statusCode": 200,
+        "headers": {"Content-Type": "application/x-ndjson"},
+        "body": stream_journeys(origin, destination, origin_coordinates, destination_coordinates, arrive_by,
+                                limit, latest_departure, max_duration),
+    }
+
+
+def _record_caches():
+    record_cache("geocode", get_geocode_cache())
+    record_cache("plan", get_plan_cache())
+
+
 @logger.inject_lambda_context
 @tracer.capture_lambda_handler
+@metrics.log_metrics
 def lambda_handler(event, context):
+    response = handle_event(event)
+    # API Gateway buffers responses anyway, so a streamed body is collected here
+    if not isinstance(response.get("body"), (str, type(None))):
+        response["body"] = "".join(response["body"])
+    return response
+
+
+def handle_event(event):
+    """Route one API Gateway/EventBridge-shaped event; shared by Lambda and ``server``."""
+    headers = {name.lower(): value for name, value in (event.get("headers") or {}).items()}
+    with maybe_profile("handle_event", headers) as report:
+        response = _route_event(event, headers)
+        # A profiled stream is produced here, inside the profile, rather than by the caller
+        if report and not isinstance(response.get("body"), (str, type(None))):
+            response["body"] = "".join(response["body"])
+        return response
+
+
+def _route_event(event, headers):
     try:
+        if event.get("action") == "drain_outbox":
+            from . import outbox
+            return {"statusCode": 200, "body": json.dumps({"message": outbox.dispatch()})}
+
+        if event.get("action") == "prefetch_subscriptions":
+            summary = run_prefetch()
+            emit("JourneyPlansPrefetched", summary["prefetched"])
+            return {"statusCode": 200, "body": json.dumps({"message": summary})}
+
+        if event.get("action") == "refresh_subscriptions":
+            summary = run_refresh()
+            emit("JourneyUpdatesSent", summary["sent"])
+            return {"statusCode": 200, "body": json.dumps({"message": summary})}
+
+        if event.get("source") == "aws.events":
+            summary = run_scheduled()
+            emit("JourneyEmailsSent", summary["sent"])
+            return {"statusCode": 200, "body": json.dumps({"message": summary})}
+
+        if event.get("httpMethod") == "POST" and (event.get("path") or "").endswith("/matrix"):
+            return _matrix_response(event.get("body"))
+
+        if event.get("httpMethod") == "POST":
+            return _batch_response(event.get("body"))
+
         params = event.get("queryStringParameters") or {}
+        if params.get("windowStart") or params.get("windowEnd"):
+            return _sweep_response(params)
+
+        if params.get("stream") == "true":
+            return _stream_response(params)
+
         origin = params.get("origin")
         destination = params.get("destination")
         arrive_by = params.get("arriveBy")
 
         if not origin or not destination or not arrive_by:
-            return {
-                "statusCode": 400,
-                "body": json.dumps({"error": "Missing origin, destination, or arriveBy"})
-            }
+            return _error(400, "Missing origin, destination, or arriveBy")
+        if not _valid_arrive_by(arrive_by):
+            return _error(400, "arriveBy must be yyyyMMddHHmmss")
+
+        return _journeys_response(origin, destination, arrive_by, headers)
 
-        result = start(origin, destination, arrive_by)
-        metrics.add_metric(name="JourneyEmailsSent", unit=MetricUnit.Count, value=1)
-        return {"statusCode": 200, "body": json.dumps({"message": result})}
+    except PlaceNotFound as e:
+        return _error(404, str(e))
+
+    except UpstreamUnavailable as e:
+        logger.warning("Upstream unavailable", extra={"service": e.service})
+        retry_after = max(1, round(e.retry_after or config.BREAKER_RESET_SECONDS))
+        return {
+            "statusCode": 503,
+            "headers": {"Retry-After": str(retry_after)},
+            "body": json.dumps({"error": str(e)}),
+        }
 
     except Exception as e:
         logger.exception("Error processing request")
         return {"statusCode": 500, "body": json.dumps({"error": str(e)})}
+
+    finally:
+        _record_caches()
@@ -0,0 +1,282 @@
+"""Append-only local history of planned itineraries, one fixed-width record per leg.
+
+Records go to monthly partitions (``legs-v1-YYYYMM.bin`` under HISTORY_DIR)
+as raw NumPy structured arrays: a plan is written with one ``write`` call
+under an exclusive ``flock``, and reads memory-map whole partitions, so
+scans over millions of legs are vectorized column operations. The analytics
+accept a list of per-partition memmaps and only copy the columns and rows
+they aggregate.
+
+    python -m journey_service.history report --dir /data/history
+"""
+import argparse
+import fcntl
+import glob
+import hashlib
+import os
+import threading
+from datetime import datetime, timezone
+
+from journey_service import config
+from .models import effective_time
+
+VERSION = "v1"
+# Leg selections (queries.LEG_FIELDS) carrying the scheduled and estimated
+# leg times and the route a record needs
+RECORDED_FIELDS = ("text", "expanded", "tracked")
+MODES = ("WALK", "BUS", "TRAM", "SUBWAY", "RAIL", "FERRY", "BICYCLE", "CAR", "OTHER")
+
+_history = None
+_history_loaded = False
+_history_lock = threading.Lock()
+
+
+def leg_dtype():
+    import numpy as np
+
+    return np.dtype([
+        ("recorded", "<i8"),         # epoch seconds the plan was fetched
+        ("trip", "<u8"),             # trip_id(origin, destination)
+        ("arrive_by", "<i8"),        # requested latest arrival, epoch seconds
+        ("itinerary", "<u2"),        # index within the plan
+        ("leg", "<u2"),              # index within the itinerary
+        ("mode", "u1"),              # index into MODES
+        ("realtime", "u1"),          # 1 when the router had realtime data for the leg
+        ("route", "S8"),             # line short name, when the selection carried it
+        ("utc_offset", "<i4"),       # seconds, for local-hour grouping
+        ("scheduled_start", "<i8"),
+        ("scheduled_end", "<i8"),
+        ("start", "<i8"),            # realtime estimate when known, else scheduled
+        ("end", "<i8"),
+        ("itinerary_start", "<i8"),
+        ("itinerary_end", "<i8"),
+        ("duration", "<f4"),
+    ])
+
+
+def trip_id(origin_coordinates, destination_coordinates):
+    """Stable 64-bit id of an origin/destination pair (at plan-cache precision)."""
+    points = [round(c, config.PLAN_CACHE_PRECISION) for c in (*origin_coordinates, *destination_coordinates)]
+    digest = hashlib.blake2b("{},{}>{},{}".format(*points).encode(), digest_size=8).digest()
+    return int.from_bytes(digest, "little")
+
+
+def _epoch(text):
+    return int(datetime.fromisoformat(text).timestamp())
+
+
+def plan_rows(plan, trip, arrive_by, recorded):
+    """Leg records of a ``query_journeys`` result as a structured array."""
+    import numpy as np
+
+    rows = []
+    for number, edge in enumerate((plan["data"]["planConnection"] or {}).get("edges", [])):
+        node = edge["node"]
+        started = datetime.fromisoformat(node["start"])
+        offset = int(started.utcoffset().total_seconds()) if started.utcoffset() else 0
+        itinerary_start, itinerary_end = _epoch(node["start"]), _epoch(node["end"])
+        for position, leg in enumerate(node["legs"]):
+            mode = leg["mode"] if leg["mode"] in MODES else "OTHER"
+            rows.append((
+                recorded, trip, arrive_by, number, position, MODES.index(mode),
+                leg.get("realtimeState") not in (None, "SCHEDULED"),
+                ((leg.get("route") or {}).get("shortName") or "").encode()[:8], offset,
+                _epoch(leg["start"]["scheduledTime"]), _epoch(leg["end"]["scheduledTime"]),
+                _epoch(effective_time(leg["start"])), _epoch(effective_time(leg["end"])),
+                itinerary_start, itinerary_end, leg["duration"],
+            ))
+    return np.array(rows, dtype=leg_dtype())
+
+
+class HistoryStore:
+    def __init__(self, directory):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def _partition(self, month):
+        return os.path.join(self.directory, f"legs-{VERSION}-{month}.bin")
+
+    def append(self, rows):
+        """Append records (one bulk write per partition they fall into)."""
+        if not len(rows):
+            return
+        import numpy as np
+
+        months = np.array([datetime.fromtimestamp(t, timezone.utc).strftime("%Y%m") for t in rows["recorded"]])
+        for month in np.unique(months):
+            data = rows[months == month].tobytes()
+            with open(self._partition(month), "ab") as f:
+                fcntl.flock(f, fcntl.LOCK_EX)
+                try:
+                    f.write(data)
+                    f.flush()
+                finally:
+                    fcntl.flock(f, fcntl.LOCK_UN)
+
+    def record(self, plan, origin_coordinates, destination_coordinates, arrive_by, recorded=None):
+        """Persist every leg of one plan; ``arrive_by`` is the requested datetime."""
+        recorded = int(datetime.now(timezone.utc).timestamp()) if recorded is None else int(recorded)
+        trip = trip_id(origin_coordinates, destination_coordinates)
+        self.append(plan_rows(plan, trip, int(arrive_by.timestamp()), recorded))
+
+    def partitions(self, since=None, until=None):
+        """Partition paths, optionally limited to months ``since``..``until`` (YYYYMM)."""
+        paths = sorted(glob.glob(os.path.join(self.directory, f"legs-{VERSION}-*.bin")))
+        months = [os.path.basename(p)[len(f"legs-{VERSION}-"):-4] for p in paths]
+        return [p for p, m in zip(paths, months) if (since is None or m >= since) and (until is None or m <= until)]
+
+    def partition_records(self, since=None, until=None):
+        """One memory-mapped array per selected month, nothing read yet."""
+        import numpy as np
+
+        dtype = leg_dtype()
+        arrays = []
+        for path in self.partitions(since, until):
+            # A torn trailing record (crash mid-write) is ignored
+            count = os.path.getsize(path) // dtype.itemsize
+            if count:
+                arrays.append(np.memmap(path, dtype=dtype, mode="r", shape=(count,)))
+        return arrays
+
+    def records(self, since=None, until=None):
+        """All records of the selected months as one array; a single partition stays memory-mapped.
+
+        Several partitions are copied into memory; prefer ``partition_records`` for long scans.
+        """
+        import numpy as np
+
+        arrays = self.partition_records(since, until)
+        if not arrays:
+            return np.empty(0, dtype=leg_dtype())
+        return arrays[0] if len(arrays) == 1 else np.concatenate(arrays)
+
+
+def get_history():
+    """Store under HISTORY_DIR, or None when history is not configured."""
+    global _history, _history_loaded
+    if not _history_loaded:
+        with _history_lock:
+            if not _history_loaded:
+                _history = HistoryStore(config.HISTORY_DIR) if config.HISTORY_DIR else None
+                _history_loaded = True
+    return _history
+
+
+def _grouped_percentiles(labels, hours, values, percentiles):
+    """Count and nearest-rank percentiles of ``values`` per distinct (label, hour).
+
+    Labels are integers (fixed-width strings viewed as integers); groups are
+    packed into one int64 key so a single lexsort orders rows by group and
+    by value within each group.
+    """
+    import numpy as np
+
+    names, label_index = np.unique(labels, return_inverse=True)
+    keys = label_index.reshape(-1).astype(np.int64) * 24 + hours
+    order = np.lexsort((values, keys))
+    keys, values = keys[order], values[order]
+    starts = np.flatnonzero(np.diff(keys, prepend=-1)) if len(keys) else np.zeros(0, np.intp)
+    counts = np.diff(np.append(starts, len(keys)))
+    result = {"count": counts}
+    for pct in percentiles:
+        rank = np.ceil(pct / 100 * counts).astype(np.intp) - 1
+        result[f"p{pct}"] = values[starts + np.clip(rank, 0, None)]
+    groups = keys[starts]
+    return names[groups // 24], groups % 24, result
+
+
+def _columns(records, keep, names):
+    """``names`` columns of the rows where ``keep(part)`` holds, as a dict of arrays.
+
+    ``records`` is one structured array or a list of them (``partition_records``);
+    each part is filtered on its own so only the selected values are copied.
+    """
+    import numpy as np
+
+    parts = records if isinstance(records, list) else [records]
+    masks = [keep(part) for part in parts]
+    dtype = leg_dtype()
+    return {
+        name: np.concatenate([np.asarray(part[name][mask]) for part, mask in zip(parts, masks)])
+        if parts else np.empty(0, dtype[name])
+        for name in names
+    }
+
+
+def _local_hour(records, column):
+    return ((records[column] + records["utc_offset"]) // 3600) % 24
+
+
+def duration_by_hour(records, percentiles=(50, 90)):
+    """Door-to-door itinerary duration (seconds) per trip and local departure hour."""
+    import numpy as np
+
+    itineraries = _columns(records, lambda part: part["leg"] == 0,
+                           ("trip", "itinerary_start", "itinerary_end", "utc_offset"))
+    trips, hours, stats = _grouped_percentiles(
+        itineraries["trip"],
+        _local_hour(itineraries, "itinerary_start"),
+        (itineraries["itinerary_end"] - itineraries["itinerary_start"]).astype(np.float64),
+        percentiles,
+    )
+    return dict(trip=trips, hour=hours, **stats)
+
+
+def delay_by_route(records, percentiles=(50, 90)):
+    """Departure delay (seconds) of transit legs per route and local scheduled hour."""
+    import numpy as np
+
+    legs = _columns(records, lambda part: (part["mode"] != MODES.index("WALK")) & (part["route"] != b""),
+                    ("route", "scheduled_start", "start", "utc_offset"))
+    # Big-endian so the integer order of route names is their byte order
+    routes, hours, stats = _grouped_percentiles(
+        np.ascontiguousarray(legs["route"]).view(">u8"),
+        _local_hour(legs, "scheduled_start"),
+        (legs["start"] - legs["scheduled_start"]).astype(np.float64),
+        percentiles,
+    )
+    return dict(route=routes.view("S8").astype(str), hour=hours, **stats)
+
+
+def leave_by(records, origin_coordinates, destination_coordinates, arrive_at, percentile=90):
+    """Latest HH:MM departure that arrived by ``arrive_at`` (HH:MM) in ``percentile``% of the
+    recorded itineraries departing in the two hours before it; None without history."""
+    import numpy as np
+
+    hour, minute = (int(part) for part in arrive_at.split(":"))
+    target = hour * 3600 + minute * 60
+    trip = trip_id(origin_coordinates, destination_coordinates)
+    itineraries = _columns(records, lambda part: (part["leg"] == 0) & (part["trip"] == trip),
+                           ("itinerary_start", "itinerary_end", "utc_offset"))
+    local_start = (itineraries["itinerary_start"] + itineraries["utc_offset"]) % 86400
+    durations = (itineraries["itinerary_end"] - itineraries["itinerary_start"])[
+        (local_start <= target) & (local_start >= target - 7200)
+    ]
+    if not len(durations):
+        return None
+    leave = target - int(np.percentile(durations, percentile, method="higher"))
+    return f"{leave // 3600 % 24:02d}:{leave // 60 % 60:02d}"
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Summarize recorded plan history.")
+    parser.add_argument("command", choices=["report"])
+    parser.add_argument("--dir", default=None, help="history directory (default HISTORY_DIR)")
+    parser.add_argument("--since", default=None, help="first month, YYYYMM")
+    parser.add_argument("--until", default=None, help="last month, YYYYMM")
+    args = parser.parse_args(argv)
+
+    records = HistoryStore(args.dir or config.HISTORY_DIR).partition_records(args.since, args.until)
+    print(f"{sum(len(part) for part in records)} legs")
+    durations = duration_by_hour(records)
+    for trip, hour, count, p50, p90 in zip(durations["trip"], durations["hour"], durations["count"],
+                                           durations["p50"], durations["p90"]):
+        print(f"trip {trip:016x} {hour:02d}h  n={count:<6} p50={p50 / 60:5.1f}min  p90={p90 / 60:5.1f}min")
+    delays = delay_by_route(records)
+    for route, hour, count, p50, p90 in zip(delays["route"], delays["hour"], delays["count"],
+                                            delays["p50"], delays["p90"]):
+        print(f"route {route:<8} {hour:02d}h  n={count:<6} delay p50={p50:5.0f}s  p90={p90:5.0f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,157 @@
+import threading
+import time
+
+from journey_service import config
+from .instrumentation import emit, metric_prefix, record_upstream
+from .resilience import AdaptiveLimiter, CircuitBreaker, TokenBucket, UpstreamUnavailable, backoff_delay, parse_retry_after
+
+# Shared across warm invocations so TLS connections are kept alive and reused;
+# one session (connection pool) per named pool, e.g. per regional router
+_sessions = {}
+_executor = None
+_lock = threading.Lock()
+
+# One quota and concurrency limit for the subscription key; a breaker per service
+_bucket = None
+_limiter = None
+_breakers = {}
+
+
+def get_session(pool=None):
+    session = _sessions.get(pool)
+    if session is None:
+        with _lock:
+            session = _sessions.get(pool)
+            if session is None:
+                # Imported here so cold starts only pay for requests once a call is made
+                import requests
+                from requests.adapters import HTTPAdapter
+
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=config.HTTP_POOL_SIZE, pool_maxsize=config.HTTP_POOL_SIZE)
+                session.mount("https://", adapter)
+                session.mount("http://", adapter)
+                _sessions[pool] = session
+    return session
+
+
+def get_executor():
+    global _executor
+    if _executor is None:
+        with _lock:
+            if _executor is None:
+                from concurrent.futures import ThreadPoolExecutor
+
+                _executor = ThreadPoolExecutor(max_workers=config.HTTP_MAX_WORKERS, thread_name_prefix="digitransit")
+    return _executor
+
+
+def get_bucket():
+    global _bucket
+    if _bucket is None:
+        with _lock:
+            if _bucket is None:
+                _bucket = TokenBucket(rate=config.HTTP_RATE_LIMIT, burst=config.HTTP_RATE_BURST)
+    return _bucket
+
+
+def get_limiter():
+    global _limiter
+    if _limiter is None:
+        with _lock:
+            if _limiter is None:
+                _limiter = AdaptiveLimiter(config.HTTP_POOL_SIZE, minimum=1, maximum=config.HTTP_POOL_SIZE)
+    return _limiter
+
+
+def get_breaker(service):
+    with _lock:
+        if service not in _breakers:
+            _breakers[service] = CircuitBreaker(config.BREAKER_THRESHOLD, config.BREAKER_RESET_SECONDS)
+        return _breakers[service]
+
+
+def _request(method, url, timeout, service, pool=None, **kwargs):
+    """Send with rate limiting, adaptive concurrency, retries and a circuit breaker.
+
+    429s, 5xx and connection errors are retried with jittered backoff (or the
+    server's Retry-After); when retries run out, or the breaker is open,
+    ``UpstreamUnavailable`` is raised. Other responses are returned as is.
+    """
+    import requests
+
+    breaker, bucket, limiter = get_breaker(service), get_bucket(), get_limiter()
+    prefix = metric_prefix(service)
+    reason, retry_after = None, None
+    for attempt in range(config.HTTP_RETRIES + 1):
+        if not breaker.allow():
+            emit(f"{prefix}CircuitOpen", 1)
+            raise UpstreamUnavailable(service, "circuit open", retry_after=breaker.retry_after())
+        if attempt:
+            delay = backoff_delay(attempt - 1, config.HTTP_BACKOFF_BASE, config.HTTP_BACKOFF_MAX)
+            if retry_after is not None:
+                if retry_after > config.HTTP_BACKOFF_MAX:
+                    break
+                delay = retry_after
+            emit(f"{prefix}Retries", 1)
+            time.sleep(delay)
+        if not bucket.acquire(config.HTTP_RATE_WAIT_MAX):
+            breaker.release()
+            emit(f"{prefix}RateLimited", 1)
+            raise UpstreamUnavailable(service, "request quota exhausted", retry_after=config.HTTP_RATE_WAIT_MAX)
+
+        try:
+            with limiter:
+                response = getattr(get_session(pool), method)(url, timeout=(config.HTTP_CONNECT_TIMEOUT, timeout), **kwargs)
+        except (requests.ConnectionError, requests.Timeout) as e:
+            breaker.record_failure()
+            reason, retry_after = type(e).__name__, None
+            continue
+        record_upstream(service, response)
+        bucket.observe(response.headers)
+
+        if response.status_code == 429:
+            # Throttling says nothing about the upstream's health
+            breaker.release()
+            limiter.on_throttle()
+            reason, retry_after = "HTTP 429", parse_retry_after(response.headers)
+            continue
+        if response.status_code >= 500:
+            breaker.record_failure()
+            reason, retry_after = f"HTTP {response.status_code}", None
+            continue
+        breaker.record_success()
+        limiter.on_success()
+        return response
+    raise UpstreamUnavailable(service, reason, retry_after=retry_after)
+
+
+def get(url, timeout=None, service="digitransit", pool=None, **kwargs):
+    """GET on the pooled session; ``timeout`` is the read timeout in seconds."""
+    return _request("get", url, timeout, service, pool, **kwargs)
+
+
+def post(url, timeout=None, service="digitransit", pool=None, **kwargs):
+    """POST on the pooled session (``pool`` names a separate one); ``timeout`` is the read timeout in seconds."""
+    return _request("post", url, timeout, service, pool, **kwargs)
+
+
+def run_concurrently(fn, args_list):
+    """Run ``fn(*args)`` for each args tuple on the shared pool, preserving order."""
+    futures = [get_executor().submit(fn, *args) for args in args_list]
+    return [future.result() for future in futures]
+
+
+def close():
+    """Drop pooled connections, worker threads and limiter state (tests, local shutdown)."""
+    global _executor, _bucket, _limiter
+    with _lock:
+        for session in _sessions.values():
+            session.close()
+        if _executor is not None:
+            _executor.shutdown(wait=False)
+        _sessions.clear()
+        _executor = None
+        _bucket = None
+        _limiter = None
+        _breakers.clear()
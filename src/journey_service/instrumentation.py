@@ -0,0 +1,78 @@
+import json
+import threading
+import time
+from contextlib import contextmanager
+
+from aws_lambda_powertools import Logger, Tracer, Metrics
+from aws_lambda_powertools.metrics import MetricUnit
+
+from journey_service import config
+
+logger = Logger()
+tracer = Tracer()
+metrics = Metrics(namespace="JourneyNotification", service="JourneyService")
+
+_sink_lock = threading.Lock()
+# Powertools flushes its buffer (iterating it) once 100 values are in, which
+# breaks if another thread adds at that moment: pool workers and server threads
+_metrics_lock = threading.Lock()
+_cache_snapshots = {}
+
+
+def emit(name, value, unit=MetricUnit.Count):
+    """Add a Powertools metric and mirror it to the local JSON sink if set.
+
+    Thread-safe; use it rather than ``metrics.add_metric`` off the main thread.
+    """
+    with _metrics_lock:
+        metrics.add_metric(name=name, unit=unit, value=value)
+    if config.METRICS_SINK_PATH:
+        record = {"ts": time.time(), "metric": name, "value": value, "unit": getattr(unit, "value", unit)}
+        with _sink_lock, open(config.METRICS_SINK_PATH, "a") as sink:
+            sink.write(json.dumps(record) + "\n")
+
+
+@contextmanager
+def stage(name):
+    """Time a pipeline stage as an X-Ray subsegment plus a ``<Name>Latency`` metric."""
+    started = time.perf_counter()
+    with tracer.provider.in_subsegment(f"## {name}") as subsegment:
+        try:
+            yield subsegment
+        finally:
+            elapsed_ms = (time.perf_counter() - started) * 1000
+            subsegment.put_annotation("stage", name)
+            subsegment.put_metadata("elapsed_ms", elapsed_ms)
+            emit(f"{name.capitalize()}Latency", elapsed_ms, MetricUnit.Milliseconds)
+
+
+def metric_prefix(service):
+    """CamelCase metric prefix of a service name: ``routing_hsl`` -> ``RoutingHsl``."""
+    return "".join(part.capitalize() for part in service.split("_"))
+
+
+def record_upstream(service, response):
+    """Status class and payload size of one upstream HTTP response."""
+    prefix = metric_prefix(service)
+    emit(f"{prefix}Status{response.status_code // 100}xx", 1)
+    emit(f"{prefix}ResponseBytes", len(response.content), MetricUnit.Bytes)
+
+
+def record_cache(name, cache):
+    """Hits, misses and hit rate since the previous call for this cache.
+
+    Cache counters are cumulative for the container's lifetime, so the
+    metrics are emitted as deltas to stay per-invocation.
+    """
+    previous_hits, previous_misses = _cache_snapshots.get(name, (0, 0))
+    hits, misses = cache.hits, cache.misses
+    if hits < previous_hits or misses < previous_misses:  # cache was cleared
+        previous_hits = previous_misses = 0
+    _cache_snapshots[name] = (hits, misses)
+    hits, misses = hits - previous_hits, misses - previous_misses
+    if hits + misses == 0:
+        return
+    prefix = name.capitalize()
+    emit(f"{prefix}CacheHits", hits)
+    emit(f"{prefix}CacheMisses", misses)
+    emit(f"{prefix}CacheHitRate", 100 * hits / (hits + misses), MetricUnit.Percent)
@@ -0,0 +1,104 @@
+import base64
+import io
+from datetime import datetime
+
+from .digitransit import get_coordinates_many, query_journeys_batch
+
+FIELDS = ("duration", "median_duration", "transfers", "walk")
+
+
+def itinerary_rows(plans):
+    """Flatten plans to (pair, duration, transfers, walk) rows, one per itinerary."""
+    rows = []
+    for pair, plan in enumerate(plans):
+        for edge in (plan["data"]["planConnection"] or {}).get("edges", []):
+            node = edge["node"]
+            duration = (datetime.fromisoformat(node["end"]) - datetime.fromisoformat(node["start"])).total_seconds()
+            rides = sum(leg["mode"] != "WALK" for leg in node["legs"])
+            walk = sum(leg["duration"] for leg in node["legs"] if leg["mode"] == "WALK")
+            rows.append((pair, duration, max(rides - 1, 0), walk))
+    return rows
+
+
+def aggregate(rows, shape):
+    """Per-pair matrices of the fastest itinerary plus the median duration.
+
+    Pairs without any itinerary are NaN. Rows are grouped by sorting on
+    (pair, duration), so the fastest itinerary of each pair is the first row
+    of its group and the median sits in the middle of it.
+    """
+    import numpy as np
+
+    size = shape[0] * shape[1]
+    result = {field: np.full(size, np.nan) for field in FIELDS}
+    if rows:
+        pair, duration, transfers, walk = np.array(rows, dtype=float).T
+        pair = pair.astype(np.intp)
+        order = np.lexsort((duration, pair))
+        pair, duration, transfers, walk = pair[order], duration[order], transfers[order], walk[order]
+
+        counts = np.bincount(pair, minlength=size)
+        present = np.flatnonzero(counts)
+        first = np.concatenate(([0], np.cumsum(counts)[:-1]))[present]
+        sizes = counts[present]
+        result["duration"][present] = duration[first]
+        result["transfers"][present] = transfers[first]
+        result["walk"][present] = walk[first]
+        result["median_duration"][present] = (duration[first + (sizes - 1) // 2] + duration[first + sizes // 2]) / 2
+    return {field: values.reshape(shape) for field, values in result.items()}
+
+
+def summarize(durations):
+    """Min and median of the fastest durations per origin (rows) and destination (columns)."""
+    import warnings
+
+    import numpy as np
+
+    with warnings.catch_warnings():
+        # All-NaN rows (unreachable origins) legitimately summarize to NaN
+        warnings.simplefilter("ignore", RuntimeWarning)
+        return {
+            "by_origin": {"min": np.nanmin(durations, axis=1), "median": np.nanmedian(durations, axis=1)},
+            "by_destination": {"min": np.nanmin(durations, axis=0), "median": np.nanmedian(durations, axis=0)},
+        }
+
+
+def travel_time_matrix(origins, destinations, arrive_by, timeout=None):
+    """Fastest travel time (seconds), transfers and walking for every origin x destination.
+
+    Each distinct place is geocoded once and all pairs are planned through
+    ``query_journeys_batch`` (aliased, chunked, concurrent, plan cached).
+    """
+    coordinates = get_coordinates_many(list(origins) + list(destinations), timeout)
+    trips = [(coordinates[o], coordinates[d], arrive_by) for o in origins for d in destinations]
+    plans = query_journeys_batch(trips, timeout, fields="matrix")
+    matrices = aggregate(itinerary_rows(plans), (len(origins), len(destinations)))
+    matrices["summary"] = summarize(matrices["duration"])
+    return matrices
+
+
+def to_json(matrices, origins, destinations, arrive_by):
+    """JSON-ready dict with whole seconds and null for unreachable pairs."""
+    import numpy as np
+
+    def plain(values):
+        return np.where(np.isnan(values), None, np.round(values)).tolist()
+
+    body = {"origins": list(origins), "destinations": list(destinations), "arriveBy": arrive_by}
+    body.update({field: plain(matrices[field]) for field in FIELDS})
+    body["summary"] = {axis: {stat: plain(values) for stat, values in stats.items()}
+                       for axis, stats in matrices["summary"].items()}
+    return body
+
+
+def to_npz(matrices, origins, destinations):
+    """Base64 of a compressed ``.npz`` holding every matrix plus the labels."""
+    import numpy as np
+
+    arrays = {field: matrices[field].astype(np.float32) for field in FIELDS}
+    for axis, stats in matrices["summary"].items():
+        for stat, values in stats.items():
+            arrays[f"{axis}_{stat}"] = values.astype(np.float32)
+    buffer = io.BytesIO()
+    np.savez_compressed(buffer, origins=np.array(origins), destinations=np.array(destinations), **arrays)
+    return base64.b64encode(buffer.getvalue()).decode()
@@ -0,0 +1,86 @@
+from datetime import datetime
+
+
+def effective_time(place):
+    """Realtime estimate of a leg's start/end when known, else the scheduled time."""
+    return (place.get("estimated") or {}).get("time") or place["scheduledTime"]
+
+
+def delay_seconds(place):
+    """Seconds the estimate is behind schedule (negative when early); 0 without one."""
+    return int((datetime.fromisoformat(effective_time(place))
+                - datetime.fromisoformat(place["scheduledTime"])).total_seconds())
+
+
+class Leg:
+    """One leg of an itinerary; timestamps are parsed once on construction."""
+
+    __slots__ = ("from_name", "to_name", "start", "end", "mode", "duration", "realtime_state", "route")
+
+    def __init__(self, from_name, to_name, start, end, mode, duration, realtime_state=None, route=None):
+        self.from_name = from_name
+        self.to_name = to_name
+        self.start = start
+        self.end = end
+        self.mode = mode
+        self.duration = duration
+        self.realtime_state = realtime_state
+        self.route = route
+
+    @classmethod
+    def from_dict(cls, leg):
+        return cls(
+            leg["from"]["name"],
+            leg["to"]["name"],
+            datetime.fromisoformat(effective_time(leg["start"])),
+            datetime.fromisoformat(effective_time(leg["end"])),
+            leg["mode"],
+            leg["duration"],
+            leg.get("realtimeState"),
+            (leg.get("route") or {}).get("shortName"),
+        )
+
+    def to_dict(self):
+        leg = {
+            "from": self.from_name,
+            "to": self.to_name,
+            "start": self.start.isoformat(),
+            "end": self.end.isoformat(),
+            "mode": self.mode,
+            "duration": self.duration,
+            "realtimeState": self.realtime_state,
+        }
+        # Only plans fetched with the expanded selection carry route names
+        if self.route is not None:
+            leg["route"] = self.route
+        return leg
+
+
+class Itinerary:
+    __slots__ = ("start", "end", "legs")
+
+    def __init__(self, start, end, legs):
+        self.start = start
+        self.end = end
+        self.legs = legs
+
+    @classmethod
+    def from_node(cls, node, start=None):
+        return cls(
+            start or datetime.fromisoformat(node["start"]),
+            datetime.fromisoformat(node["end"]) if node.get("end") else None,
+            [Leg.from_dict(leg) for leg in node["legs"]],
+        )
+
+    @property
+    def duration(self):
+        """Total in-leg time in seconds (waiting between legs excluded)."""
+        return sum(leg.duration for leg in self.legs)
+
+    def to_dict(self):
+        return {
+            "start": self.start.isoformat(),
+            "end": self.end.isoformat() if self.end else None,
+            "duration": self.duration,
+            "legs": [leg.to_dict() for leg in self.legs],
+        }
@@ -1,17 +1,40 @@
-import smtplib
-from email.mime.text import MIMEText
 from journey_service import config
 
+# smtplib and email.mime are imported inside the functions that use them so
+# requests that never send mail do not pay for them at cold start
+
+
+def build_message(body_text, to=None, subject="Journey Details"):
+    from email.mime.text import MIMEText
+
+    msg = MIMEText("\n".join(body_text) if not isinstance(body_text, str) else body_text)
+    msg["From"] = config.FROM_EMAIL
+    msg["To"] = to or config.TO_EMAIL
+    msg["Subject"] = subject
+    return msg
+
+
+def open_smtp():
+    """Connected (and, unless SMTP_USE_TLS is off, authenticated) SMTP session."""
+    import smtplib
+
+    server = smtplib.SMTP(config.SMTP_HOST, config.SMTP_PORT, timeout=config.SMTP_TIMEOUT)
+    if config.SMTP_USE_TLS:
+        server.starttls()
+        server.login(config.FROM_EMAIL, config.GMAIL_APP_PASSWORD)
+    return server
+
+
 def send_email(body_text):
+    import smtplib
+
     try:
-        msg = MIMEText("\n".join(body_text))
-        msg["From"] = config.FROM_EMAIL
-        msg["To"] = config.TO_EMAIL
-        msg["Subject"] = "Journey Details"
-
-        with smtplib.SMTP("smtp.gmail.com", 587) as server:
-            server.starttls()
-            server.login(config.FROM_EMAIL, config.GMAIL_APP_PASSWORD)
+        msg = build_message(body_text)
+
+        with smtplib.SMTP(config.SMTP_HOST, config.SMTP_PORT, timeout=config.SMTP_TIMEOUT) as server:
+            if config.SMTP_USE_TLS:
+                server.starttls()
+                server.login(config.FROM_EMAIL, config.GMAIL_APP_PASSWORD)
             server.send_message(msg)
 
         return "Email Sent"
@@ -20,3 +43,41 @@ def send_email(body_text):
         print(f"Email failed: {e}")
         return "Email Failed"
 
+
+def send_emails(messages):
+    """Send many (to, body_text, subject) messages over one SMTP session.
+
+    Returns one status per message, in order.
+    """
+    if not messages:
+        return []
+    try:
+        server = open_smtp()
+    except Exception as e:
+        print(f"Email failed: {e}")
+        return ["Email Failed"] * len(messages)
+
+    statuses = []
+    with server:
+        for to, body_text, subject in messages:
+            try:
+                server.send_message(build_message(body_text, to=to, subject=subject))
+                statuses.append("Email Sent")
+            except Exception as e:
+                print(f"Email to {to} failed: {e}")
+                statuses.append("Email Failed")
+    return statuses
+
+
+def queue_email(body_text, to=None, subject="Journey Details"):
+    """Hand the message to the outbox and return without touching SMTP."""
+    from journey_service import outbox
+
+    try:
+        outbox.enqueue(body_text, to=to, subject=subject)
+        outbox.dispatch_in_background()
+        return "Email Queued"
+
+    except Exception as e:
+        print(f"Email queueing failed: {e}")
+        return "Email Failed"
@@ -0,0 +1,150 @@
+import random
+import threading
+import time
+
+from journey_service import config, notifier
+
+
+class Outbox:
+    """Durable SQLite-backed email queue drained in batches with retry/backoff.
+
+    Dispatchers claim due rows with a short lease before sending, so two
+    dispatchers (threads or processes) sharing the file never send the same
+    message twice while one of them is still working on it.
+    """
+
+    def __init__(self, path, clock=time.time):
+        import sqlite3
+
+        self.clock = clock
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=10)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS outbox ("
+            "id INTEGER PRIMARY KEY AUTOINCREMENT, recipient TEXT NOT NULL, subject TEXT NOT NULL, "
+            "body TEXT NOT NULL, status TEXT NOT NULL DEFAULT 'pending', attempts INTEGER NOT NULL DEFAULT 0, "
+            "next_attempt_at REAL NOT NULL, last_error TEXT, created_at REAL NOT NULL)"
+        )
+
+    def enqueue(self, body, recipient, subject):
+        now = self.clock()
+        with self._lock:
+            cursor = self._conn.execute(
+                "INSERT INTO outbox (recipient, subject, body, next_attempt_at, created_at) VALUES (?, ?, ?, ?, ?)",
+                (recipient, subject, body, now, now),
+            )
+            return cursor.lastrowid
+
+    def claim(self, limit, lease=None):
+        now = self.clock()
+        lease = config.OUTBOX_LEASE_SECONDS if lease is None else lease
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                rows = self._conn.execute(
+                    "SELECT id, recipient, subject, body, attempts FROM outbox "
+                    "WHERE status = 'pending' AND next_attempt_at <= ? ORDER BY id LIMIT ?",
+                    (now, limit),
+                ).fetchall()
+                self._conn.executemany(
+                    "UPDATE outbox SET next_attempt_at = ? WHERE id = ?", [(now + lease, row[0]) for row in rows]
+                )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        return rows
+
+    def mark_sent(self, message_id):
+        with self._lock:
+            self._conn.execute("UPDATE outbox SET status = 'sent', last_error = NULL WHERE id = ?", (message_id,))
+
+    def mark_failed(self, message_id, attempts, error, max_attempts, backoff, backoff_max):
+        attempts += 1
+        delay = min(backoff_max, backoff * 2 ** (attempts - 1)) * random.uniform(0.5, 1.0)
+        status = "dead" if attempts >= max_attempts else "pending"
+        with self._lock:
+            self._conn.execute(
+                "UPDATE outbox SET status = ?, attempts = ?, next_attempt_at = ?, last_error = ? WHERE id = ?",
+                (status, attempts, self.clock() + delay, str(error), message_id),
+            )
+
+    def counts(self):
+        with self._lock:
+            rows = self._conn.execute("SELECT status, COUNT(*) FROM outbox GROUP BY status").fetchall()
+        return dict(rows)
+
+    def dispatch(self, batch_size=None, max_attempts=None, backoff=None, backoff_max=None, smtp_factory=None):
+        """Send due messages over one SMTP session per batch until none are due."""
+        batch_size = batch_size or config.OUTBOX_BATCH_SIZE
+        max_attempts = max_attempts or config.OUTBOX_MAX_ATTEMPTS
+        backoff = config.OUTBOX_BACKOFF_SECONDS if backoff is None else backoff
+        backoff_max = config.OUTBOX_BACKOFF_MAX_SECONDS if backoff_max is None else backoff_max
+        smtp_factory = smtp_factory or notifier.open_smtp
+        sent = failed = 0
+        while True:
+            rows = self.claim(batch_size)
+            if not rows:
+                return {"sent": sent, "failed": failed}
+            try:
+                server = smtp_factory()
+            except Exception as e:
+                for message_id, _, _, _, attempts in rows:
+                    self.mark_failed(message_id, attempts, e, max_attempts, backoff, backoff_max)
+                return {"sent": sent, "failed": failed + len(rows)}
+
+            with server:
+                for message_id, recipient, subject, body, attempts in rows:
+                    try:
+                        server.send_message(notifier.build_message(body, to=recipient, subject=subject))
+                        self.mark_sent(message_id)
+                        sent += 1
+                    except Exception as e:
+                        self.mark_failed(message_id, attempts, e, max_attempts, backoff, backoff_max)
+                        failed += 1
+
+
+_outbox = None
+_outbox_lock = threading.Lock()
+_dispatcher = None
+
+
+def get_outbox():
+    global _outbox
+    if _outbox is None:
+        with _outbox_lock:
+            if _outbox is None:
+                _outbox = Outbox(config.OUTBOX_PATH)
+    return _outbox
+
+
+def enqueue(body_text, to=None, subject="Journey Details"):
+    body = "\n".join(body_text) if not isinstance(body_text, str) else body_text
+    return get_outbox().enqueue(body, to or config.TO_EMAIL, subject)
+
+
+def dispatch():
+    return get_outbox().dispatch()
+
+
+def dispatch_in_background():
+    """Drain the outbox on a daemon thread unless one is already running.
+
+    In Lambda the thread is frozen with the container after the response is
+    returned and resumes on the next warm invocation; anything left over is
+    picked up by the next dispatch (or a ``{"action": "drain_outbox"}`` event).
+    """
+    global _dispatcher
+    with _outbox_lock:
+        if _dispatcher is not None and _dispatcher.is_alive():
+            return _dispatcher
+        _dispatcher = threading.Thread(target=_dispatch_quietly, name="outbox-dispatcher", daemon=True)
+        _dispatcher.start()
+        return _dispatcher
+
+
+def _dispatch_quietly():
+    try:
+        dispatch()
+    except Exception as e:
+        print(f"Outbox dispatch failed: {e}")
@@ -0,0 +1,222 @@
+"""In-process place name index built from GTFS stops and an optional gazetteer."""
+import array
+import bisect
+import csv
+import io
+import math
+import os
+import re
+import threading
+import unicodedata
+import zipfile
+
+from journey_service import config
+from .gtfs import is_fresh, writable_path
+from .instrumentation import logger
+
+MAGIC = b"RPPI0001"
+
+_place_index = None
+_place_index_loaded = False
+_place_index_lock = threading.Lock()
+
+
+def normalize_place(name):
+    """Fold a place name for lookup.
+
+    Case and accents are dropped (ä -> a, ö -> o, å -> a), the HSL metro
+    suffix "(M)" is removed and punctuation becomes whitespace, so
+    "Kamppi (M)", "kamppi" and "KAMPPI" share a key.
+    """
+    name = re.sub(r"\(\s*m\s*\)", " ", name.casefold())
+    name = unicodedata.normalize("NFKD", name)
+    name = "".join(c for c in name if not unicodedata.combining(c))
+    return " ".join(re.sub(r"[^\w]+", " ", name).split())
+
+
+class PlaceIndex:
+    """Sorted normalized names with parallel coordinate arrays.
+
+    Exact and prefix lookups are binary searches over the sorted keys,
+    which gives trie-style prefix matching without per-node objects.
+    Names shared by places far apart are kept with NaN coordinates, so
+    they are recognized as ambiguous and left to the remote geocoder.
+    """
+
+    def __init__(self, keys, lats, lons):
+        self.keys = keys
+        self.lats = lats
+        self.lons = lons
+
+    def __len__(self):
+        return len(self.keys)
+
+    @classmethod
+    def from_places(cls, places, radius=None):
+        """Build from (name, lat, lon).
+
+        Places sharing a key within ``radius`` metres (platforms of one stop)
+        are averaged; a key used by places further apart becomes ambiguous.
+        """
+        radius = config.PLACE_MERGE_RADIUS if radius is None else radius
+        grouped = {}
+        for name, lat, lon in places:
+            key = normalize_place(name)
+            if not key:
+                continue
+            clusters = grouped.setdefault(key, [])
+            for total in clusters:
+                if _distance(total[0] / total[2], total[1] / total[2], lat, lon) <= radius:
+                    total[0] += lat
+                    total[1] += lon
+                    total[2] += 1
+                    break
+            else:
+                clusters.append([lat, lon, 1])
+        keys = sorted(grouped)
+        centroids = [
+            (c[0][0] / c[0][2], c[0][1] / c[0][2]) if len(c) == 1 else (math.nan, math.nan)
+            for c in (grouped[k] for k in keys)
+        ]
+        lats = array.array("d", (lat for lat, _ in centroids))
+        lons = array.array("d", (lon for _, lon in centroids))
+        return cls(keys, lats, lons)
+
+    @classmethod
+    def from_sources(cls, gtfs_path=None, gazetteer_path=None):
+        places = []
+        if gtfs_path and os.path.exists(gtfs_path):
+            with zipfile.ZipFile(gtfs_path) as feed, feed.open("stops.txt") as f:
+                for row in csv.DictReader(io.TextIOWrapper(f, "utf-8-sig")):
+                    places.append((row["stop_name"], float(row["stop_lat"]), float(row["stop_lon"])))
+        index = cls.from_places(places)
+        if gazetteer_path and os.path.exists(gazetteer_path):
+            # Gazetteer entries (name,lat,lon) override stop names with the same key
+            with open(gazetteer_path, encoding="utf-8-sig") as f:
+                gazetteer = cls.from_places(
+                    (row["name"], float(row["lat"]), float(row["lon"])) for row in csv.DictReader(f)
+                )
+            merged = dict(zip(index.keys, zip(index.lats, index.lons)))
+            merged.update(zip(gazetteer.keys, zip(gazetteer.lats, gazetteer.lons)))
+            index = cls.from_places((key, lat, lon) for key, (lat, lon) in merged.items())
+        return index
+
+    def _coordinates(self, i):
+        return [self.lons[i], self.lats[i]]
+
+    def _position(self, key):
+        i = bisect.bisect_left(self.keys, key)
+        return i if i < len(self.keys) and self.keys[i] == key else None
+
+    def exact(self, key):
+        """Coordinates of a key; None when unknown or ambiguous."""
+        i = self._position(key)
+        if i is None or math.isnan(self.lats[i]):
+            return None
+        return self._coordinates(i)
+
+    def prefix(self, key):
+        """Keys starting with ``key``, in sorted order."""
+        start = bisect.bisect_left(self.keys, key)
+        end = bisect.bisect_left(self.keys, key + "\uffff", lo=start)
+        return self.keys[start:end]
+
+    def lookup(self, text, cutoff=None):
+        """[lon, lat] for a place name, or None when nothing matches confidently.
+
+        Tries an exact match, then a prefix matching exactly one name, then
+        the closest name by ``difflib`` ratio above ``cutoff``. Ambiguous
+        names and texts with digits (street addresses, which would land on
+        a stop named after the street) are not guessed at.
+        """
+        key = normalize_place(text)
+        if not key:
+            return None
+        if self._position(key) is not None:
+            return self.exact(key)
+        candidates = self.prefix(key)
+        if len(candidates) == 1:
+            return self.exact(candidates[0])
+        if any(c.isdigit() for c in key):
+            return None
+
+        import difflib
+
+        cutoff = config.PLACE_FUZZY_CUTOFF if cutoff is None else cutoff
+        close = difflib.get_close_matches(key, self.keys, n=1, cutoff=cutoff)
+        return self.exact(close[0]) if close else None
+
+    def save(self, path):
+        """Magic, count, newline-joined keys, then the lat and lon arrays."""
+        keys = "\n".join(self.keys).encode()
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(MAGIC)
+            f.write(len(self.keys).to_bytes(8, "little"))
+            f.write(len(keys).to_bytes(8, "little"))
+            f.write(keys)
+            f.write(self.lats.tobytes())
+            f.write(self.lons.tobytes())
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        with open(path, "rb") as f:
+            data = f.read()
+        if data[:8] != MAGIC:
+            raise ValueError(f"{path} is not a place index")
+        count = int.from_bytes(data[8:16], "little")
+        keys_length = int.from_bytes(data[16:24], "little")
+        keys = data[24:24 + keys_length].decode().split("\n") if count else []
+        lats, lons = array.array("d"), array.array("d")
+        start = 24 + keys_length
+        lats.frombytes(data[start:start + 8 * count])
+        lons.frombytes(data[start + 8 * count:start + 16 * count])
+        return cls(keys, lats, lons)
+
+
+def _distance(lat1, lon1, lat2, lon2):
+    """Equirectangular distance in metres; plenty for telling platforms from towns."""
+    x = math.radians(lon2 - lon1) * math.cos(math.radians((lat1 + lat2) / 2))
+    return 6371000 * math.hypot(x, math.radians(lat2 - lat1))
+
+
+def load_place_index(gtfs_path=None, gazetteer_path=None, index_path=None):
+    """Precomputed index at ``index_path``, rebuilt when a source file is newer.
+
+    Returns None when there is neither a built index nor a source to build one.
+    A rebuilt index that cannot be saved is still returned.
+    """
+    sources = [p for p in (gtfs_path, gazetteer_path) if p and os.path.exists(p)]
+    index_path = index_path or (writable_path(f"{sources[0]}.places", sources) if sources else None)
+    if index_path is None:
+        return None
+    if is_fresh(index_path, sources):
+        return PlaceIndex.load(index_path)
+    if not sources:
+        return None
+    index = PlaceIndex.from_sources(gtfs_path, gazetteer_path)
+    try:
+        index.save(index_path)
+    except OSError as e:
+        logger.warning("Place index not saved", extra={"path": index_path, "error": str(e)})
+    return index
+
+
+def get_place_index():
+    """Container-wide index, or None when disabled or unavailable."""
+    global _place_index, _place_index_loaded
+    if not _place_index_loaded:
+        with _place_index_lock:
+            if not _place_index_loaded:
+                try:
+                    if config.PLACE_INDEX_ENABLED:
+                        _place_index = load_place_index(
+                            config.GTFS_PATH, config.GAZETTEER_PATH, config.PLACE_INDEX_PATH
+                        )
+                except (OSError, ValueError, KeyError, zipfile.BadZipFile) as e:
+                    # Geocoding falls back to Digitransit rather than failing every request
+                    logger.warning("Place index unavailable", extra={"error": str(e)})
+                finally:
+                    _place_index_loaded = True
+    return _place_index
@@ -0,0 +1,180 @@
+"""Opt-in CPU and allocation profiling of single invocations.
+
+An invocation is profiled when PROFILE_ENABLED is set and it falls in the
+PROFILE_SAMPLE_RATE sample, or when it carries an ``X-Profile`` header equal
+to PROFILE_TOKEN (no token, no header-triggered profiling). It then runs
+under cProfile and tracemalloc; the pstats file and the allocation snapshot
+go to PROFILE_DIR (oldest pruned beyond PROFILE_KEEP) and the top functions
+and allocation sites are logged as one structured record.
+
+    python -m journey_service.profiling show /tmp/profiles/handle_event-....pstats
+
+Both profilers are process-wide, so one invocation is profiled at a time;
+overlapping ones (server threads) run unprofiled. cProfile only sees the
+thread that enabled it: work handed to the ``http_client`` pool (geocoding
+pairs, batch chunks, sweep workers) shows up as time waiting on futures, not
+as its own functions. tracemalloc does cover every thread.
+"""
+import argparse
+import glob
+import hmac
+import itertools
+import os
+import random
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+from journey_service import config
+from .instrumentation import emit, logger
+
+HEADER = "x-profile"
+
+_active = threading.Lock()
+_counter = itertools.count()
+
+
+def wanted(headers=None):
+    """Whether to profile an invocation with these (lower-cased) request headers."""
+    token = (headers or {}).get(HEADER)
+    if token and config.PROFILE_TOKEN and hmac.compare_digest(token, config.PROFILE_TOKEN):
+        return True
+    return config.PROFILE_ENABLED and random.random() < config.PROFILE_SAMPLE_RATE
+
+
+def _short_path(filename):
+    site, package = "site-packages" + os.sep, os.sep + "journey_service" + os.sep
+    if site in filename:
+        return filename.split(site, 1)[1]
+    if package in filename:
+        return package[1:] + filename.split(package, 1)[1]
+    return filename
+
+
+def top_functions(stats, limit=None):
+    """Functions with the most own (exclusive) time from a ``pstats.Stats``."""
+    rows = sorted(stats.stats.items(), key=lambda item: item[1][2], reverse=True)[:limit or config.PROFILE_TOP]
+    return [
+        {
+            "function": f"{_short_path(filename)}:{line}({name})",
+            "calls": calls,
+            "own_ms": round(own * 1000, 3),
+            "cumulative_ms": round(cumulative * 1000, 3),
+        }
+        for (filename, line, name), (_, calls, own, cumulative, _) in rows
+    ]
+
+
+def top_allocations(snapshot, limit=None):
+    """Source lines holding the most traced memory in a tracemalloc snapshot."""
+    import tracemalloc
+
+    snapshot = snapshot.filter_traces((
+        tracemalloc.Filter(False, tracemalloc.__file__),
+        tracemalloc.Filter(False, "<frozen importlib._bootstrap*>"),
+    ))
+    return [
+        {"site": f"{_short_path(stat.traceback[0].filename)}:{stat.traceback[0].lineno}",
+         "kib": round(stat.size / 1024, 1), "count": stat.count}
+        for stat in snapshot.statistics("lineno")[:limit or config.PROFILE_TOP]
+    ]
+
+
+def _prune(directory):
+    paths = sorted(glob.glob(os.path.join(directory, "*.pstats")), key=os.path.getmtime)
+    for path in paths[:max(0, len(paths) - config.PROFILE_KEEP)]:
+        for stale in (path, path[:-len(".pstats")] + ".tracemalloc"):
+            try:
+                os.remove(stale)
+            except FileNotFoundError:
+                pass
+
+
+def _write(name, profiler, snapshot, elapsed, peak):
+    directory = config.PROFILE_DIR
+    os.makedirs(directory, exist_ok=True)
+    stamp = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%S")
+    base = os.path.join(directory, f"{name}-{stamp}-{os.getpid()}-{next(_counter)}")
+    import pstats
+
+    stats = pstats.Stats(profiler)
+    stats.dump_stats(base + ".pstats")
+    snapshot.dump(base + ".tracemalloc")
+    _prune(directory)
+    return {
+        "name": name,
+        "elapsed_ms": round(elapsed * 1000, 3),
+        "peak_kib": round(peak / 1024, 1),
+        "pstats": base + ".pstats",
+        "tracemalloc": base + ".tracemalloc",
+        "functions": top_functions(stats),
+        "allocations": top_allocations(snapshot),
+    }
+
+
+@contextmanager
+def maybe_profile(name, headers=None):
+    """Profile the body when ``wanted(headers)``; yields the report dict.
+
+    The report is empty when the body runs unprofiled; otherwise it holds the
+    name right away and the results on exit.
+    """
+    report = {}
+    if not wanted(headers) or not _active.acquire(blocking=False):
+        yield report
+        return
+    report["name"] = name
+    import cProfile
+    import tracemalloc
+
+    started_tracing = not tracemalloc.is_tracing()
+    if started_tracing:
+        tracemalloc.start(config.PROFILE_TRACEMALLOC_FRAMES)
+    else:
+        tracemalloc.reset_peak()
+    profiler = cProfile.Profile()
+    started = time.perf_counter()
+    try:
+        profiler.enable()
+        try:
+            yield report
+        finally:
+            profiler.disable()
+            elapsed = time.perf_counter() - started
+            snapshot = tracemalloc.take_snapshot()
+            peak = tracemalloc.get_traced_memory()[1]
+            if started_tracing:
+                tracemalloc.stop()
+            try:
+                report.update(_write(name, profiler, snapshot, elapsed, peak))
+            except OSError as e:
+                logger.warning("Profile not written", extra={"error": str(e)})
+            else:
+                emit("ProfilesCaptured", 1)
+                logger.info("Invocation profile", extra={"profile": report})
+    finally:
+        _active.release()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Summarize a captured profile.")
+    parser.add_argument("command", choices=["show"])
+    parser.add_argument("path", help=".pstats or .tracemalloc file")
+    parser.add_argument("--top", type=int, default=25)
+    args = parser.parse_args(argv)
+
+    if args.path.endswith(".tracemalloc"):
+        import tracemalloc
+
+        for row in top_allocations(tracemalloc.Snapshot.load(args.path), args.top):
+            print(f"{row['kib']:>10.1f} KiB {row['count']:>8}  {row['site']}")
+        return
+    import pstats
+
+    for row in top_functions(pstats.Stats(args.path), args.top):
+        print(f"{row['own_ms']:>10.3f} ms {row['cumulative_ms']:>10.3f} ms {row['calls']:>8}  {row['function']}")
+
+
+if __name__ == "__main__":
+    main()
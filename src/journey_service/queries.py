@@ -0,0 +1,128 @@
+"""planConnection GraphQL documents, built once and sent with variables.
+
+Each output format asks only for the leg fields it reads:
+
+- ``matrix``: durations and modes for travel-time aggregation
+- ``text``: what ``filter_journeys`` renders (the default)
+- ``expanded``: adds distances for JSON output
+- ``tracked``: adds trip and stop ids so a plan can later be refreshed
+  trip by trip (see ``realtime``)
+
+The three carry realtime estimates and route names, which ``history``
+records.
+"""
+import hashlib
+from functools import lru_cache
+
+LEG_FIELDS = {
+    "matrix": "mode duration realtimeState",
+    "text": (
+        "from { name } to { name } start { scheduledTime estimated { time } } end { scheduledTime estimated { time } } "
+        "mode duration realtimeState route { shortName }"
+    ),
+    "expanded": (
+        "from { name } to { name } start { scheduledTime estimated { time } } end { scheduledTime estimated { time } } "
+        "mode duration realtimeState distance route { shortName }"
+    ),
+    "tracked": (
+        "from { name stop { gtfsId } } to { name stop { gtfsId } } "
+        "start { scheduledTime estimated { time } } end { scheduledTime estimated { time } } "
+        "mode duration realtimeState serviceDate trip { gtfsId } route { shortName }"
+    ),
+}
+
+VARIABLE_TYPES = "${o}: PlanLabeledLocationInput!, ${d}: PlanLabeledLocationInput!, ${t}: PlanDateTimeInput!"
+PLAN_FIELD = "planConnection(origin: ${o}, destination: ${d}, dateTime: ${t}) {{ {selection} }}"
+
+
+def selection(fields):
+    return "edges { node { start end legs { " + LEG_FIELDS[fields] + " } } }"
+
+
+def _document(name, count, fields):
+    if count is None:
+        names = [("origin", "destination", "dateTime")]
+        lines = [PLAN_FIELD.format(o="origin", d="destination", t="dateTime", selection=selection(fields))]
+    else:
+        names = [(f"o{i}", f"d{i}", f"t{i}") for i in range(count)]
+        lines = [f"p{i}: " + PLAN_FIELD.format(o=o, d=d, t=t, selection=selection(fields))
+                 for i, (o, d, t) in enumerate(names)]
+    variables = ", ".join(VARIABLE_TYPES.format(o=o, d=d, t=t) for o, d, t in names)
+    return f"query {name}({variables}) {{\n" + "\n".join(lines) + "\n}"
+
+
+# Single-trip documents for every field selection, compiled at import
+PLAN_QUERIES = {fields: _document("Plan", None, fields) for fields in LEG_FIELDS}
+
+PAGE_QUERY = (
+    "query PlanPage($origin: PlanLabeledLocationInput!, $destination: PlanLabeledLocationInput!, "
+    "$dateTime: PlanDateTimeInput!, $first: Int, $after: String) {{\n"
+    "planConnection(origin: $origin, destination: $destination, dateTime: $dateTime, first: $first, after: $after) "
+    "{{ pageInfo {{ hasNextPage endCursor }} {selection} }}\n}}"
+)
+# Cursor-paginated variants, for retrieving itineraries page by page
+PAGE_QUERIES = {fields: PAGE_QUERY.format(selection=selection(fields)) for fields in LEG_FIELDS}
+
+
+@lru_cache(maxsize=64)
+def batch_query(count, fields="text"):
+    """Document planning ``count`` trips as aliases ``p0``..``p{count-1}``."""
+    return _document("PlanBatch", count, fields)
+
+
+TRIP_TIMES_FIELD = (
+    "t{i}: trip(id: $id{i}) {{ stoptimesForDate(serviceDate: $date{i}) {{ stop {{ gtfsId }} "
+    "scheduledArrival realtimeArrival scheduledDeparture realtimeDeparture realtimeState serviceDay }} }}"
+)
+
+
+@lru_cache(maxsize=64)
+def trip_times_query(count):
+    """Document fetching today's stop times of ``count`` trips as aliases ``t0``..."""
+    variables = ", ".join(f"$id{i}: String!, $date{i}: String!" for i in range(count))
+    lines = [TRIP_TIMES_FIELD.format(i=i) for i in range(count)]
+    return f"query TripTimes({variables}) {{\n" + "\n".join(lines) + "\n}"
+
+
+@lru_cache(maxsize=128)
+def query_hash(query):
+    """SHA-256 id of a document, as used by automatic persisted queries."""
+    return hashlib.sha256(query.encode()).hexdigest()
+
+
+def location(coordinates):
+    return {"location": {"coordinate": {"latitude": coordinates[1], "longitude": coordinates[0]}}}
+
+
+def plan_variables(origin_coordinates, destination_coordinates, latest_arrival, index=None):
+    """Variables for one trip; ``index`` selects the batch aliases' names."""
+    if index is None:
+        names = ("origin", "destination", "dateTime")
+    else:
+        names = (f"o{index}", f"d{index}", f"t{index}")
+    values = (location(origin_coordinates), location(destination_coordinates), {"latestArrival": latest_arrival})
+    return dict(zip(names, values))
+
+
+def page_variables(origin_coordinates, destination_coordinates, latest_arrival, first, after=None):
+    variables = plan_variables(origin_coordinates, destination_coordinates, latest_arrival)
+    variables.update(first=first, after=after)
+    return variables
+
+
+def request_body(query, variables, persisted=False, include_query=True):
+    """JSON body; with ``persisted`` the hash goes along and the text may be left out."""
+    body = {"variables": variables}
+    if include_query:
+        body["query"] = query
+    if persisted:
+        body["extensions"] = {"persistedQuery": {"version": 1, "sha256Hash": query_hash(query)}}
+    return body
+
+
+def persisted_query_missing(result):
+    return any(
+        error.get("message") == "PersistedQueryNotFound"
+        or (error.get("extensions") or {}).get("code") == "PERSISTED_QUERY_NOT_FOUND"
+        for error in result.get("errors") or []
+    )
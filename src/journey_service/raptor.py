@@ -0,0 +1,206 @@
+"""Latest-arrival RAPTOR over a compiled GTFS timetable.
+
+The search runs backwards from the destination: round ``k`` labels each
+stop with the latest time one can leave it and still reach the destination
+by the deadline using at most ``k`` vehicles.
+"""
+import threading
+from datetime import datetime, timedelta
+
+from journey_service import config
+from .gtfs import load_timetable
+
+UNREACHED = -(1 << 40)
+
+_timetable = None
+_timetable_lock = threading.Lock()
+
+
+def get_timetable():
+    global _timetable
+    if _timetable is None:
+        with _timetable_lock:
+            if _timetable is None:
+                _timetable = load_timetable(
+                    config.GTFS_PATH,
+                    config.TIMETABLE_PATH,
+                    transfer_radius=config.LOCAL_TRANSFER_RADIUS,
+                    walk_speed=config.LOCAL_WALK_SPEED,
+                )
+    return _timetable
+
+
+def _latest_trip(tt, pattern, position, limit, services, after):
+    """Latest active trip of ``pattern`` arriving at ``position`` by ``limit``.
+
+    Only trips later than ``after`` (a trip index) are considered.
+    """
+    low, high = tt.pattern_trips_offset[pattern], tt.pattern_trips_offset[pattern + 1]
+    if after is not None:
+        low = after + 1
+    while low < high:
+        middle = (low + high) // 2
+        if tt.arrivals[tt.trip_times_offset[middle] + position] <= limit:
+            low = middle + 1
+        else:
+            high = middle
+    for trip in range(low - 1, tt.pattern_trips_offset[pattern] - 1 if after is None else after, -1):
+        if tt.trip_service[trip] in services:
+            return trip
+    return None
+
+
+def search(tt, access, egress, deadline, services, max_rounds=None, min_transfer=None):
+    """Run the rounds; returns per-round (labels, parents) dicts keyed by stop."""
+    max_rounds = max_rounds or config.LOCAL_MAX_ROUNDS
+    min_transfer = config.LOCAL_MIN_TRANSFER_SECONDS if min_transfer is None else min_transfer
+    best = {}
+    labels, parents = [{}], [{}]
+    for stop, seconds in egress:
+        time = deadline - seconds
+        if time > best.get(stop, UNREACHED):
+            best[stop] = labels[0][stop] = time
+            parents[0][stop] = ("egress", seconds)
+    marked = set(labels[0])
+
+    for k in range(1, max_rounds + 1):
+        previous = dict(best)
+        slack = 0 if k == 1 else min_transfer
+        queue = {}
+        for stop in marked:
+            for i in range(tt.stop_patterns_offset[stop], tt.stop_patterns_offset[stop + 1]):
+                pattern, position = tt.stop_patterns[i], tt.stop_positions[i]
+                if position > queue.get(pattern, -1):
+                    queue[pattern] = position
+
+        round_labels, round_parents = {}, {}
+        for pattern, start in queue.items():
+            first = tt.pattern_stops_offset[pattern]
+            trip = alight = None
+            for position in range(start, -1, -1):
+                stop = tt.pattern_stops[first + position]
+                if trip is not None:
+                    departure = tt.departures[tt.trip_times_offset[trip] + position]
+                    if departure > best.get(stop, UNREACHED):
+                        best[stop] = round_labels[stop] = departure
+                        round_parents[stop] = ("ride", pattern, trip, position, alight)
+                limit = previous.get(stop, UNREACHED)
+                if limit > UNREACHED:
+                    later = _latest_trip(tt, pattern, position, limit - slack, services, trip)
+                    if later is not None:
+                        trip, alight = later, position
+
+        for stop in list(round_labels):
+            for i in range(tt.transfers_offset[stop], tt.transfers_offset[stop + 1]):
+                other = tt.transfer_stops[i]
+                time = round_labels[stop] - tt.transfer_seconds[i]
+                if time > best.get(other, UNREACHED):
+                    best[other] = round_labels[other] = time
+                    round_parents[other] = ("walk", stop, tt.transfer_seconds[i])
+
+        labels.append(round_labels)
+        parents.append(round_parents)
+        marked = set(round_labels)
+        if not marked:
+            break
+    return labels, parents
+
+
+def _reconstruct(tt, labels, parents, k, stop, access_seconds):
+    """Legs as (mode, from_stop, to_stop, start, end, trip) with stops None at the endpoints."""
+    departure = labels[k][stop]
+    legs = [("WALK", None, stop, departure - access_seconds, departure, None)] if access_seconds else []
+    while True:
+        parent = parents[k][stop]
+        if parent[0] == "egress":
+            start = legs[-1][4] if legs else labels[k][stop]
+            legs.append(("WALK", stop, None, start, start + parent[1], None))
+            return legs
+        if parent[0] == "walk":
+            _, other, seconds = parent
+            start = legs[-1][4] if legs else labels[k][stop]
+            legs.append(("WALK", stop, other, start, start + seconds, None))
+            stop = other
+            continue
+        _, pattern, trip, board, alight = parent
+        first, offset = tt.pattern_stops_offset[pattern], tt.trip_times_offset[trip]
+        to_stop = tt.pattern_stops[first + alight]
+        legs.append((
+            tt.route_modes[tt.pattern_route[pattern]], stop, to_stop,
+            tt.departures[offset + board], tt.arrivals[offset + alight], trip,
+        ))
+        stop = to_stop
+        # The alighting label came from the latest earlier round that set it
+        k -= 1
+        while stop not in labels[k]:
+            k -= 1
+
+
+def latest_departure(tt, origin, destination, deadline, services):
+    """Best journey reaching ``destination`` by ``deadline`` (seconds of the service day).
+
+    ``origin`` and ``destination`` are [lon, lat] like the geocoder returns.
+    Ties in departure time go to the journey with fewer vehicles.
+    """
+    radius, speed = config.LOCAL_ACCESS_RADIUS, config.LOCAL_WALK_SPEED
+    access = [(stop, int(m / speed)) for stop, m in tt.stops_near(origin[1], origin[0], radius)]
+    egress = [(stop, int(m / speed)) for stop, m in tt.stops_near(destination[1], destination[0], radius)]
+    labels, parents = search(tt, access, egress, deadline, services)
+
+    best_time, choice = UNREACHED, None
+    for k in range(1, len(labels)):
+        for stop, seconds in access:
+            if stop in labels[k] and labels[k][stop] - seconds > best_time:
+                best_time, choice = labels[k][stop] - seconds, (k, stop, seconds)
+    if choice is None:
+        return None
+    return _reconstruct(tt, labels, parents, *choice)
+
+
+def _edge(tt, legs, midnight, origin_name, destination_name):
+    def name(stop, fallback):
+        return fallback if stop is None else tt.stop_names[stop]
+
+    def timestamp(seconds):
+        return (midnight + timedelta(seconds=seconds)).isoformat()
+
+    node_legs = []
+    for mode, from_stop, to_stop, start, end, trip in legs:
+        if trip is None and start == end:
+            continue
+        node_legs.append({
+            "from": {"name": name(from_stop, origin_name)},
+            "to": {"name": name(to_stop, destination_name)},
+            "start": {"scheduledTime": timestamp(start)},
+            "end": {"scheduledTime": timestamp(end)},
+            "mode": mode,
+            "duration": float(end - start),
+            "realtimeState": None if trip is None else "SCHEDULED",
+        })
+    return {"node": {"start": timestamp(legs[0][3]), "end": timestamp(legs[-1][4]), "legs": node_legs}}
+
+
+def plan(origin_coordinates, destination_coordinates, arrive_by, count=None, timetable=None):
+    """planConnection-shaped result for a latest-arrival query, computed in-process.
+
+    ``arrive_by`` is a naive local ``datetime``. Each further itinerary is the
+    best one arriving strictly before the previous, so edges come out latest
+    first, as many as ``count``.
+    """
+    from zoneinfo import ZoneInfo
+
+    tt = timetable or get_timetable()
+    count = count or config.LOCAL_ITINERARIES
+    # GTFS stop times count from noon minus 12h, which is midnight except on DST change days
+    midnight = datetime.combine(arrive_by.date(), datetime.min.time(), ZoneInfo(config.TIMEZONE))
+    services = tt.active_services(arrive_by.date())
+    deadline = arrive_by.hour * 3600 + arrive_by.minute * 60 + arrive_by.second
+
+    edges = []
+    for _ in range(count):
+        legs = latest_departure(tt, origin_coordinates, destination_coordinates, deadline, services)
+        if legs is None:
+            break
+        edges.append(_edge(tt, legs, midnight, "Origin", "Destination"))
+        deadline = legs[-1][4] - 1
+    return {"data": {"planConnection": {"edges": edges}}}
@@ -0,0 +1,195 @@
+"""Incremental realtime refresh of already planned itineraries.
+
+A tracked plan is fetched once with the ``tracked`` leg selection. Later
+refreshes only ask the router for the current stop times of the trips its
+transit legs ride (one aliased ``trip`` request), write the estimates into
+the legs in place and re-flow the walks around them. The trip is planned
+again only when a connection can no longer be made.
+"""
+import copy
+import threading
+from datetime import datetime, timedelta
+
+from journey_service import config
+from . import digitransit, queries, routers
+from .cache import TTLCache
+from .instrumentation import emit
+from .models import delay_seconds, effective_time
+
+_tracked = None
+_tracked_lock = threading.Lock()
+
+
+def get_tracked_plans():
+    global _tracked
+    if _tracked is None:
+        with _tracked_lock:
+            if _tracked is None:
+                _tracked = TTLCache(maxsize=config.PLAN_CACHE_SIZE, ttl=config.REALTIME_TRACK_TTL)
+    return _tracked
+
+
+def _edges(plan):
+    return (plan["data"]["planConnection"] or {}).get("edges", [])
+
+
+def trip_refs(plan):
+    """Distinct (trip id, service date) pairs ridden by the plan's transit legs."""
+    refs = {}
+    for edge in _edges(plan):
+        for leg in edge["node"]["legs"]:
+            if leg.get("trip") and leg.get("serviceDate"):
+                refs[(leg["trip"]["gtfsId"], leg["serviceDate"])] = None
+    return list(refs)
+
+
+def fetch_trip_times(refs, timeout=None, router=None):
+    """Current stop times per trip, as ``{ref: {stop id: stoptime}}``.
+
+    Trips the router no longer knows are left out.
+    """
+    variables = {}
+    for i, (trip, service_date) in enumerate(refs):
+        variables[f"id{i}"] = trip
+        variables[f"date{i}"] = service_date
+    data = digitransit.post_query(queries.trip_times_query(len(refs)), variables, timeout, router).get("data") or {}
+    times = {}
+    for i, ref in enumerate(refs):
+        trip = data.get(f"t{i}")
+        if trip and trip.get("stoptimesForDate"):
+            times[ref] = {stoptime["stop"]["gtfsId"]: stoptime for stoptime in trip["stoptimesForDate"]}
+    return times
+
+
+def _time(place):
+    return datetime.fromisoformat(effective_time(place))
+
+
+def _estimate(place, time):
+    """Record ``time`` as the realtime estimate of a leg's start or end.
+
+    Delays are always derived from it (``delay_seconds``): the router's own
+    ``estimated.delay`` is an ISO-8601 duration, so it is not requested.
+    """
+    place["estimated"] = {"time": time.isoformat()}
+
+
+def _update_leg(leg, stoptimes):
+    """Write the trip's estimates into a transit leg; None when it can no longer be ridden."""
+    board = stoptimes.get(leg["from"]["stop"]["gtfsId"]) if stoptimes else None
+    alight = stoptimes.get(leg["to"]["stop"]["gtfsId"]) if stoptimes else None
+    if board is None or alight is None or "CANCELED" in (board["realtimeState"], alight["realtimeState"]):
+        return None
+    changes = []
+    for end, stoptime, event in (("start", board, "Departure"), ("end", alight, "Arrival")):
+        previous = delay_seconds(leg[end])
+        tz = datetime.fromisoformat(leg[end]["scheduledTime"]).tzinfo
+        _estimate(leg[end], datetime.fromtimestamp(stoptime["serviceDay"] + stoptime["realtime" + event], tz))
+        delay = delay_seconds(leg[end])
+        if delay != previous:
+            changes.append({"at": end, "delay": delay, "previous": previous,
+                            "notified": leg[end].get("notifiedDelay", 0)})
+    leg["realtimeState"] = board["realtimeState"]
+    leg["duration"] = (_time(leg["end"]) - _time(leg["start"])).total_seconds()
+    return changes
+
+
+def _reflow(node):
+    """Move walk legs to fit the (updated) transit legs; False when a transfer is missed."""
+    legs = node["legs"]
+    fixed = [i for i, leg in enumerate(legs) if leg["mode"] != "WALK"]
+    if fixed:
+        # Access walk ends when the first vehicle leaves
+        end = _time(legs[fixed[0]]["start"])
+        for leg in reversed(legs[:fixed[0]]):
+            _estimate(leg["end"], end)
+            end -= timedelta(seconds=leg["duration"])
+            _estimate(leg["start"], end)
+        # Transfer and egress walks start when the previous vehicle arrives
+        for first, last in zip(fixed, fixed[1:] + [len(legs)]):
+            start = _time(legs[first]["end"])
+            for leg in legs[first + 1:last]:
+                _estimate(leg["start"], start)
+                start += timedelta(seconds=leg["duration"])
+                _estimate(leg["end"], start)
+            if last < len(legs) and start > _time(legs[last]["start"]):
+                return False
+    node["start"] = _time(legs[0]["start"]).isoformat()
+    node["end"] = _time(legs[-1]["end"]).isoformat()
+    return True
+
+
+def refresh(plan, timeout=None):
+    """Apply current trip times to a copy of ``plan``.
+
+    Returns ``(plan, changes, infeasible)``: the refreshed plan, per-leg
+    delay changes and the indexes of itineraries that can no longer be made.
+    """
+    plan = copy.deepcopy(plan)
+    refs = trip_refs(plan)
+    if not refs:
+        return plan, [], []
+    # Trip ids are only meaningful to the router that planned the trip
+    times = fetch_trip_times(refs, timeout, routers.get_router(plan.get("router")))
+    changes, infeasible = [], []
+    for index, edge in enumerate(_edges(plan)):
+        feasible = True
+        for position, leg in enumerate(edge["node"]["legs"]):
+            if not leg.get("trip"):
+                continue
+            leg_changes = _update_leg(leg, times.get((leg["trip"]["gtfsId"], leg["serviceDate"])))
+            if leg_changes is None:
+                changes.append({"itinerary": index, "leg": position, "kind": "cancelled"})
+                feasible = False
+                continue
+            changes.extend(dict(change, itinerary=index, leg=position, kind="delay") for change in leg_changes)
+        if not (feasible and _reflow(edge["node"])):
+            infeasible.append(index)
+    return plan, changes, infeasible
+
+
+def track(origin_coordinates, destination_coordinates, arrive_by, timeout=None):
+    """Latest state of a tracked trip plus what changed since the last call.
+
+    The first call plans the trip; later ones refresh it incrementally and
+    only re-plan (a ``replanned`` change) when an itinerary became infeasible.
+    """
+    key = digitransit.plan_cache_key(origin_coordinates, destination_coordinates, arrive_by, "tracked")
+    previous = get_tracked_plans().get(key)
+    if previous is None:
+        # A copy, since notified delays are recorded on the tracked plan
+        plan = copy.deepcopy(digitransit.query_journeys(
+            origin_coordinates, destination_coordinates, arrive_by, timeout, "tracked"
+        ))
+        changes = []
+    else:
+        plan, changes, infeasible = refresh(previous, timeout)
+        emit("RealtimeRefreshes", 1)
+        if infeasible:
+            digitransit.get_plan_cache().discard(key)
+            plan = copy.deepcopy(digitransit.query_journeys(
+                origin_coordinates, destination_coordinates, arrive_by, timeout, "tracked"
+            ))
+            changes.append({"kind": "replanned", "itineraries": infeasible})
+            emit("RealtimeReplans", 1)
+    if plan["data"]["planConnection"] is not None:
+        get_tracked_plans().set(key, plan)
+    return plan, changes
+
+
+def meaningful(changes, threshold=None):
+    """True when a change is worth notifying about: a re-plan, a cancellation
+    or a delay at least ``threshold`` seconds away from the one last notified."""
+    threshold = config.REALTIME_NOTIFY_SECONDS if threshold is None else threshold
+    return any(
+        change["kind"] != "delay" or abs(change["delay"] - change.get("notified", change["previous"])) >= threshold
+        for change in changes
+    )
+
+
+def mark_notified(plan):
+    """Record the plan's current delays as sent, the baseline for ``meaningful``."""
+    for edge in _edges(plan):
+        for leg in edge["node"]["legs"]:
+            for end in ("start", "end"):
+                leg[end]["notifiedDelay"] = delay_seconds(leg[end])
@@ -0,0 +1,167 @@
+import random
+import threading
+import time
+
+
+class UpstreamUnavailable(Exception):
+    """Upstream is rate limiting, failing or behind an open circuit breaker."""
+
+    def __init__(self, service, reason, retry_after=None):
+        super().__init__(f"{service} unavailable: {reason}")
+        self.service = service
+        self.retry_after = retry_after
+
+
+class TokenBucket:
+    """Request-rate limiter shared by every call using the subscription key.
+
+    ``rate`` tokens per second up to ``burst``; a rate of 0 disables it.
+    Quota headers on responses pull the bucket in line with what the API
+    says is left, and ``Retry-After`` pauses it entirely.
+    """
+
+    def __init__(self, rate, burst, clock=time.monotonic, sleep=time.sleep):
+        self.rate = rate
+        self.burst = burst
+        self.clock = clock
+        self.sleep = sleep
+        self.tokens = burst
+        self.updated = clock()
+        self.paused_until = 0.0
+        self._lock = threading.Lock()
+
+    def _refill(self, now):
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def acquire(self, max_wait):
+        """Take a token, waiting up to ``max_wait`` seconds; False if that is not enough."""
+        if not self.rate:
+            return True
+        with self._lock:
+            now = self.clock()
+            self._refill(now)
+            start = max(now, self.paused_until)
+            wait = max(0.0, start - now) + max(0.0, (1 - self.tokens) / self.rate)
+            if wait > max_wait:
+                return False
+            # Reserve the token now so concurrent callers queue behind each other
+            self.tokens -= 1
+        if wait:
+            self.sleep(wait)
+        return True
+
+    def observe(self, headers):
+        """Apply quota feedback from ``X-RateLimit-Remaining`` / ``Retry-After`` headers."""
+        if not self.rate:
+            return
+        with self._lock:
+            remaining = headers.get("X-RateLimit-Remaining")
+            if isinstance(remaining, str) and remaining.isdigit():
+                self.tokens = min(self.tokens, int(remaining))
+            retry_after = parse_retry_after(headers)
+            if retry_after:
+                self.paused_until = max(self.paused_until, self.clock() + retry_after)
+                self.tokens = min(self.tokens, 0)
+
+
+class AdaptiveLimiter:
+    """AIMD concurrency limit: +1 per limit's worth of successes, halved on 429."""
+
+    def __init__(self, initial, minimum=1, maximum=None):
+        self.limit = float(initial)
+        self.minimum = minimum
+        self.maximum = maximum or initial
+        self.in_flight = 0
+        self._condition = threading.Condition()
+
+    def __enter__(self):
+        with self._condition:
+            while self.in_flight >= int(self.limit):
+                self._condition.wait()
+            self.in_flight += 1
+        return self
+
+    def __exit__(self, *exc):
+        with self._condition:
+            self.in_flight -= 1
+            self._condition.notify()
+
+    def on_success(self):
+        with self._condition:
+            self.limit = min(self.maximum, self.limit + 1 / self.limit)
+            self._condition.notify_all()
+
+    def on_throttle(self):
+        with self._condition:
+            self.limit = max(self.minimum, self.limit / 2)
+
+
+class CircuitBreaker:
+    """Closed -> open after ``threshold`` consecutive failures.
+
+    After ``reset_timeout`` one probe request is let through (half-open); its
+    outcome closes or re-opens the circuit. A probe that ends without an
+    outcome is ``release``d, and one that reports nothing within
+    ``probe_timeout`` is given up on, so another probe can go out.
+    """
+
+    def __init__(self, threshold=5, reset_timeout=30, clock=time.monotonic, probe_timeout=None):
+        self.threshold = threshold
+        self.reset_timeout = reset_timeout
+        self.probe_timeout = reset_timeout if probe_timeout is None else probe_timeout
+        self.clock = clock
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = 0.0
+        self.probe_started = 0.0
+        self._lock = threading.Lock()
+
+    def allow(self):
+        with self._lock:
+            if self.state == "closed":
+                return True
+            now = self.clock()
+            if (self.state == "open" and now - self.opened_at >= self.reset_timeout
+                    or self.state == "half_open" and now - self.probe_started >= self.probe_timeout):
+                self.state = "half_open"
+                self.probe_started = now
+                return True
+            return False
+
+    def release(self):
+        """Give back the half-open probe when it got no verdict (throttled or never sent)."""
+        with self._lock:
+            if self.state == "half_open":
+                self.state = "open"
+                self.opened_at = self.clock() - self.reset_timeout
+
+    def retry_after(self):
+        return max(0.0, self.opened_at + self.reset_timeout - self.clock())
+
+    def record_success(self):
+        with self._lock:
+            self.state = "closed"
+            self.failures = 0
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == "half_open" or self.failures >= self.threshold:
+                self.state = "open"
+                self.opened_at = self.clock()
+
+
+def parse_retry_after(headers):
+    value = headers.get("Retry-After")
+    if not isinstance(value, str):
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        return None
+
+
+def backoff_delay(attempt, base, cap):
+    """Full-jitter exponential backoff for retry ``attempt`` (0-based)."""
+    return random.uniform(0, min(cap, base * 2 ** attempt))
@@ -0,0 +1,203 @@
+"""Regional router registry and coverage lookup.
+
+Digitransit runs regional OTP routers (``hsl``, ``waltti``) next to the
+nationwide ``finland`` one; a regional router answers local trips much
+faster. With ROUTER_SELECTION each trip goes to the smallest router whose
+coverage contains both endpoints, falling back to the larger ones when it is
+unavailable or busy. Coverage polygons are put in a uniform grid (cells of
+ROUTER_GRID_DEGREES) so a lookup only tests the polygons of one cell.
+
+Router URLs are derived from ROUTING_URL by swapping the ``/hsl/`` path
+segment; ROUTERS_FILE replaces the built-in registry with a JSON list of
+``{"name", "url", "polygons", "maxConcurrency"}`` objects, polygons being
+lists of ``[lon, lat]`` rings.
+"""
+import json
+import math
+import threading
+from contextlib import contextmanager
+
+from journey_service import config
+from .instrumentation import emit, metric_prefix
+from .resilience import UpstreamUnavailable
+
+# Approximate service areas as [lon, lat] rings; generous at the edges since
+# the routers still answer for stops a little outside their feeds
+REGIONS = {
+    "hsl": [
+        [[24.15, 60.05], [24.55, 59.95], [25.35, 60.05], [25.55, 60.3], [25.3, 60.55], [24.55, 60.55], [24.15, 60.35]],
+    ],
+    "waltti": [
+        [[22.95, 61.3], [24.25, 61.3], [24.25, 61.8], [22.95, 61.8]],    # Tampere
+        [[21.9, 60.3], [22.75, 60.3], [22.75, 60.65], [21.9, 60.65]],    # Turku
+        [[25.2, 64.8], [26.05, 64.8], [26.05, 65.3], [25.2, 65.3]],      # Oulu
+        [[25.4, 62.05], [26.1, 62.05], [26.1, 62.45], [25.4, 62.45]],    # Jyväskylä
+        [[27.3, 62.7], [28.0, 62.7], [28.0, 63.1], [27.3, 63.1]],        # Kuopio
+        [[25.35, 60.85], [25.95, 60.85], [25.95, 61.1], [25.35, 61.1]],  # Lahti
+        [[29.45, 62.45], [29.95, 62.45], [29.95, 62.7], [29.45, 62.7]],  # Joensuu
+        [[24.2, 60.9], [24.7, 60.9], [24.7, 61.1], [24.2, 61.1]],        # Hämeenlinna
+    ],
+    "finland": [
+        [[19.3, 60.2], [20.5, 59.7], [27.8, 59.9], [31.6, 62.9], [29.1, 66.0], [30.0, 67.7], [28.7, 69.0],
+         [29.3, 69.9], [27.9, 70.1], [25.0, 68.6], [21.0, 69.3], [20.5, 68.4], [23.6, 66.0], [21.0, 63.0]],
+    ],
+}
+
+_routers = None
+_index = None
+_default = None
+_lock = threading.Lock()
+
+
+def contains(polygon, point):
+    """Ray-casting point-in-polygon test for one [lon, lat] ring."""
+    x, y = point[0], point[1]
+    inside = False
+    j = len(polygon) - 1
+    for i in range(len(polygon)):
+        xi, yi = polygon[i]
+        xj, yj = polygon[j]
+        if (yi > y) != (yj > y) and x < (xj - xi) * (y - yi) / (yj - yi) + xi:
+            inside = not inside
+        j = i
+    return inside
+
+
+def area_km2(polygons):
+    """Approximate area of the rings (shoelace on an equirectangular projection)."""
+    total = 0.0
+    for polygon in polygons:
+        lat = sum(p[1] for p in polygon) / len(polygon)
+        scale = 111.32 ** 2 * math.cos(math.radians(lat))
+        total += abs(sum(
+            polygon[i - 1][0] * polygon[i][1] - polygon[i][0] * polygon[i - 1][1] for i in range(len(polygon))
+        )) / 2 * scale
+    return total
+
+
+class Router:
+    """One routing endpoint with its own connection pool, breaker and concurrency limit."""
+
+    def __init__(self, name, url, polygons=(), max_concurrency=None, service=None, pool=None):
+        self.name = name
+        self.url = url
+        self.polygons = [[tuple(p) for p in polygon] for polygon in polygons]
+        self.area = area_km2(self.polygons)
+        self.service = service or f"routing_{name}"
+        self.pool = pool
+        self._slots = threading.BoundedSemaphore(max_concurrency) if max_concurrency else None
+
+    def __repr__(self):
+        return f"Router({self.name!r})"
+
+    @contextmanager
+    def slot(self, wait=None):
+        """Hold one of the router's concurrent request slots.
+
+        Waits up to ROUTER_QUEUE_SECONDS; a router that stays saturated raises
+        UpstreamUnavailable so the caller can move on to the next router.
+        """
+        if self._slots is None:
+            yield
+            return
+        if not self._slots.acquire(timeout=config.ROUTER_QUEUE_SECONDS if wait is None else wait):
+            emit(f"{metric_prefix(self.service)}Saturated", 1)
+            raise UpstreamUnavailable(self.service, "too many concurrent requests", retry_after=1)
+        try:
+            yield
+        finally:
+            self._slots.release()
+
+
+class CoverageIndex:
+    """Uniform grid over the routers' polygon bounding boxes."""
+
+    def __init__(self, routers, cell=None):
+        self.cell = cell or config.ROUTER_GRID_DEGREES
+        self.cells = {}
+        for router in routers:
+            for polygon in router.polygons:
+                lons, lats = zip(*polygon)
+                for cx in range(self._cell(min(lons)), self._cell(max(lons)) + 1):
+                    for cy in range(self._cell(min(lats)), self._cell(max(lats)) + 1):
+                        self.cells.setdefault((cx, cy), []).append((router, polygon))
+
+    def _cell(self, degrees):
+        return math.floor(degrees / self.cell)
+
+    def covering(self, point):
+        """Routers whose coverage contains ``point`` ([lon, lat])."""
+        found = {}
+        for router, polygon in self.cells.get((self._cell(point[0]), self._cell(point[1])), ()):
+            if router.name not in found and contains(polygon, point):
+                found[router.name] = router
+        return list(found.values())
+
+
+def load_routers():
+    if config.ROUTERS_FILE:
+        with open(config.ROUTERS_FILE, encoding="utf-8") as f:
+            entries = json.load(f)
+        return [
+            Router(entry["name"], entry["url"], entry["polygons"],
+                   entry.get("maxConcurrency", config.ROUTER_MAX_CONCURRENCY), pool=entry["name"])
+            for entry in entries
+        ]
+    return [
+        Router(name, config.ROUTING_URL.replace("/hsl/", f"/{name}/"), polygons, config.ROUTER_MAX_CONCURRENCY,
+               pool=name)
+        for name, polygons in REGIONS.items()
+    ]
+
+
+def get_routers():
+    """Registry (by name) and its coverage index, built on first use."""
+    global _routers, _index
+    if _routers is None:
+        with _lock:
+            if _routers is None:
+                routers = load_routers()
+                _index = CoverageIndex(routers)
+                _routers = {router.name: router for router in routers}
+    return _routers, _index
+
+
+def default_router():
+    """ROUTING_URL itself, used when router selection is off."""
+    global _default
+    if _default is None:
+        with _lock:
+            if _default is None:
+                # Shares the service name and session of the single-router setup
+                _default = Router("default", config.ROUTING_URL, service="routing")
+    return _default
+
+
+def get_router(name):
+    """Router by name, e.g. the one a cached plan came from; the default when unknown."""
+    if name is None or not config.ROUTER_SELECTION:
+        return default_router()
+    return get_routers()[0].get(name) or default_router()
+
+
+def chain(origin_coordinates, destination_coordinates):
+    """Routers to try for a trip, smallest covering both endpoints first.
+
+    When no router covers both, the largest one is tried alone.
+    """
+    if not config.ROUTER_SELECTION:
+        return [default_router()]
+    routers, index = get_routers()
+    destination = {router.name for router in index.covering(destination_coordinates)}
+    candidates = [router for router in index.covering(origin_coordinates) if router.name in destination]
+    if not candidates:
+        emit("RouterUncovered", 1)
+        return [max(routers.values(), key=lambda router: router.area)]
+    return sorted(candidates, key=lambda router: (router.area, router.name))
+
+
+def reset():
+    """Forget the registry (tests, config changes)."""
+    global _routers, _index, _default
+    with _lock:
+        _routers = _index = _default = None
@@ -0,0 +1,326 @@
+"""Long-running HTTP server mode exposing the same API as the Lambda.
+
+    python -m journey_service.server --workers 4 --port 8080
+
+``app`` is a plain ASGI application, so any ASGI server can host it
+(``uvicorn journey_service.server:app``). Without one, ``run`` serves it
+with a small asyncio HTTP/1.1 runner: the parent binds the listening socket
+and forks ``SERVER_WORKERS`` processes that accept on it. Within a worker
+the geocode/plan caches, the pooled keep-alive session and the upstream
+rate limiter are shared by all requests; across workers the SQLite geocode
+tier (GEOCODE_CACHE_PATH) and single-flight directory are shared.
+
+Request handling reuses ``handler.handle_event``; the blocking upstream
+calls run on a dedicated thread pool so the event loop keeps accepting.
+Bodies of at least SERVER_GZIP_MIN_BYTES are gzipped for clients that
+accept it (API Gateway does the same for the Lambda).
+"""
+import argparse
+import asyncio
+import gzip
+import json
+import os
+import signal
+import socket
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qsl
+
+from journey_service import config
+
+_executor = None
+_executor_lock = threading.Lock()
+
+STATUS_TEXT = {200: "OK", 304: "Not Modified", 400: "Bad Request", 404: "Not Found", 411: "Length Required",
+               413: "Payload Too Large", 500: "Internal Server Error", 503: "Service Unavailable"}
+
+
+def get_request_executor():
+    """Threads running request handlers, kept apart from the upstream fan-out pool."""
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(max_workers=config.SERVER_THREADS, thread_name_prefix="request")
+    return _executor
+
+
+def to_event(scope, body):
+    """API Gateway proxy-shaped event for an ASGI HTTP scope."""
+    query = dict(parse_qsl(scope.get("query_string", b"").decode()))
+    return {
+        "httpMethod": scope["method"],
+        "path": scope["path"],
+        "headers": {name.decode(): value.decode() for name, value in scope.get("headers", [])},
+        "queryStringParameters": query or None,
+        "body": body.decode() if body else None,
+    }
+
+
+def _response_headers(response):
+    headers = {"content-type": "application/json"}
+    headers.update({name.lower(): str(value) for name, value in (response.get("headers") or {}).items()})
+    return headers
+
+
+def _response_parts(response):
+    body = response.get("body") or ""
+    if response.get("isBase64Encoded"):
+        import base64
+
+        body = base64.b64decode(body)
+    elif isinstance(body, str):
+        body = body.encode()
+    return response.get("statusCode", 200), _response_headers(response), body
+
+
+def _accepts_gzip(scope):
+    for name, value in scope.get("headers", []):
+        if name.lower() == b"accept-encoding":
+            return any(coding.split(b";")[0].strip() == b"gzip" for coding in value.split(b","))
+    return False
+
+
+async def _send_stream(send, response, loop):
+    """Send a generator body chunk by chunk as the handler produces it."""
+    await send({
+        "type": "http.response.start",
+        "status": response.get("statusCode", 200),
+        "headers": [(name.encode(), value.encode()) for name, value in _response_headers(response).items()],
+    })
+    chunks = iter(response["body"])
+    try:
+        while True:
+            # Producing a chunk may wait on the router, so it runs off the loop
+            chunk = await loop.run_in_executor(get_request_executor(), next, chunks, None)
+            if chunk is None:
+                break
+            await send({"type": "http.response.body", "body": chunk.encode(), "more_body": True})
+        await send({"type": "http.response.body", "body": b"", "more_body": False})
+    finally:
+        # A client that hung up stops the remaining page requests
+        if hasattr(chunks, "close"):
+            chunks.close()
+
+
+async def app(scope, receive, send):
+    """ASGI entry point."""
+    if scope["type"] == "lifespan":
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                from . import http_client
+
+                http_client.close()
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+    body = b""
+    while True:
+        message = await receive()
+        body += message.get("body", b"")
+        if not message.get("more_body"):
+            break
+
+    if scope["path"].rstrip("/") == "/health":
+        response = {"statusCode": 200, "body": json.dumps({"status": "ok"})}
+    else:
+        from .handler import handle_event
+
+        loop = asyncio.get_running_loop()
+        response = await loop.run_in_executor(get_request_executor(), handle_event, to_event(scope, body))
+        if not isinstance(response.get("body"), (str, bytes, type(None))):
+            await _send_stream(send, response, loop)
+            return
+
+    status, headers, payload = _response_parts(response)
+    if _accepts_gzip(scope) and len(payload) >= config.SERVER_GZIP_MIN_BYTES and "content-encoding" not in headers:
+        payload = gzip.compress(payload, compresslevel=5)
+        headers["content-encoding"] = "gzip"
+        headers["vary"] = ", ".join(filter(None, (headers.get("vary"), "Accept-Encoding")))
+        # The compressed representation needs its own validator
+        if headers.get("etag", "").endswith('"'):
+            headers["etag"] = headers["etag"][:-1] + '-gzip"'
+    headers["content-length"] = str(len(payload))
+    await send({
+        "type": "http.response.start",
+        "status": status,
+        "headers": [(name.encode(), value.encode()) for name, value in headers.items()],
+    })
+    await send({"type": "http.response.body", "body": payload})
+
+
+async def _read_request(reader):
+    """Parse one HTTP/1.1 request head.
+
+    None when the client closed the connection; raises ValueError on a
+    malformed request line.
+    """
+    try:
+        head = await reader.readuntil(b"\r\n\r\n")
+    except (asyncio.IncompleteReadError, ConnectionError):
+        return None
+    request_line, *header_lines = head.decode("latin-1").split("\r\n")
+    method, target, version = request_line.split(" ", 2)
+    if not version.startswith("HTTP/"):
+        raise ValueError(f"malformed request line {request_line!r}")
+    headers = []
+    for line in header_lines:
+        if line:
+            name, _, value = line.partition(":")
+            headers.append((name.strip().lower(), value.strip()))
+    path, _, query = target.partition("?")
+    return {
+        "type": "http",
+        "http_version": version.split("/")[-1],
+        "method": method.upper(),
+        "path": path,
+        "query_string": query.encode(),
+        "headers": [(name.encode(), value.encode()) for name, value in headers],
+    }, dict(headers)
+
+
+async def _write_simple(writer, status):
+    writer.write(f"HTTP/1.1 {status} {STATUS_TEXT[status]}\r\nContent-Length: 0\r\nConnection: close\r\n\r\n".encode())
+    await writer.drain()
+
+
+async def handle_connection(reader, writer):
+    """Serve keep-alive HTTP/1.1 requests on one connection until it closes."""
+    try:
+        while True:
+            try:
+                request = await _read_request(reader)
+            except ValueError:
+                await _write_simple(writer, 400)
+                break
+            if request is None:
+                break
+            scope, headers = request
+            # Request bodies must come with a Content-Length; chunked ones are not supported
+            if headers.get("transfer-encoding", "identity").lower() != "identity":
+                await _write_simple(writer, 411)
+                break
+            try:
+                length = int(headers.get("content-length", 0))
+            except ValueError:
+                length = -1
+            if length < 0:
+                await _write_simple(writer, 400)
+                break
+            if length > config.SERVER_MAX_BODY:
+                await _write_simple(writer, 413)
+                break
+            body = await reader.readexactly(length) if length else b""
+            keep_alive = headers.get("connection", "").lower() != "close" and scope["http_version"] != "1.0"
+
+            async def receive():
+                return {"type": "http.request", "body": body, "more_body": False}
+
+            chunked = False
+
+            async def send(message):
+                nonlocal chunked
+                if message["type"] == "http.response.start":
+                    status = message["status"]
+                    lines = [f"HTTP/1.1 {status} {STATUS_TEXT.get(status, 'OK')}"]
+                    lines += [f"{name.decode()}: {value.decode()}" for name, value in message["headers"]]
+                    # Bodies of unknown length (streamed responses) go out chunked
+                    chunked = not any(name.lower() == b"content-length" for name, _ in message["headers"])
+                    if chunked:
+                        lines.append("transfer-encoding: chunked")
+                    lines.append("connection: " + ("keep-alive" if keep_alive else "close"))
+                    writer.write(("\r\n".join(lines) + "\r\n\r\n").encode("latin-1"))
+                elif chunked:
+                    payload = message.get("body", b"")
+                    if payload:
+                        writer.write(b"%x\r\n%s\r\n" % (len(payload), payload))
+                    if not message.get("more_body"):
+                        writer.write(b"0\r\n\r\n")
+                    await writer.drain()
+                else:
+                    writer.write(message.get("body", b""))
+                    await writer.drain()
+
+            await app(scope, receive, send)
+            if not keep_alive:
+                break
+    except (ConnectionError, asyncio.IncompleteReadError):
+        pass
+    finally:
+        writer.close()
+
+
+def bind(host=None, port=None):
+    """Listening socket shared by every worker process."""
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host or config.SERVER_HOST, config.SERVER_PORT if port is None else port))
+    sock.listen(1024)
+    sock.setblocking(False)
+    return sock
+
+
+async def serve(sock, stop=None):
+    """Accept connections on ``sock`` until ``stop`` (an asyncio.Event) is set."""
+    stop = stop or asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for signum in (signal.SIGTERM, signal.SIGINT):
+        try:
+            loop.add_signal_handler(signum, stop.set)
+        except (RuntimeError, ValueError):
+            pass  # not the main thread (e.g. tests)
+    server = await asyncio.start_server(handle_connection, sock=sock)
+    async with server:
+        await stop.wait()
+    from . import http_client
+
+    http_client.close()
+
+
+def run(workers=None, host=None, port=None):
+    """Serve in this process, or prefork ``workers`` processes on one socket."""
+    workers = workers or config.SERVER_WORKERS
+    sock = bind(host, port)
+    print(f"journey_service listening on http://{sock.getsockname()[0]}:{sock.getsockname()[1]}"
+          f" ({workers} worker{'s' if workers != 1 else ''})", flush=True)
+    if workers == 1:
+        asyncio.run(serve(sock))
+        return
+
+    children = []
+    for _ in range(workers):
+        pid = os.fork()
+        if pid == 0:
+            # Each worker builds its own caches, session and pools after the fork
+            asyncio.run(serve(sock))
+            os._exit(0)
+        children.append(pid)
+    sock.close()
+
+    def forward(signum, frame):
+        for child in children:
+            try:
+                os.kill(child, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGTERM, forward)
+    signal.signal(signal.SIGINT, forward)
+    for child in children:
+        os.waitpid(child, 0)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default=None)
+    parser.add_argument("--port", type=int, default=None)
+    parser.add_argument("--workers", type=int, default=None)
+    args = parser.parse_args(argv)
+    run(args.workers, args.host, args.port)
+
+
+if __name__ == "__main__":
+    main()
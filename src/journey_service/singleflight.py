@@ -0,0 +1,172 @@
+import hashlib
+import json
+import os
+import threading
+import time
+
+from journey_service import config
+from .instrumentation import emit
+
+
+class _Call:
+    __slots__ = ("done", "result", "error")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """Join concurrent calls with the same key onto one execution.
+
+    The first caller (the leader) runs the function; callers arriving while
+    it is in flight wait and receive the same result or exception.
+    """
+
+    def __init__(self):
+        self._calls = {}
+        self._lock = threading.Lock()
+
+    def do(self, key, fn, *args):
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+        if not leader:
+            emit("CoalescedRequests", 1)
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+        try:
+            call.result = fn(*args)
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+
+class FileSingleFlight:
+    """Single-flight across processes on one host via ``flock`` and record files.
+
+    The leader holds an exclusive lock on ``<key>.lock`` while it runs and
+    writes the JSON result to ``<key>.json``. A process that finds the lock
+    taken blocks on it, then reuses the record if it was written after it
+    started waiting, or runs the function itself (e.g. the leader failed).
+
+    Keys are one-off (plan keys carry the arrival minute), so leaders sweep
+    files untouched for COALESCE_RECORD_TTL seconds, at most once per that
+    interval. A waiter only trusts records written after it started waiting,
+    so an old record is never needed.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        self._pruned = time.time()
+        os.makedirs(directory, exist_ok=True)
+
+    def _paths(self, key):
+        base = os.path.join(self.directory, hashlib.sha1(key.encode()).hexdigest())
+        return base + ".lock", base + ".json"
+
+    def do(self, key, fn, *args):
+        import fcntl
+
+        lock_path, record_path = self._paths(key)
+        started = time.time()
+        with open(lock_path, "a") as lock:
+            try:
+                fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                waited = False
+            except BlockingIOError:
+                fcntl.flock(lock, fcntl.LOCK_EX)
+                waited = True
+            os.utime(lock_path)
+            try:
+                if waited:
+                    record = self._read(record_path)
+                    if record is not None and record["written"] >= started:
+                        emit("CoalescedRequests", 1)
+                        return record["result"]
+                result = fn(*args)
+                self._write(record_path, result)
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+        if time.time() - self._pruned >= config.COALESCE_RECORD_TTL:
+            self.prune()
+        return result
+
+    def prune(self, max_age=None):
+        """Delete records, and lock files nobody holds, untouched for ``max_age`` seconds."""
+        import fcntl
+
+        self._pruned = time.time()
+        cutoff = self._pruned - (config.COALESCE_RECORD_TTL if max_age is None else max_age)
+        removed = 0
+        for entry in os.scandir(self.directory):
+            try:
+                if entry.stat().st_mtime >= cutoff:
+                    continue
+                if entry.name.endswith(".lock"):
+                    # A process that opened the file just before it goes may lead
+                    # alongside a new one; that costs a duplicate call, not a wrong result
+                    with open(entry.path, "a") as lock:
+                        try:
+                            fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                        except BlockingIOError:
+                            continue
+                        os.remove(entry.path)
+                else:
+                    os.remove(entry.path)
+                removed += 1
+            except FileNotFoundError:
+                pass
+        if removed:
+            emit("CoalesceRecordsPruned", removed)
+        return removed
+
+    @staticmethod
+    def _read(path):
+        try:
+            with open(path) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    @staticmethod
+    def _write(path, result):
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({"written": time.time(), "result": result}, f)
+        os.replace(tmp_path, path)
+
+
+_flight = SingleFlight()
+_file_flight = None
+_file_flight_lock = threading.Lock()
+
+
+def get_file_flight():
+    global _file_flight
+    if _file_flight is None and config.COALESCE_DIR:
+        with _file_flight_lock:
+            if _file_flight is None:
+                _file_flight = FileSingleFlight(config.COALESCE_DIR)
+    return _file_flight
+
+
+def coalesce(key, fn, *args):
+    """``fn(*args)``, shared with identical in-flight calls in this process and,
+    when COALESCE_DIR is set, in other processes on the host."""
+    if not config.COALESCE_ENABLED:
+        return fn(*args)
+    file_flight = get_file_flight()
+    if file_flight is not None:
+        return _flight.do(key, file_flight.do, key, fn, *args)
+    return _flight.do(key, fn, *args)
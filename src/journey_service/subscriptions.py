@@ -0,0 +1,243 @@
+import json
+import threading
+import time
+from datetime import datetime
+
+from journey_service import config
+from .cache import SqliteCache, normalize_query
+from .digitransit import get_coordinates_many, query_journeys_batch
+from .filters import filter_journeys
+from .http_client import run_concurrently
+from .instrumentation import emit, logger, stage
+from .notifier import queue_email, send_emails
+from .realtime import mark_notified, meaningful, refresh, track
+from .resilience import UpstreamUnavailable
+
+# Plans computed by the prefetch phase, kept on local disk between the two
+# scheduled invocations (a warm container or a long-running server)
+_prefetch_store = None
+_prefetch_lock = threading.Lock()
+
+
+def load_subscriptions():
+    """Subscribers as dicts with email, origin, destination and arriveAt (HH:MM).
+
+    Read from the SUBSCRIPTIONS JSON env var or SUBSCRIPTIONS_FILE; without
+    either, TO_EMAIL is subscribed to the default commute.
+    """
+    if config.SUBSCRIPTIONS:
+        return json.loads(config.SUBSCRIPTIONS)
+    if config.SUBSCRIPTIONS_FILE:
+        with open(config.SUBSCRIPTIONS_FILE) as f:
+            return json.load(f)
+    if config.TO_EMAIL:
+        return [{
+            "email": config.TO_EMAIL,
+            "origin": config.DEFAULT_ORIGIN,
+            "destination": config.DEFAULT_DESTINATION,
+            "arriveAt": config.DEFAULT_ARRIVE_AT,
+        }]
+    return []
+
+
+def arrive_by_for(arrive_at, day):
+    """Combine an HH:MM arrival with a date into the yyyyMMddHHmmss format."""
+    hour, minute = (int(part) for part in arrive_at.split(":"))
+    return day.strftime("%Y%m%d") + f"{hour:02d}{minute:02d}00"
+
+
+def group_subscriptions(subscriptions, day):
+    """Group subscribers sharing the same trip so each plan is computed once."""
+    groups = {}
+    for subscription in subscriptions:
+        arrive_by = arrive_by_for(subscription["arriveAt"], day)
+        key = (normalize_query(subscription["origin"]), normalize_query(subscription["destination"]), arrive_by)
+        groups.setdefault(key, []).append(subscription)
+    return groups
+
+
+def get_prefetch_store():
+    global _prefetch_store
+    if _prefetch_store is None:
+        with _prefetch_lock:
+            if _prefetch_store is None:
+                _prefetch_store = SqliteCache(config.PREFETCH_PATH, ttl=config.PREFETCH_VALID_SECONDS)
+    return _prefetch_store
+
+
+def _prefetch_key(group):
+    return "|".join(group)
+
+
+def _today():
+    from zoneinfo import ZoneInfo
+
+    return datetime.now(ZoneInfo(config.TIMEZONE)).date()
+
+
+def _geocode_groups(groups):
+    """Origin and destination coordinates by group.
+
+    Each distinct place is looked up once. A group with an unknown place, or
+    one the geocoder failed on, is logged and left out so the rest still run.
+    """
+    trips = {group: members[0] for group, members in groups.items()}
+    with stage("geocode"):
+        found = get_coordinates_many(
+            [trip["origin"] for trip in trips.values()] + [trip["destination"] for trip in trips.values()],
+            errors=True,
+        )
+    coordinates = {}
+    for group, trip in trips.items():
+        pair = found[trip["origin"]], found[trip["destination"]]
+        errors = [str(result) for result in pair if isinstance(result, Exception)]
+        if errors:
+            logger.warning("Subscription not geocoded", extra={
+                "origin": trip["origin"], "destination": trip["destination"], "errors": errors,
+            })
+            continue
+        coordinates[group] = pair
+    if len(coordinates) < len(groups):
+        emit("SubscriptionGeocodeFailures", len(groups) - len(coordinates))
+    return coordinates
+
+
+def _deliver(messages):
+    with stage("email"):
+        if config.EMAIL_DELIVERY == "outbox":
+            statuses = [queue_email(body, to=to, subject=subject) for to, body, subject in messages]
+        else:
+            statuses = send_emails(messages)
+    failed = sum(status == "Email Failed" for status in statuses)
+    return len(statuses) - failed, failed
+
+
+def run_prefetch(subscriptions=None, day=None):
+    """Prefetch phase: geocode and plan every subscribed trip ahead of delivery.
+
+    Plans are fetched with the ``tracked`` selection, so delivery can refresh
+    them from realtime trip times instead of planning again, and are stored
+    for PREFETCH_VALID_SECONDS.
+    """
+    if subscriptions is None:
+        subscriptions = load_subscriptions()
+    groups = group_subscriptions(subscriptions, day or _today())
+    if not groups:
+        return {"plans": 0, "prefetched": 0, "failed": 0}
+
+    coordinates = _geocode_groups(groups)
+    with stage("plan"):
+        plans = query_journeys_batch([
+            (origin, destination, group[2]) for group, (origin, destination) in coordinates.items()
+        ], fields="tracked")
+
+    prefetched = 0
+    for group, plan in zip(coordinates, plans):
+        if plan["data"]["planConnection"] is not None:
+            get_prefetch_store().set(_prefetch_key(group), {"plan": plan, "fetchedAt": time.time()})
+            prefetched += 1
+    return {"plans": len(groups), "prefetched": prefetched, "failed": len(groups) - len(coordinates)}
+
+
+def _refresh_prefetched(plan):
+    """Realtime refresh of a prefetched plan; None when it has to be planned again."""
+    try:
+        plan, _, infeasible = refresh(plan)
+    except UpstreamUnavailable:
+        return plan  # still inside its validity window
+    return None if infeasible else plan
+
+
+def _prefetched_plans(groups):
+    """Usable prefetched plans by group, refreshed when older than PREFETCH_REFRESH_AFTER."""
+    plans, stale = {}, []
+    for group in groups:
+        entry = get_prefetch_store().get(_prefetch_key(group))
+        if entry is None:
+            continue
+        if time.time() - entry["fetchedAt"] > config.PREFETCH_REFRESH_AFTER:
+            stale.append((group, entry["plan"]))
+        else:
+            plans[group] = entry["plan"]
+    if stale:
+        with stage("refresh"):
+            refreshed = run_concurrently(_refresh_prefetched, [(plan,) for _, plan in stale])
+        plans.update((group, plan) for (group, _), plan in zip(stale, refreshed) if plan is not None)
+    return plans
+
+
+def run_scheduled(subscriptions=None, day=None):
+    """Delivery phase: email each subscriber the plan for their trip.
+
+    Plans left by ``run_prefetch`` are used while inside their validity
+    window (refreshed from realtime trip times once older than
+    PREFETCH_REFRESH_AFTER); only the remaining trips are geocoded and planned
+    here, as concurrent aliased batches. Emails share one SMTP session (or
+    the outbox when EMAIL_DELIVERY=outbox). Subscribers whose trip could not
+    be geocoded or planned count as failed.
+    """
+    if subscriptions is None:
+        subscriptions = load_subscriptions()
+    groups = group_subscriptions(subscriptions, day or _today())
+    if not groups:
+        return {"subscribers": 0, "plans": 0, "sent": 0, "failed": 0}
+
+    plans = _prefetched_plans(groups)
+    emit("PrefetchedPlansUsed", len(plans))
+    pending = {group: members for group, members in groups.items() if group not in plans}
+    if pending:
+        coordinates = _geocode_groups(pending)
+        with stage("plan"):
+            planned = query_journeys_batch([
+                (origin, destination, group[2]) for group, (origin, destination) in coordinates.items()
+            ])
+        plans.update(zip(coordinates, planned))
+
+    messages = []
+    for group, members in groups.items():
+        trip, plan = members[0], plans.get(group)
+        if plan is None or plan["data"]["planConnection"] is None:
+            continue
+        journeys = filter_journeys(result=plan, origin=trip["origin"], destination=trip["destination"])
+        messages.extend((member["email"], journeys, "Journey Details") for member in members)
+
+    sent, failed = _deliver(messages)
+    return {
+        "subscribers": len(subscriptions),
+        "plans": len(groups),
+        "sent": sent,
+        "failed": failed + len(subscriptions) - len(messages),
+    }
+
+
+def run_refresh(subscriptions=None, day=None):
+    """Refresh every subscribed trip with realtime data; email only on meaningful changes.
+
+    Each trip is tracked (see ``realtime.track``): the first run plans it,
+    later runs only poll the trips its itineraries ride.
+    """
+    if subscriptions is None:
+        subscriptions = load_subscriptions()
+    groups = group_subscriptions(subscriptions, day or _today())
+    if not groups:
+        return {"plans": 0, "changed": 0, "sent": 0, "failed": 0}
+
+    coordinates = _geocode_groups(groups)
+    with stage("refresh"):
+        tracked = run_concurrently(track, [
+            (origin, destination, group[2]) for group, (origin, destination) in coordinates.items()
+        ])
+
+    messages, changed = [], 0
+    for group, (plan, changes) in zip(coordinates, tracked):
+        trip, members = groups[group][0], groups[group]
+        if plan["data"]["planConnection"] is None or not meaningful(changes):
+            continue
+        changed += 1
+        mark_notified(plan)
+        journeys = filter_journeys(result=plan, origin=trip["origin"], destination=trip["destination"])
+        messages.extend((member["email"], journeys, "Journey Update") for member in members)
+
+    sent, failed = _deliver(messages)
+    unlocated = sum(len(members) for group, members in groups.items() if group not in coordinates)
+    return {"plans": len(groups), "changed": changed, "sent": sent, "failed": failed + unlocated}
@@ -0,0 +1,76 @@
+import threading
+from datetime import datetime, timedelta
+
+from journey_service import config
+from . import http_client
+from .digitransit import query_journeys
+
+
+def step_count(window_start, window_end, step_minutes=None):
+    """Number of deadlines ``arrival_times`` would produce, without building them."""
+    step = step_minutes or config.SWEEP_STEP_MINUTES
+    if step <= 0:
+        raise ValueError("step must be positive")
+    span = datetime.strptime(window_end, "%Y%m%d%H%M%S") - datetime.strptime(window_start, "%Y%m%d%H%M%S")
+    return int(span.total_seconds() // (step * 60)) + 1 if span >= timedelta(0) else 0
+
+
+def arrival_times(window_start, window_end, step_minutes=None):
+    """yyyyMMddHHmmss arrival deadlines from ``window_start`` to ``window_end`` inclusive."""
+    if step_count(window_start, window_end, step_minutes) == 0:
+        return []
+    step = timedelta(minutes=step_minutes or config.SWEEP_STEP_MINUTES)
+    current = datetime.strptime(window_start, "%Y%m%d%H%M%S")
+    end = datetime.strptime(window_end, "%Y%m%d%H%M%S")
+    times = []
+    while current <= end:
+        times.append(current.strftime("%Y%m%d%H%M%S"))
+        current += step
+    return times
+
+
+def leg_signature(node):
+    """Identity of an itinerary: the same vehicles and walks at the same times."""
+    return tuple(
+        (leg["mode"], leg["from"]["name"], leg["to"]["name"], leg["start"]["scheduledTime"], leg["end"]["scheduledTime"])
+        for leg in node["legs"]
+    )
+
+
+def merge_plans(plans):
+    """One planConnection with each distinct itinerary once, ordered by departure."""
+    seen = {}
+    for plan in plans:
+        for edge in (plan["data"]["planConnection"] or {}).get("edges", []):
+            seen.setdefault(leg_signature(edge["node"]), edge)
+    edges = sorted(seen.values(), key=lambda edge: datetime.fromisoformat(edge["node"]["start"]))
+    return {"data": {"planConnection": {"edges": edges}}}
+
+
+def sweep(origin_coordinates, destination_coordinates, window_start, window_end, step_minutes=None,
+          max_concurrency=None, timeout=None):
+    """Plan every arrival deadline in a window and merge the results.
+
+    Neighbouring deadlines mostly return the same itineraries; they are
+    deduplicated by leg signature. At most ``max_concurrency`` plans are in
+    flight at once.
+    """
+    times = arrival_times(window_start, window_end, step_minutes)
+    plans = [None] * len(times)
+    pending = iter(enumerate(times))
+    lock = threading.Lock()
+
+    # A few workers pull deadlines off a shared iterator, rather than one
+    # pool task per deadline, so waiting deadlines do not hold pool threads
+    def worker():
+        while True:
+            with lock:
+                item = next(pending, None)
+            if item is None:
+                return
+            i, arrive_by = item
+            plans[i] = query_journeys(origin_coordinates, destination_coordinates, arrive_by, timeout, fields="expanded")
+
+    workers = min(max_concurrency or config.SWEEP_CONCURRENCY, len(times))
+    http_client.run_concurrently(worker, [()] * workers)
+    return merge_plans(plans)
@@ -0,0 +1,53 @@
+import json
+import os
+import subprocess
+import sys
+
+from benchmarks import fixtures
+from benchmarks.run import compare
+
+ROOT = os.path.join(os.path.dirname(__file__), "..")
+
+
+def test_large_plan_keeps_recorded_leg_shape():
+    plan = fixtures.large_plan(12)
+    edges = plan["data"]["planConnection"]["edges"]
+
+    assert len(edges) == 12
+    assert len({edge["node"]["start"] for edge in edges}) == 12
+    assert edges[0]["node"]["legs"][1]["mode"] == "SUBWAY"
+
+
+def test_compare_flags_regressions_in_both_directions():
+    baseline = {"filter_journeys.ops_per_s": 1000, "lambda_handler.p50_ms": 10}
+
+    assert compare({"filter_journeys.ops_per_s": 900, "lambda_handler.p50_ms": 12}, baseline, 0.25) == []
+    regressions = compare({"filter_journeys.ops_per_s": 700, "lambda_handler.p50_ms": 13}, baseline, 0.25)
+    assert len(regressions) == 2
+
+
+def test_benchmark_suite_runs_against_mock_server(tmp_path):
+    baseline = tmp_path / "baseline.json"
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join([os.path.join(ROOT, "src"), ROOT]))
+    subprocess.run(
+        [sys.executable, "-m", "benchmarks.run", "--iterations", "3", "--edges", "20",
+         "--baseline", str(baseline), "--update-baseline"],
+        cwd=ROOT, env=env, check=True, capture_output=True,
+    )
+
+    results = json.loads(baseline.read_text())
+    assert set(results) == {
+        "filter_journeys.ops_per_s",
+        "query_journeys.p50_ms", "query_journeys.p99_ms",
+        "lambda_handler.p50_ms", "lambda_handler.p99_ms",
+    }
+
+
+def test_loadtest_drives_standalone_server_against_mock_server():
+    from benchmarks.loadtest import run_load
+
+    results = run_load(workers=2, clients=4, total=40, distinct=4, latency=0)
+
+    assert results["errors"] == 0
+    assert results["upstream_plan"] <= 8  # four distinct trips, cached per worker
+    assert results["emails"] == 40
@@ -0,0 +1,78 @@
+from journey_service.cache import SqliteCache, TTLCache, normalize_query
+
+
+class FakeClock:
+    def __init__(self, now=1000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+def test_ttl_cache_expires_entries():
+    clock = FakeClock()
+    cache = TTLCache(maxsize=10, ttl=60, clock=clock)
+    cache.set("a", 1)
+    assert cache.get("a") == 1
+
+    clock.now += 61
+    assert cache.get("a") is None
+    assert cache.stats() == {"hits": 1, "misses": 1, "size": 0}
+
+
+def test_ttl_cache_keeps_expired_entries_for_stale_reads():
+    clock = FakeClock()
+    cache = TTLCache(maxsize=10, ttl=60, clock=clock, stale_ttl=300)
+    cache.set("a", 1)
+
+    clock.now += 61
+    assert cache.get("a") is None
+    assert cache.get_stale("a") == 1
+
+    clock.now += 300
+    assert cache.get("a") is None
+    assert cache.get_stale("a") is None
+
+
+def test_ttl_cache_evicts_least_recently_used():
+    cache = TTLCache(maxsize=2, ttl=60)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    cache.get("a")
+    cache.set("c", 3)
+
+    assert cache.get("b") is None
+    assert cache.get("a") == 1
+    assert cache.get("c") == 3
+
+
+def test_disk_tier_survives_new_memory_cache(tmp_path):
+    path = str(tmp_path / "geocode.sqlite")
+    TTLCache(disk=SqliteCache(path)).set("aalto-yliopisto", [24.83, 60.18])
+
+    cache = TTLCache(disk=SqliteCache(path))
+    assert cache.get("aalto-yliopisto") == [24.83, 60.18]
+    assert cache.disk.hits == 1
+    # Promoted into memory, so the disk tier is not consulted again
+    assert cache.get("aalto-yliopisto") == [24.83, 60.18]
+    assert cache.disk.hits == 1
+
+
+def test_disk_tier_evicts_and_expires(tmp_path):
+    clock = FakeClock()
+    disk = SqliteCache(str(tmp_path / "cache.sqlite"), maxsize=2, ttl=60, clock=clock)
+    disk.set("a", 1)
+    clock.now += 1
+    disk.set("b", 2)
+    clock.now += 1
+    disk.set("c", 3)
+
+    assert len(disk) == 2
+    assert disk.get("a") is None
+
+    clock.now += 120
+    assert disk.get("c") is None
+
+
+def test_normalize_query():
+    assert normalize_query("  Aalto-Yliopisto   (M) ") == "aalto-yliopisto (m)"
@@ -0,0 +1,15 @@
+import pytest
+from journey_service import config
+
+
+def test_settings_are_resolved_once(monkeypatch):
+    first = config.load()
+    monkeypatch.setenv("JOURNEY_COUNT", "99")
+
+    assert config.load() is first
+    assert config.JOURNEY_COUNT == first["JOURNEY_COUNT"]
+
+
+def test_unknown_setting_raises_attribute_error():
+    with pytest.raises(AttributeError):
+        config.NOT_A_SETTING
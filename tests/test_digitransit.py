@@ -1,27 +1,176 @@
 import pytest
 import requests
 from unittest.mock import patch, MagicMock
-from journey_service import digitransit
+from journey_service import config, digitransit, queries
+from journey_service.resilience import UpstreamUnavailable
 
-@patch("journey_service.digitransit.requests.get")
+
+@pytest.fixture(autouse=True)
+def clear_caches():
+    digitransit.get_geocode_cache().clear()
+    digitransit.get_plan_cache().clear()
+    yield
+    digitransit.get_geocode_cache().clear()
+    digitransit.get_plan_cache().clear()
+
+
+@patch("journey_service.digitransit.http_client.get")
 def test_get_coordinates_success(mock_get):
     # mock origin
     mock_origin = {"features": [{"geometry": {"coordinates": [24.8301, 60.1866]}}]}
     # mock destination
     mock_dest = {"features": [{"geometry": {"coordinates": [24.9301, 60.2166]}}]}
-    mock_get.side_effect = [
-        MagicMock(status_code=200, json=lambda: mock_origin),
-        MagicMock(status_code=200, json=lambda: mock_dest),
-    ]
+    responses = {"Aalto-yliopisto": mock_origin, "Keilaniemi": mock_dest}
+    mock_get.side_effect = lambda url, params, **kwargs: MagicMock(
+        status_code=200, json=lambda: responses[params["text"].strip()]
+    )
 
     origin, dest = digitransit.get_coordinates("Aalto-yliopisto", "Keilaniemi")
     assert origin == [24.8301, 60.1866]
     assert dest == [24.9301, 60.2166]
 
-@patch("journey_service.digitransit.requests.post")
+@patch("journey_service.digitransit.http_client.get")
+def test_get_coordinates_uses_cache_for_repeat_queries(mock_get):
+    mock_origin = {"features": [{"geometry": {"coordinates": [24.8301, 60.1866]}}]}
+    mock_dest = {"features": [{"geometry": {"coordinates": [24.9301, 60.2166]}}]}
+    responses = {"aalto-yliopisto": mock_origin, "keilaniemi": mock_dest}
+    mock_get.side_effect = lambda url, params, **kwargs: MagicMock(
+        status_code=200, json=lambda: responses[params["text"].strip().lower()]
+    )
+
+    digitransit.get_coordinates("Aalto-yliopisto", "Keilaniemi")
+    origin, dest = digitransit.get_coordinates("  aalto-YLIOPISTO ", "Keilaniemi")
+
+    assert mock_get.call_count == 2
+    assert origin == [24.8301, 60.1866]
+    assert dest == [24.9301, 60.2166]
+    assert digitransit.get_geocode_cache().hits == 2
+
+@patch("journey_service.digitransit.http_client.post")
 def test_query_journeys_success(mock_post):
     mock_response = {"data": {"planConnection": {"edges": []}}}
     mock_post.return_value = MagicMock(status_code=200, json=lambda: mock_response)
 
     result = digitransit.query_journeys([24.83, 60.18], [24.93, 60.21], "20250911084500")
     assert "planConnection" in result["data"]
+    assert mock_post.call_args.kwargs["timeout"] == config.ROUTING_TIMEOUT
+
+
+@patch("journey_service.digitransit.http_client.get")
+def test_get_coordinates_many_geocodes_each_name_once(mock_get):
+    mock_get.side_effect = lambda url, params, **kwargs: MagicMock(
+        status_code=200,
+        json=lambda: {"features": [{"geometry": {"coordinates": [len(params["text"]), 60.0]}}]},
+    )
+
+    coordinates = digitransit.get_coordinates_many(["Kamppi", "Keilaniemi", "kamppi", "Kamppi"])
+
+    assert mock_get.call_count == 2
+    assert coordinates["kamppi"] == coordinates["Kamppi"] == [6, 60.0]
+
+
+@patch("journey_service.digitransit.http_client.post")
+def test_query_journeys_batch_aliases_dedupes_and_chunks(mock_post):
+    def fake_post(url, json, **kwargs):
+        aliases = [line.split(":")[0].strip() for line in json["query"].splitlines() if "planConnection(" in line]
+        data = {alias: {"edges": [{"node": {"alias": alias, "legs": []}}]} for alias in aliases}
+        data["p1"] = None  # router failed on the second trip of each chunk
+        response = {"data": data, "errors": [{"message": "boom", "path": ["p1"]}]}
+        return MagicMock(status_code=200, json=lambda: response)
+
+    mock_post.side_effect = fake_post
+    a, b, c = [24.8, 60.1], [24.9, 60.2], [25.0, 60.3]
+    trips = [(a, b, "20250915084500"), (a, c, "20250915084500"), (a, b, "20250915084500"), (b, c, "20250915084500")]
+
+    results = digitransit.query_journeys_batch(trips, batch_size=2)
+
+    assert mock_post.call_count == 2  # 3 unique trips in chunks of 2
+    assert results[0] == results[2]
+    assert results[0]["data"]["planConnection"]["edges"][0]["node"]["alias"] == "p0"
+    assert results[1]["data"]["planConnection"] is None
+    assert results[1]["errors"][0]["message"] == "boom"
+    assert results[3]["data"]["planConnection"]["edges"][0]["node"]["alias"] == "p0"
+
+
+def make_plan(realtime_state):
+    legs = [{"mode": "WALK", "realtimeState": None}, {"mode": "BUS", "realtimeState": realtime_state}]
+    return {"data": {"planConnection": {"edges": [{"node": {"legs": legs}}]}}}
+
+
+@patch("journey_service.digitransit.http_client.post")
+def test_query_journeys_reuses_cached_plan_for_nearby_request(mock_post):
+    mock_post.return_value = MagicMock(status_code=200, json=lambda: make_plan("SCHEDULED"))
+
+    first = digitransit.query_journeys([24.83001, 60.18001], [24.93, 60.21], "20250915084510")
+    # ~1 m away and within the same arrival bucket
+    second = digitransit.query_journeys([24.83002, 60.18002], [24.93, 60.21], "20250915084550")
+
+    assert first is second
+    assert mock_post.call_count == 1
+    body = mock_post.call_args.kwargs["json"]
+    assert body["variables"]["dateTime"] == {"latestArrival": "2025-09-15T08:45:00+03:00"}
+    assert body["variables"]["origin"]["location"]["coordinate"] == {"latitude": 60.18001, "longitude": 24.83001}
+    assert body["query"] == queries.PLAN_QUERIES["text"]
+
+
+@patch("journey_service.digitransit.http_client.post")
+def test_query_journeys_misses_for_other_bucket(mock_post):
+    mock_post.return_value = MagicMock(status_code=200, json=lambda: make_plan("SCHEDULED"))
+
+    digitransit.query_journeys([24.83, 60.18], [24.93, 60.21], "20250915084500")
+    digitransit.query_journeys([24.83, 60.18], [24.93, 60.21], "20250915083000")
+
+    assert mock_post.call_count == 2
+
+
+def test_plan_ttl_depends_on_realtime_state():
+    assert digitransit.plan_ttl(make_plan("SCHEDULED")) == config.PLAN_CACHE_SCHEDULED_TTL
+    assert digitransit.plan_ttl(make_plan("UPDATED")) == config.PLAN_CACHE_REALTIME_TTL
+
+
+def test_plan_cache_key_shifts_weekend_to_monday():
+    saturday = digitransit.plan_cache_key([24.83, 60.18], [24.93, 60.21], "20250913084500")
+    monday = digitransit.plan_cache_key([24.83, 60.18], [24.93, 60.21], "20250915084500")
+    assert saturday == monday
+
+
+@patch("journey_service.digitransit.http_client.post")
+def test_query_journeys_serves_stale_plan_when_router_unavailable(mock_post):
+    plan = {"data": {"planConnection": {"edges": [{"node": {"legs": [{"realtimeState": "UPDATED"}]}}]}}}
+    mock_post.return_value = MagicMock(status_code=200, json=lambda: plan)
+    digitransit.query_journeys([24.83, 60.18], [24.93, 60.21], "20250911084500")
+    key = digitransit.plan_cache_key([24.83, 60.18], [24.93, 60.21], "20250911084500")
+    cache = digitransit.get_plan_cache()
+    cache._data[key] = (plan, cache.clock() - 1)  # expired, still within the stale window
+
+    mock_post.side_effect = UpstreamUnavailable("routing", "circuit open")
+    assert digitransit.query_journeys([24.83, 60.18], [24.93, 60.21], "20250911084500") == plan
+    with pytest.raises(UpstreamUnavailable):
+        digitransit.query_journeys([24.83, 60.18], [24.93, 60.21], "20250912084500")
+
+
+@patch("journey_service.digitransit.http_client.get")
+def test_geocode_raises_when_no_place_matches(mock_get):
+    mock_get.return_value = MagicMock(status_code=200, json=lambda: {"features": []})
+
+    with pytest.raises(digitransit.PlaceNotFound):
+        digitransit.geocode("Nowhere at all")
+
+
+@patch("journey_service.digitransit.post_query")
+def test_iter_plan_pages_follows_cursors_lazily(mock_post):
+    def page(cursor, more):
+        return {"data": {"planConnection": {"pageInfo": {"hasNextPage": more, "endCursor": cursor}, "edges": []}}}
+
+    mock_post.side_effect = [page("c1", True), page("c2", True), page(None, False)]
+
+    pages = digitransit.iter_plan_pages([24.8, 60.1], [24.9, 60.2], "20250915084500", page_size=3)
+    next(pages)
+    assert mock_post.call_count == 1  # nothing is fetched before it is consumed
+    rest = list(pages)
+
+    assert len(rest) == 2
+    cursors = [call.args[1]["after"] for call in mock_post.call_args_list]
+    assert cursors == [None, "c1", "c2"]
+    assert mock_post.call_args.args[1]["first"] == 3
+    assert mock_post.call_args.args[0] == queries.PAGE_QUERIES["text"]
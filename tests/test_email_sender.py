@@ -30,3 +30,16 @@ def test_send_email_failure():
 
         assert result == "Email Failed"
 
+
+def test_send_emails_reuses_one_session():
+    with patch.object(email_sender, "open_smtp") as mock_open:
+        server = mock_open.return_value.__enter__.return_value = mock_open.return_value
+        server.send_message.side_effect = [None, Exception("rejected")]
+
+        statuses = email_sender.send_emails([
+            ("a@example.com", ["one"], "Journey Details"),
+            ("b@example.com", ["two"], "Journey Details"),
+        ])
+
+    assert statuses == ["Email Sent", "Email Failed"]
+    mock_open.assert_called_once()
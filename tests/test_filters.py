@@ -1,6 +1,6 @@
 import pytest
 from datetime import datetime, timedelta
-from journey_service.filters import filter_journeys
+from journey_service.filters import filter_journeys, render_json, select_itineraries
 
 
 def make_leg(start_dt, end_dt, mode="BUS", from_name="Origin", to_name="Destination", duration=None):
@@ -87,3 +87,60 @@ def test_filter_journeys_multiple_legs_accumulates_duration():
     assert "0:15:00" in total_line
     assert total_line.endswith("min")
 
+
+
+def make_result(starts):
+    return {
+        "data": {
+            "planConnection": {
+                "edges": [
+                    {"node": {"start": start.isoformat(), "legs": [make_leg(start, start + timedelta(minutes=10))]}}
+                    for start in starts
+                ]
+            }
+        }
+    }
+
+
+def test_select_itineraries_keeps_latest_in_ascending_order():
+    now = datetime(2025, 9, 15, 8, 0, 0)
+    starts = [now + timedelta(minutes=m) for m in (7, 1, 9, 3, 5)]
+
+    itineraries = select_itineraries(make_result(starts), count=3)
+
+    assert [i.start.minute for i in itineraries] == [5, 7, 9]
+
+
+def test_render_json_replaces_origin_destination():
+    now = datetime(2025, 9, 15, 8, 0, 0)
+    journeys = render_json(select_itineraries(make_result([now])), "MyOrigin", "MyDestination")
+
+    assert journeys[0]["duration"] == 600
+    assert journeys[0]["legs"][0]["from"] == "MyOrigin"
+    assert journeys[0]["legs"][0]["to"] == "MyDestination"
+    assert journeys[0]["legs"][0]["start"] == now.isoformat()
+
+
+def test_iter_itineraries_filters_and_stops_without_pulling_more_pages():
+    now = datetime(2025, 9, 13, 7, 30, 0)
+    pulled = []
+
+    def pages():
+        for page in range(3):
+            pulled.append(page)
+            edges = []
+            for minutes, length in ((10 * page, 15), (10 * page + 5, 45)):
+                start = now + timedelta(minutes=minutes)
+                end = start + timedelta(minutes=length)
+                edges.append({"node": {"start": start.isoformat(), "end": end.isoformat(),
+                                       "legs": [make_leg(start, end)]}})
+            yield {"edges": edges}
+
+    from journey_service.filters import iter_itineraries
+
+    quick = list(iter_itineraries(pages(), limit=2, max_duration=30 * 60))
+    assert pulled == [0, 1]  # the third page was never requested
+    early = list(iter_itineraries(pages(), latest_departure=now + timedelta(minutes=5)))
+
+    assert [i.start.minute for i in quick] == [30, 40]
+    assert [i.start.minute for i in early] == [30, 35]
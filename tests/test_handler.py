@@ -1,7 +1,8 @@
 import json
 import pytest
 from datetime import datetime
-from journey_service import handler
+from journey_service import digitransit, handler
+from journey_service.resilience import UpstreamUnavailable
 from unittest.mock import patch 
 
 
@@ -23,11 +24,12 @@ def test_lambda_handler_missing_params():
 
 
 def test_lambda_handler_valid(monkeypatch):
-    def fake_start(origin, dest, arriveBy):
+    def fake_deliver(origin, dest, api_response, compact=False):
         return {"Journeys": ["test"], "Email Status": "Sent"}
 
-    # Replace real start() with fake
-    monkeypatch.setattr(handler, "start", fake_start)
+    # Replace planning and delivery with fakes
+    monkeypatch.setattr(handler, "plan_journeys", lambda origin, dest, arriveBy: {"data": {}})
+    monkeypatch.setattr(handler, "deliver_journeys", fake_deliver)
 
     event = {
         "queryStringParameters": {
@@ -85,3 +87,172 @@ def test_start_no_shift_weekday(mock_dependencies):
     # Should not shift
     assert result["Email Status"] == "Email Sent"
     assert isinstance(result["Journeys"], list)
+
+
+def test_lambda_handler_batch(monkeypatch):
+    def fake_get_coordinates_many(names, errors=False):
+        return {name: [24.0 + len(name) / 100, 60.0] for name in names}
+
+    def fake_query_journeys_batch(trips):
+        return [{"data": {"planConnection": {"edges": []}}}, {"data": {"planConnection": None}, "errors": [{"message": "no route"}]}]
+
+    monkeypatch.setattr(handler, "get_coordinates_many", fake_get_coordinates_many)
+    monkeypatch.setattr(handler, "query_journeys_batch", fake_query_journeys_batch)
+    monkeypatch.setattr(handler, "filter_journeys", lambda result, origin, destination: [f"{origin}->{destination}"])
+
+    event = {
+        "httpMethod": "POST",
+        "body": json.dumps({"trips": [
+            {"origin": "Aalto", "destination": "Keilaniemi", "arriveBy": "20250913084500"},
+            {"origin": "Kamppi", "destination": "Keilaniemi", "arriveBy": "20250915084500"},
+        ]}),
+    }
+    result = handler.lambda_handler(event, FakeContext())
+    body = json.loads(result["body"])
+
+    assert result["statusCode"] == 200
+    assert body["message"][0]["Journeys"] == ["Aalto->Keilaniemi"]
+    assert body["message"][0]["arriveBy"] == "20250915084500"  # Saturday -> Monday
+    assert body["message"][1]["error"] == "no route"
+
+
+def test_lambda_handler_batch_reports_geocoding_failures_per_trip(monkeypatch):
+    def fake_geocode(text, timeout=None):
+        if text == "Nowhere":
+            raise digitransit.PlaceNotFound(f"No results found for '{text}'")
+        if text == "Otaniemi":
+            raise UpstreamUnavailable("geocode", "circuit open")
+        return [24.8, 60.1]
+
+    planned = []
+    monkeypatch.setattr(digitransit, "geocode", fake_geocode)
+    monkeypatch.setattr(handler, "query_journeys_batch",
+                        lambda trips: planned.extend(trips) or [{"data": {"planConnection": {"edges": []}}}] * len(trips))
+    monkeypatch.setattr(handler, "filter_journeys", lambda result, origin, destination: [f"{origin}->{destination}"])
+
+    trips = [
+        {"origin": "Aalto", "destination": "Keilaniemi", "arriveBy": "20250915084500"},
+        {"origin": "Nowhere", "destination": "Keilaniemi", "arriveBy": "20250915084500"},
+        {"origin": "Aalto", "destination": "Otaniemi", "arriveBy": "20250915084500"},
+    ]
+    result = handler.lambda_handler({"httpMethod": "POST", "body": json.dumps({"trips": trips})}, FakeContext())
+    body = json.loads(result["body"])
+
+    assert result["statusCode"] == 200
+    assert len(planned) == 1
+    assert body["message"][0]["Journeys"] == ["Aalto->Keilaniemi"]
+    assert body["message"][1]["error"] == "No results found for 'Nowhere'"
+    assert "circuit open" in body["message"][2]["error"]
+
+
+def test_lambda_handler_batch_rejects_bad_body():
+    result = handler.lambda_handler({"httpMethod": "POST", "body": json.dumps({"trips": [{"origin": "Aalto"}]})}, FakeContext())
+    assert result["statusCode"] == 400
+
+    bad_time = {"trips": [{"origin": "Aalto", "destination": "Keilaniemi", "arriveBy": "2025-09-15 08:45"}]}
+    result = handler.lambda_handler({"httpMethod": "POST", "body": json.dumps(bad_time)}, FakeContext())
+    assert result["statusCode"] == 400
+    assert "yyyyMMddHHmmss" in json.loads(result["body"])["error"]
+
+    params = {"origin": "Aalto", "destination": "Keilaniemi", "arriveBy": "tomorrow"}
+    result = handler.lambda_handler({"queryStringParameters": params}, FakeContext())
+    assert result["statusCode"] == 400
+
+    result = handler.lambda_handler({"httpMethod": "POST", "body": "not json"}, FakeContext())
+    assert result["statusCode"] == 400
+
+
+def test_lambda_handler_maps_upstream_outage_to_503(monkeypatch):
+    def unavailable(origin, destination, arrive_by):
+        raise UpstreamUnavailable("routing", "circuit open", retry_after=12.4)
+
+    monkeypatch.setattr(handler, "plan_journeys", unavailable)
+    event = {"queryStringParameters": {"origin": "Aalto", "destination": "Keilaniemi", "arriveBy": "20250915084500"}}
+
+    result = handler.lambda_handler(event, FakeContext())
+
+    assert result["statusCode"] == 503
+    assert result["headers"]["Retry-After"] == "12"
+
+
+def test_start_queues_email_in_outbox_mode(mock_dependencies, monkeypatch):
+    monkeypatch.setattr(handler.config, "EMAIL_DELIVERY", "outbox")
+    with patch.object(handler, "queue_email", return_value="Email Queued") as queue:
+        result = handler.start("Aalto", "Keilaniemi", "20250915093000")
+
+    queue.assert_called_once_with(body_text=["trip1", "trip2"])
+    assert result["Email Status"] == "Email Queued"
+
+
+def test_lambda_handler_scheduled_event_runs_subscriptions(monkeypatch):
+    monkeypatch.setattr(handler, "run_scheduled", lambda: {"subscribers": 2, "plans": 1, "sent": 2, "failed": 0})
+
+    result = handler.lambda_handler({"source": "aws.events", "detail-type": "Scheduled Event"}, FakeContext())
+
+    assert result["statusCode"] == 200
+    assert json.loads(result["body"])["message"]["sent"] == 2
+
+
+def test_stream_mode_yields_ndjson_itineraries_and_lambda_collects_them():
+    node = {"start": "2025-09-15T08:00:00+03:00", "end": "2025-09-15T08:20:00+03:00", "legs": [{
+        "from": {"name": "Origin"}, "to": {"name": "Destination"},
+        "start": {"scheduledTime": "2025-09-15T08:00:00+03:00"}, "end": {"scheduledTime": "2025-09-15T08:20:00+03:00"},
+        "mode": "BUS", "duration": 1200.0, "realtimeState": "SCHEDULED", "route": {"shortName": "550"},
+    }]}
+    pages = [{"edges": [{"node": node}, {"node": node}]}, {"edges": [{"node": node}]}]
+    event = {"queryStringParameters": {"origin": "Aalto", "destination": "Keilaniemi",
+                                       "arriveBy": "20250915084500", "stream": "true", "count": "3"}}
+
+    with patch.object(handler, "get_coordinates", return_value=([24.8, 60.1], [24.9, 60.2])), \
+         patch.object(handler, "iter_plan_pages", side_effect=lambda *a, **kw: (page for page in pages)):
+        streamed = handler.handle_event(event)
+        lines = list(streamed["body"])
+        collected = handler.lambda_handler(event, FakeContext())
+        invalid = handler.handle_event({"queryStringParameters": dict(event["queryStringParameters"], count="x")})
+
+    assert streamed["headers"]["Content-Type"] == "application/x-ndjson"
+    assert len(lines) == 3
+    leg = json.loads(lines[0])["legs"][0]
+    assert (leg["from"], leg["route"]) == ("Aalto", "550")
+    assert collected["body"] == "".join(lines)
+    assert invalid["statusCode"] == 400
+
+
+def test_unchanged_plan_gets_304_without_render_or_email(mock_dependencies):
+    params = {"origin": "Aalto", "destination": "Keilaniemi", "arriveBy": "20250915093000"}
+    with patch.object(handler, "deliver_journeys", wraps=handler.deliver_journeys) as deliver:
+        first = handler.handle_event({"queryStringParameters": params})
+        etag = first["headers"]["ETag"]
+        again = handler.handle_event({"queryStringParameters": params, "headers": {"If-None-Match": etag}})
+        gzipped = handler.handle_event({"queryStringParameters": params,
+                                        "headers": {"if-none-match": 'W/' + etag[:-1] + '-gzip"'}})
+        other = handler.handle_event({"queryStringParameters": dict(params, destination="Kamppi"),
+                                      "headers": {"If-None-Match": etag}})
+
+    assert first["statusCode"] == 200
+    assert (again["statusCode"], again["body"], again["headers"]["ETag"]) == (304, "", etag)
+    assert gzipped["statusCode"] == 304
+    assert other["statusCode"] == 200 and other["headers"]["ETag"] != etag
+    assert deliver.call_count == 2
+
+
+def test_compact_accept_type_returns_positional_journeys(monkeypatch):
+    leg = {"from": {"name": "Origin"}, "to": {"name": "Destination"},
+           "start": {"scheduledTime": "2025-09-15T08:00:00+03:00"}, "end": {"scheduledTime": "2025-09-15T08:20:00+03:00"},
+           "mode": "BUS", "duration": 1200.0, "realtimeState": "SCHEDULED"}
+    plan = {"data": {"planConnection": {"edges": [{"node": {
+        "start": "2025-09-15T08:00:00+03:00", "end": "2025-09-15T08:20:00+03:00", "legs": [leg]}}]}}}
+    monkeypatch.setattr(handler, "plan_journeys", lambda origin, destination, arrive_by: plan)
+    monkeypatch.setattr(handler, "send_email", lambda body_text: "Email Sent")
+    event = {"queryStringParameters": {"origin": "Aalto", "destination": "Keilaniemi", "arriveBy": "20250915093000"}}
+
+    compact = handler.handle_event(dict(event, headers={"Accept": handler.COMPACT_TYPE}))
+    verbose = handler.handle_event(event)
+
+    body = json.loads(compact["body"])
+    assert compact["headers"]["Content-Type"] == handler.COMPACT_TYPE
+    assert body["journeys"] == [[1757912400, 1757913600, [["Aalto", "Keilaniemi", 1757912400, 1757913600,
+                                                          "BUS", 1200.0, "SCHEDULED"]]]]
+    assert body["emailStatus"] == "Email Sent"
+    assert compact["headers"]["ETag"] != verbose["headers"]["ETag"]
+    assert len(compact["body"]) < len(verbose["body"])
@@ -0,0 +1,146 @@
+from datetime import datetime, timedelta, timezone
+from unittest.mock import patch
+import numpy as np
+import pytest
+from journey_service import digitransit, history, queries
+
+AALTO, KEILANIEMI = [24.8268, 60.1848], [24.8275, 60.1755]
+HELSINKI = timezone(timedelta(hours=3))
+
+
+def selected(value, selection):
+    """``value`` cut down to the fields a GraphQL selection asks for."""
+    tokens, shape, stack = selection.split(), {}, []
+    for i, token in enumerate(tokens):
+        if token == "{":
+            stack.append(shape)
+            shape[tokens[i - 1]] = shape = {}
+        elif token == "}":
+            shape = stack.pop()
+        else:
+            shape[token] = None
+
+    def cut(value, shape):
+        if shape is None or value is None:
+            return value
+        return {key: cut(value[key], sub) for key, sub in shape.items() if key in value}
+
+    return cut(value, shape)
+
+
+def plan(depart, minutes, route="550", delay=0, fields="text"):
+    """A router answer to ``fields``: only the leg fields that selection requests."""
+    start = datetime(2025, 9, 15, *depart, tzinfo=HELSINKI)
+    end = start + timedelta(minutes=minutes)
+    leg = {
+        "from": {"name": "A", "stop": {"gtfsId": "HSL:1"}}, "to": {"name": "B", "stop": {"gtfsId": "HSL:2"}},
+        "start": {"scheduledTime": start.isoformat(),
+                  "estimated": {"time": (start + timedelta(seconds=delay)).isoformat()}},
+        "end": {"scheduledTime": end.isoformat(),
+                "estimated": {"time": (end + timedelta(seconds=delay)).isoformat()}},
+        "mode": "BUS", "duration": minutes * 60.0, "realtimeState": "UPDATED", "distance": 9000.0,
+        "route": {"shortName": route}, "serviceDate": "20250915", "trip": {"gtfsId": "HSL:550_1"},
+    }
+    return {"data": {"planConnection": {"edges": [
+        {"node": {"start": start.isoformat(), "end": end.isoformat(),
+                  "legs": [selected(leg, queries.LEG_FIELDS[fields])]}},
+    ]}}}
+
+
+def fill(store):
+    arrive_by = datetime(2025, 9, 15, 9, 0, tzinfo=HELSINKI)
+    for day, minutes in enumerate([20, 22, 25, 30, 40]):
+        recorded = datetime(2025, 9 + day // 3, 1 + day, tzinfo=timezone.utc).timestamp()
+        store.record(plan((8, 0), minutes, delay=60 * day), AALTO, KEILANIEMI, arrive_by, recorded)
+    store.record(plan((7, 0), 15, route="E"), AALTO, KEILANIEMI, arrive_by, recorded)
+
+
+def test_records_are_appended_to_monthly_partitions_and_memory_mapped(tmp_path):
+    store = history.HistoryStore(str(tmp_path))
+    fill(store)
+    with open(store.partitions()[-1], "ab") as f:
+        f.write(b"torn")  # a crash mid-write leaves a partial record behind
+
+    records = store.records()
+
+    assert [p[-10:-4] for p in store.partitions()] == ["202509", "202510"]
+    assert len(records) == 6
+    assert len(store.records(since="202510")) == 3
+    assert isinstance(store.records(until="202509"), np.memmap)
+    assert records["route"][0] == b"550"
+    assert records["start"][1] - records["scheduled_start"][1] == 60
+
+
+def test_duration_and_delay_percentiles_are_grouped_by_local_hour(tmp_path):
+    store = history.HistoryStore(str(tmp_path))
+    fill(store)
+    records = store.records()
+
+    durations = history.duration_by_hour(records)
+    delays = history.delay_by_route(records)
+    by_partition = history.duration_by_hour(store.partition_records())
+
+    assert all(isinstance(part, np.memmap) for part in store.partition_records())
+    assert by_partition["count"].tolist() == durations["count"].tolist()
+    assert durations["hour"].tolist() == [7, 8]
+    assert durations["count"].tolist() == [1, 5]
+    assert (durations["p50"][1], durations["p90"][1]) == (25 * 60, 40 * 60)
+    assert delays["route"].tolist() == ["550", "E"]
+    assert (delays["p50"][0], delays["p90"][0]) == (120, 240)
+
+
+def test_leave_by_uses_the_percentile_duration_before_the_arrival(tmp_path):
+    store = history.HistoryStore(str(tmp_path))
+    fill(store)
+    records = store.records()
+
+    assert history.leave_by(records, AALTO, KEILANIEMI, "09:00", percentile=90) == "08:20"
+    assert history.leave_by(records, AALTO, KEILANIEMI, "09:00", percentile=50) == "08:35"
+    assert history.leave_by(records, KEILANIEMI, AALTO, "09:00") is None
+
+
+@patch("journey_service.digitransit.post_query")
+def test_fetched_plans_are_recorded_when_history_is_configured(mock_post, tmp_path, monkeypatch):
+    monkeypatch.setattr(history, "_history", history.HistoryStore(str(tmp_path)))
+    monkeypatch.setattr(history, "_history_loaded", True)
+    mock_post.return_value = plan((8, 0), 20)
+    digitransit.get_plan_cache().clear()
+
+    digitransit.query_journeys(AALTO, KEILANIEMI, "20250915090000")
+    digitransit.query_journeys(AALTO, KEILANIEMI, "20250915090000")  # cache hit: not recorded again
+
+    [record] = history.get_history().records()
+    assert record["trip"] == history.trip_id(AALTO, KEILANIEMI)
+    assert record["arrive_by"] == int(datetime(2025, 9, 15, 6, 0, tzinfo=timezone.utc).timestamp())
+    digitransit.get_plan_cache().clear()
+
+
+@pytest.mark.parametrize("fields", history.RECORDED_FIELDS)
+def test_recorded_selections_carry_route_and_realtime_start(tmp_path, fields):
+    store = history.HistoryStore(str(tmp_path))
+    arrive_by = datetime(2025, 9, 15, 9, 0, tzinfo=HELSINKI)
+    store.record(plan((8, 0), 20, delay=90, fields=fields), AALTO, KEILANIEMI, arrive_by)
+
+    [record] = store.records()
+    assert record["route"] == b"550"
+    assert record["start"] - record["scheduled_start"] == 90
+    assert history.delay_by_route(store.records())["p50"].tolist() == [90]
+
+
+@patch("journey_service.digitransit.post_query")
+def test_matrix_plans_without_leg_times_are_not_recorded(mock_post, tmp_path, monkeypatch):
+    monkeypatch.setattr(history, "_history", history.HistoryStore(str(tmp_path)))
+    monkeypatch.setattr(history, "_history_loaded", True)
+    matrix_plan = {"data": {"planConnection": {"edges": [
+        {"node": {"start": "2025-09-15T08:00:00+03:00", "end": "2025-09-15T08:20:00+03:00",
+                  "legs": [{"mode": "BUS", "duration": 1200.0, "realtimeState": "SCHEDULED"}]}},
+    ]}}}
+    mock_post.return_value = matrix_plan
+    digitransit.get_plan_cache().clear()
+
+    with patch.object(digitransit, "emit") as mock_emit:
+        digitransit.query_journeys(AALTO, KEILANIEMI, "20250915090000", fields="matrix")
+
+    assert len(history.get_history().records()) == 0
+    mock_emit.assert_not_called()
+    digitransit.get_plan_cache().clear()
@@ -0,0 +1,98 @@
+import threading
+import pytest
+from unittest.mock import MagicMock
+from journey_service import config, http_client
+from journey_service.resilience import UpstreamUnavailable
+
+
+@pytest.fixture(autouse=True)
+def fresh_client():
+    http_client.close()
+    yield
+    http_client.close()
+
+
+def test_session_is_shared_between_calls():
+    session = http_client.get_session()
+    assert http_client.get_session() is session
+    assert session.get_adapter("https://api.digitransit.fi")._pool_maxsize == config.HTTP_POOL_SIZE
+
+
+def test_run_concurrently_preserves_order_and_overlaps():
+    barrier = threading.Barrier(2, timeout=2)
+
+    def work(value):
+        barrier.wait()  # only passes if both calls are in flight together
+        return value * 2
+
+    assert http_client.run_concurrently(work, [(1,), (2,)]) == [2, 4]
+
+
+def test_timeout_is_passed_as_connect_read_tuple(monkeypatch):
+    captured = {}
+
+    def fake_get(url, **kwargs):
+        captured.update(kwargs)
+        return MagicMock(status_code=200, content=b"{}")
+
+    monkeypatch.setattr(http_client.get_session(), "get", fake_get)
+    http_client.get("https://example.invalid", timeout=4)
+    assert captured["timeout"] == (config.HTTP_CONNECT_TIMEOUT, 4)
+
+
+def test_throttled_and_failed_responses_are_retried(monkeypatch):
+    responses = iter([
+        MagicMock(status_code=429, content=b"", headers={"Retry-After": "0"}),
+        MagicMock(status_code=503, content=b"", headers={}),
+        MagicMock(status_code=200, content=b"{}", headers={}),
+    ])
+    monkeypatch.setattr(http_client.get_session(), "get", lambda url, **kwargs: next(responses))
+    monkeypatch.setattr(http_client.time, "sleep", lambda seconds: None)
+    limit = http_client.get_limiter().limit
+
+    response = http_client.get("https://example.invalid", timeout=4)
+
+    assert response.status_code == 200
+    assert http_client.get_limiter().limit < limit
+
+
+def test_open_breaker_fails_fast_with_upstream_unavailable(monkeypatch):
+    calls = []
+
+    def failing_get(url, **kwargs):
+        calls.append(url)
+        return MagicMock(status_code=502, content=b"", headers={})
+
+    monkeypatch.setattr(http_client.get_session(), "get", failing_get)
+    monkeypatch.setattr(http_client.time, "sleep", lambda seconds: None)
+
+    for _ in range(2):
+        with pytest.raises(UpstreamUnavailable):
+            http_client.get("https://example.invalid", service="routing")
+    attempts = len(calls)
+    with pytest.raises(UpstreamUnavailable, match="circuit open"):
+        http_client.get("https://example.invalid", service="routing")
+
+    assert attempts == config.BREAKER_THRESHOLD
+    assert len(calls) == attempts
+
+
+def test_named_pools_get_their_own_session():
+    assert http_client.get_session("waltti") is http_client.get_session("waltti")
+    assert http_client.get_session("waltti") is not http_client.get_session()
+
+
+def test_throttled_half_open_probe_does_not_wedge_the_breaker(monkeypatch):
+    breaker = http_client.get_breaker("routing")
+    for _ in range(config.BREAKER_THRESHOLD):
+        breaker.record_failure()
+    breaker.opened_at -= config.BREAKER_RESET_SECONDS
+    responses = iter([
+        MagicMock(status_code=429, content=b"", headers={"Retry-After": "0"}),
+        MagicMock(status_code=200, content=b"{}", headers={}),
+    ])
+    monkeypatch.setattr(http_client.get_session(), "get", lambda url, **kwargs: next(responses))
+    monkeypatch.setattr(http_client.time, "sleep", lambda seconds: None)
+
+    assert http_client.get("https://example.invalid", service="routing").status_code == 200
+    assert breaker.state == "closed"
@@ -0,0 +1,88 @@
+import json
+import sys
+import threading
+from unittest.mock import MagicMock
+import pytest
+from journey_service import config, instrumentation
+from journey_service.cache import TTLCache
+
+
+@pytest.fixture
+def emitted(monkeypatch):
+    recorded = []
+    monkeypatch.setattr(instrumentation.metrics, "add_metric", lambda name, unit, value: recorded.append((name, value)))
+    monkeypatch.setattr(config, "METRICS_SINK_PATH", None)
+    return recorded
+
+
+def test_stage_emits_latency_and_writes_local_sink(emitted, monkeypatch, tmp_path):
+    sink = tmp_path / "metrics.jsonl"
+    monkeypatch.setattr(config, "METRICS_SINK_PATH", str(sink))
+
+    with instrumentation.stage("geocode"):
+        pass
+
+    assert emitted[0][0] == "GeocodeLatency"
+    assert emitted[0][1] >= 0
+    record = json.loads(sink.read_text().splitlines()[0])
+    assert record["metric"] == "GeocodeLatency"
+    assert record["unit"] == "Milliseconds"
+
+
+def test_stage_records_even_when_body_raises(emitted):
+    with pytest.raises(ValueError):
+        with instrumentation.stage("plan"):
+            raise ValueError("upstream down")
+
+    assert [name for name, _ in emitted] == ["PlanLatency"]
+
+
+def test_record_upstream_status_and_size(emitted):
+    instrumentation.record_upstream("routing", MagicMock(status_code=503, content=b"x" * 42))
+
+    assert emitted == [("RoutingStatus5xx", 1), ("RoutingResponseBytes", 42)]
+
+
+def test_record_cache_emits_per_invocation_deltas(emitted):
+    cache = TTLCache()
+    cache.set("a", 1)
+    cache.get("a")
+    cache.get("b")
+    instrumentation.record_cache("test", cache)
+    cache.get("a")
+    instrumentation.record_cache("test", cache)
+
+    assert emitted[:3] == [("TestCacheHits", 1), ("TestCacheMisses", 1), ("TestCacheHitRate", 50.0)]
+    assert emitted[3:] == [("TestCacheHits", 1), ("TestCacheMisses", 0), ("TestCacheHitRate", 100.0)]
+
+
+def test_concurrent_emits_survive_the_auto_flush(monkeypatch, capsys):
+    from aws_lambda_powertools import Metrics
+
+    monkeypatch.setattr(config, "METRICS_SINK_PATH", None)
+    monkeypatch.setattr(instrumentation, "metrics", Metrics(namespace="Test", service="Test"))
+    barrier, errors = threading.Barrier(8), []
+
+    def worker(i):
+        barrier.wait()
+        try:
+            for n in range(300):
+                instrumentation.record_upstream(f"pool_{i}_{n % 40}", MagicMock(status_code=200, content=b"x"))
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(8)]
+    # Switch threads often so adds land in the middle of a flush
+    interval = sys.getswitchinterval()
+    sys.setswitchinterval(1e-6)
+    try:
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    finally:
+        sys.setswitchinterval(interval)
+    instrumentation.metrics.clear_metrics()
+
+    assert errors == []
+    assert '"_aws"' in capsys.readouterr().out  # flushed along the way
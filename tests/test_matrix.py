@@ -0,0 +1,93 @@
+import base64
+import io
+import json
+import numpy as np
+from unittest.mock import patch
+from journey_service import handler, matrix
+
+
+def leg(mode, start, end):
+    return {
+        "from": {"name": "Origin"}, "to": {"name": "Destination"},
+        "start": {"scheduledTime": f"2025-09-15T{start}:00+03:00"},
+        "end": {"scheduledTime": f"2025-09-15T{end}:00+03:00"},
+        "mode": mode, "duration": 60.0 * (int(end[3:]) - int(start[3:])), "realtimeState": None,
+    }
+
+
+def plan(*itineraries):
+    edges = [{"node": {"start": legs[0]["start"]["scheduledTime"], "end": legs[-1]["end"]["scheduledTime"],
+                       "legs": legs}} for legs in itineraries]
+    return {"data": {"planConnection": {"edges": edges}}}
+
+
+PLANS = {
+    # pair (A, X): fastest is a 20 min bus with 5 min walk; median of 20, 30, 40 is 30
+    ("A", "X"): plan(
+        [leg("WALK", "08:00", "08:05"), leg("BUS", "08:05", "08:20")],
+        [leg("BUS", "08:10", "08:40")],
+        [leg("BUS", "08:00", "08:10"), leg("TRAM", "08:15", "08:40")],
+    ),
+    ("A", "Y"): plan([leg("BUS", "08:00", "08:10"), leg("SUBWAY", "08:12", "08:30")]),
+    ("B", "X"): {"data": {"planConnection": None}, "errors": [{"message": "No route"}]},
+    ("B", "Y"): plan([leg("WALK", "08:00", "08:45")], [leg("BUS", "08:20", "08:30")]),
+}
+COORDINATES = {"A": [24.1, 60.1], "B": [24.2, 60.2], "X": [24.3, 60.3], "Y": [24.4, 60.4]}
+
+
+def fake_batch(trips, timeout=None, fields="text"):
+    names = {tuple(v): k for k, v in COORDINATES.items()}
+    return [PLANS[(names[tuple(o)], names[tuple(d)])] for o, d, _ in trips]
+
+
+def run_matrix():
+    with patch.object(matrix, "get_coordinates_many", return_value=COORDINATES) as mock_geocode, \
+         patch.object(matrix, "query_journeys_batch", side_effect=fake_batch):
+        result = matrix.travel_time_matrix(["A", "B"], ["X", "Y"], "20250915084500")
+    return result, mock_geocode
+
+
+def test_matrix_aggregates_fastest_itinerary_and_median_per_pair():
+    result, mock_geocode = run_matrix()
+
+    mock_geocode.assert_called_once_with(["A", "B", "X", "Y"], None)
+    np.testing.assert_array_equal(result["duration"], [[1200, 1800], [np.nan, 600]])
+    np.testing.assert_array_equal(result["median_duration"], [[1800, 1800], [np.nan, 1650]])
+    np.testing.assert_array_equal(result["transfers"], [[0, 1], [np.nan, 0]])
+    np.testing.assert_array_equal(result["walk"], [[300, 0], [np.nan, 0]])
+    np.testing.assert_array_equal(result["summary"]["by_origin"]["min"], [1200, 600])
+    np.testing.assert_array_equal(result["summary"]["by_destination"]["median"], [1200, 1200])
+
+
+def test_matrix_encodings_mark_unreachable_pairs():
+    result, _ = run_matrix()
+
+    body = matrix.to_json(result, ["A", "B"], ["X", "Y"], "20250915084500")
+    archive = np.load(io.BytesIO(base64.b64decode(matrix.to_npz(result, ["A", "B"], ["X", "Y"]))))
+
+    assert body["duration"] == [[1200.0, 1800.0], [None, 600.0]]
+    assert json.dumps(body)
+    assert list(archive["origins"]) == ["A", "B"]
+    assert np.isnan(archive["duration"][1, 0]) and archive["duration"].dtype == np.float32
+
+
+def test_handler_matrix_route_validates_size():
+    body = json.dumps({"origins": ["A"] * 51, "destinations": ["X"] * 50, "arriveBy": "20250915084500"})
+
+    response = handler._matrix_response(body)
+    missing = handler._matrix_response(json.dumps({"origins": ["A"]}))
+
+    assert response["statusCode"] == 400
+    assert missing["statusCode"] == 400
+
+
+def test_handler_matrix_route_rejects_bad_arrive_by_and_places():
+    def matrix_event(**request):
+        body = dict({"origins": ["A"], "destinations": ["X"], "arriveBy": "20250915084500"}, **request)
+        return {"httpMethod": "POST", "path": "/journeys/matrix", "body": json.dumps(body)}
+
+    for event in (matrix_event(arriveBy="2025-09-15T08:45"), matrix_event(arriveBy=20250915084500),
+                  matrix_event(origins=[{"lat": 60.1}]), matrix_event(destinations=[None])):
+        response = handler.handle_event(event)
+        assert response["statusCode"] == 400
+        assert json.loads(response["body"])["error"]
@@ -0,0 +1,52 @@
+from datetime import datetime
+from journey_service.models import Itinerary, Leg
+
+
+def make_node():
+    return {
+        "start": "2025-09-15T08:19:52+03:00",
+        "end": "2025-09-15T08:31:27+03:00",
+        "legs": [
+            {
+                "from": {"name": "Origin"}, "to": {"name": "Keilaniemi"},
+                "start": {"scheduledTime": "2025-09-15T08:19:52+03:00"},
+                "end": {"scheduledTime": "2025-09-15T08:24:00+03:00"},
+                "mode": "SUBWAY", "duration": 248, "realtimeState": "UPDATED",
+            },
+            {
+                "from": {"name": "Keilaniemi"}, "to": {"name": "Destination"},
+                "start": {"scheduledTime": "2025-09-15T08:24:00+03:00"},
+                "end": {"scheduledTime": "2025-09-15T08:31:27+03:00"},
+                "mode": "WALK", "duration": 447,
+            },
+        ],
+    }
+
+
+def test_itinerary_from_node_parses_timestamps():
+    itinerary = Itinerary.from_node(make_node())
+
+    assert itinerary.start == datetime.fromisoformat("2025-09-15T08:19:52+03:00")
+    assert itinerary.duration == 695
+    assert itinerary.legs[0].realtime_state == "UPDATED"
+    assert itinerary.legs[1].realtime_state is None
+    assert itinerary.legs[1].end.strftime("%H:%M:%S") == "08:31:27"
+
+
+def test_models_use_slots():
+    leg = Itinerary.from_node(make_node()).legs[0]
+    assert not hasattr(leg, "__dict__")
+    assert Leg.__slots__ and Itinerary.__slots__
+
+
+def test_to_dict_round_trips_times():
+    data = Itinerary.from_node(make_node()).to_dict()
+    assert data["start"] == "2025-09-15T08:19:52+03:00"
+    assert data["legs"][0]["mode"] == "SUBWAY"
+
+
+def test_leg_keeps_route_name_from_expanded_selection():
+    leg = make_node()["legs"][0]
+
+    assert "route" not in Leg.from_dict(leg).to_dict()
+    assert Leg.from_dict(dict(leg, route={"shortName": "M1"})).to_dict()["route"] == "M1"
@@ -0,0 +1,98 @@
+import socketserver
+import threading
+import pytest
+from journey_service import config, notifier, outbox
+from journey_service.outbox import Outbox
+
+
+class SMTPStandIn(socketserver.StreamRequestHandler):
+    """Just enough SMTP for smtplib: EHLO, MAIL, RCPT, DATA, QUIT."""
+
+    def reply(self, line):
+        self.wfile.write((line + "\r\n").encode())
+
+    def handle(self):
+        self.reply("220 localhost stand-in")
+        while True:
+            line = self.rfile.readline().decode().strip()
+            verb = line.split(" ")[0].upper()
+            if not line or verb == "QUIT":
+                self.reply("221 bye")
+                return
+            if verb in ("EHLO", "HELO"):
+                self.reply("250 localhost")
+            elif verb == "DATA":
+                self.reply("354 go ahead")
+                data = []
+                while (chunk := self.rfile.readline().decode()) != ".\r\n":
+                    data.append(chunk)
+                self.server.messages.append("".join(data))
+                self.reply("250 queued")
+            else:
+                self.reply("250 ok")
+
+
+@pytest.fixture
+def smtp_server(monkeypatch):
+    server = socketserver.ThreadingTCPServer(("127.0.0.1", 0), SMTPStandIn)
+    server.messages = []
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    monkeypatch.setattr(config, "SMTP_HOST", "127.0.0.1")
+    monkeypatch.setattr(config, "SMTP_PORT", server.server_address[1])
+    monkeypatch.setattr(config, "SMTP_USE_TLS", False)
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+class FakeClock:
+    def __init__(self, now=1000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+def test_dispatch_sends_queued_messages_over_smtp(tmp_path, smtp_server):
+    box = Outbox(str(tmp_path / "outbox.sqlite"))
+    box.enqueue("line 1\nline 2", "a@example.com", "Journey Details")
+    box.enqueue("other", "b@example.com", "Journey Details")
+
+    assert box.dispatch() == {"sent": 2, "failed": 0}
+    assert len(smtp_server.messages) == 2
+    assert "line 1" in smtp_server.messages[0]
+    assert box.counts() == {"sent": 2}
+    assert box.dispatch() == {"sent": 0, "failed": 0}
+
+
+def test_failed_send_is_retried_after_backoff(tmp_path):
+    clock = FakeClock()
+    box = Outbox(str(tmp_path / "outbox.sqlite"), clock=clock)
+    box.enqueue("body", "a@example.com", "Journey Details")
+
+    def unreachable():
+        raise ConnectionRefusedError("no smtp")
+
+    assert box.dispatch(smtp_factory=unreachable, backoff=10) == {"sent": 0, "failed": 1}
+    # Not due yet, so nothing is attempted
+    assert box.dispatch(smtp_factory=unreachable, backoff=10) == {"sent": 0, "failed": 0}
+
+    clock.now += 11
+    assert box.dispatch(smtp_factory=unreachable, backoff=10, max_attempts=2) == {"sent": 0, "failed": 1}
+    assert box.counts() == {"dead": 1}
+
+
+def test_claimed_rows_are_not_handed_out_twice(tmp_path):
+    box = Outbox(str(tmp_path / "outbox.sqlite"))
+    box.enqueue("body", "a@example.com", "Journey Details")
+
+    assert len(box.claim(10)) == 1
+    assert box.claim(10) == []
+
+
+def test_queue_email_returns_without_smtp(tmp_path, monkeypatch):
+    monkeypatch.setattr(outbox, "_outbox", Outbox(str(tmp_path / "outbox.sqlite")))
+    monkeypatch.setattr(outbox, "dispatch_in_background", lambda: None)
+
+    assert notifier.queue_email(["Route Details :-"], to="a@example.com") == "Email Queued"
+    assert outbox.get_outbox().counts() == {"pending": 1}
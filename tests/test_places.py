@@ -0,0 +1,101 @@
+import zipfile
+import pytest
+from unittest.mock import patch
+from journey_service import config, digitransit, places
+from journey_service.places import PlaceIndex, load_place_index, normalize_place
+
+STOPS = """stop_id,stop_name,stop_lat,stop_lon
+1,Kamppi (M),60.1690,24.9310
+2,Kamppi (M),60.1692,24.9314
+3,Töölöntori,60.1830,24.9230
+4,Aalto-yliopisto (M),60.1848,24.8268
+5,Keilaniemi (M),60.1755,24.8275
+6,Kaisaniemenpuisto,60.1720,24.9470
+7,Kaisaniemi,60.1710,24.9460
+"""
+
+
+@pytest.fixture
+def gtfs_path(tmp_path):
+    path = tmp_path / "feed.zip"
+    with zipfile.ZipFile(path, "w") as feed:
+        feed.writestr("stops.txt", STOPS)
+    return str(path)
+
+
+def test_normalize_place_folds_finnish_letters_and_metro_suffix():
+    assert normalize_place("Kamppi (M)") == "kamppi"
+    assert normalize_place("  TÖÖLÖNTORI ") == "toolontori"
+    assert normalize_place("Åbo-Turku") == "abo turku"
+
+
+def test_lookup_exact_prefix_and_fuzzy(gtfs_path):
+    index = PlaceIndex.from_sources(gtfs_path)
+
+    # Platforms sharing a name collapse to their centroid
+    assert index.lookup("kamppi") == pytest.approx([24.9312, 60.1691])
+    assert index.lookup("Toolontori") == [24.9230, 60.1830]
+    assert index.lookup("Keilan") == [24.8275, 60.1755]
+    assert index.lookup("Aalto yliopsto") == [24.8268, 60.1848]
+    assert index.lookup("Kaisan") is None  # ambiguous prefix
+    assert index.lookup("Helsinki-Vantaa") is None
+
+
+def test_gazetteer_overrides_stops_and_index_round_trips(tmp_path, gtfs_path):
+    gazetteer = tmp_path / "places.csv"
+    gazetteer.write_text("name,lat,lon\nKamppi,60.1699,24.9320\nOtaniemi,60.1860,24.8270\n")
+    index_path = str(tmp_path / "places.idx")
+
+    built = load_place_index(gtfs_path, str(gazetteer), index_path)
+    loaded = load_place_index(gtfs_path, str(gazetteer), index_path)
+
+    assert loaded.keys == built.keys
+    assert loaded.lookup("Kamppi (M)") == [24.9320, 60.1699]
+    assert loaded.lookup("Otaniemi") == [24.8270, 60.1860]
+
+
+@patch("journey_service.digitransit.http_client.get")
+def test_geocode_only_calls_remote_on_index_miss(mock_get, monkeypatch, gtfs_path):
+    monkeypatch.setattr(places, "_place_index", PlaceIndex.from_sources(gtfs_path))
+    monkeypatch.setattr(places, "_place_index_loaded", True)
+    digitransit.get_geocode_cache().clear()
+    mock_get.return_value.json.return_value = {"features": [{"geometry": {"coordinates": [24.96, 60.32]}}]}
+
+    assert digitransit.geocode("Aalto-yliopisto") == [24.8268, 60.1848]
+    mock_get.assert_not_called()
+    assert digitransit.geocode("Helsinki-Vantaa") == [24.96, 60.32]
+    mock_get.assert_called_once()
+    digitransit.get_geocode_cache().clear()
+
+
+def test_distant_namesakes_and_addresses_are_left_to_the_remote_geocoder(tmp_path):
+    index = PlaceIndex.from_places([
+        ("Asema", 60.17, 24.94), ("Asema", 60.48, 25.10),  # ~35 km apart
+        ("Otakaari", 60.1870, 24.8300),
+    ])
+    assert index.lookup("Asema") is None
+    assert index.lookup("Asem") is None
+    assert index.lookup("Otakaari 7") is None
+    assert index.lookup("Otakari") == [24.8300, 60.1870]
+
+    index.save(str(tmp_path / "places.idx"))
+    assert PlaceIndex.load(str(tmp_path / "places.idx")).lookup("Asema") is None
+
+
+@patch("journey_service.digitransit.http_client.get")
+def test_unusable_place_index_falls_back_to_remote_geocoding(mock_get, monkeypatch, tmp_path, gtfs_path):
+    unsaved = load_place_index(gtfs_path, index_path=str(tmp_path / "missing" / "feed.places"))
+    assert unsaved.lookup("Kamppi") == pytest.approx([24.9312, 60.1691])
+
+    broken = tmp_path / "broken.zip"
+    broken.write_text("not a zip")
+    monkeypatch.setattr(config, "GTFS_PATH", str(broken))
+    monkeypatch.setattr(config, "PLACE_INDEX_ENABLED", True)
+    monkeypatch.setattr(places, "_place_index", None)
+    monkeypatch.setattr(places, "_place_index_loaded", False)
+    digitransit.get_geocode_cache().clear()
+    mock_get.return_value.json.return_value = {"features": [{"geometry": {"coordinates": [24.93, 60.17]}}]}
+
+    assert digitransit.geocode("Kamppi") == [24.93, 60.17]
+    assert places._place_index_loaded and places._place_index is None
+    digitransit.get_geocode_cache().clear()
@@ -0,0 +1,76 @@
+import json
+import os
+import pstats
+import pytest
+from journey_service import config, handler, profiling
+
+
+@pytest.fixture(autouse=True)
+def profile_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(config, "PROFILE_DIR", str(tmp_path))
+    monkeypatch.setattr(config, "PROFILE_TOKEN", "s3cret")
+    return tmp_path
+
+
+def build_payload():
+    return json.dumps([{"leg": i, "stops": list(range(50))} for i in range(2000)])
+
+
+def test_header_token_profiles_the_invocation(profile_dir, monkeypatch):
+    monkeypatch.setattr(handler, "_route_event", lambda event, headers: {"statusCode": 200, "body": build_payload()})
+
+    with profiling.maybe_profile("probe", {"x-profile": "s3cret"}) as report:
+        build_payload()
+
+    assert os.path.exists(report["pstats"]) and os.path.exists(report["tracemalloc"])
+    assert any("build_payload" in row["function"] for row in report["functions"])
+    assert any("test_profiling.py" in row["site"] for row in report["allocations"])
+
+    assert handler.handle_event({"headers": {"X-Profile": "s3cret"}})["statusCode"] == 200
+    assert len(list(profile_dir.glob("handle_event-*.pstats"))) == 1
+
+
+def test_only_sampled_or_authorized_invocations_are_profiled(monkeypatch):
+    assert not profiling.wanted({"x-profile": "guess"})
+    monkeypatch.setattr(config, "PROFILE_TOKEN", None)
+    assert not profiling.wanted({"x-profile": "s3cret"})
+
+    monkeypatch.setattr(config, "PROFILE_ENABLED", True)
+    monkeypatch.setattr(config, "PROFILE_SAMPLE_RATE", 0.0)
+    assert not profiling.wanted()
+    monkeypatch.setattr(config, "PROFILE_SAMPLE_RATE", 1.0)
+    assert profiling.wanted()
+
+
+def test_overlapping_invocations_run_unprofiled(profile_dir):
+    with profiling.maybe_profile("outer", {"x-profile": "s3cret"}) as outer:
+        with profiling.maybe_profile("inner", {"x-profile": "s3cret"}) as inner:
+            pass
+    assert outer["name"] == "outer" and inner == {}
+
+
+def test_old_artifacts_are_pruned(profile_dir, monkeypatch, capsys):
+    monkeypatch.setattr(config, "PROFILE_KEEP", 2)
+    for _ in range(3):
+        with profiling.maybe_profile("probe", {"x-profile": "s3cret"}) as report:
+            build_payload()
+    assert len(list(profile_dir.glob("*.pstats"))) == len(list(profile_dir.glob("*.tracemalloc"))) == 2
+
+    profiling.main(["show", report["pstats"]])
+    assert "build_payload" in capsys.readouterr().out
+
+
+def test_profiled_stream_is_rendered_inside_the_profile(profile_dir, monkeypatch):
+    def lines():
+        yield build_payload()
+        yield "\n"
+
+    monkeypatch.setattr(handler, "_route_event", lambda event, headers: {"statusCode": 200, "body": lines()})
+
+    streamed = handler.handle_event({"headers": {}})
+    assert not isinstance(streamed["body"], str)
+
+    profiled = handler.handle_event({"headers": {"X-Profile": "s3cret"}})
+    assert profiled["body"].endswith("\n")
+    [path] = profile_dir.glob("handle_event-*.pstats")
+    assert any("build_payload" in row["function"] for row in profiling.top_functions(pstats.Stats(str(path))))
@@ -0,0 +1,69 @@
+import pytest
+from unittest.mock import MagicMock, patch
+from journey_service import config, digitransit, queries
+
+
+@pytest.fixture(autouse=True)
+def clear_state():
+    digitransit.get_plan_cache().clear()
+    digitransit._persisted_hashes.clear()
+    yield
+    digitransit.get_plan_cache().clear()
+    digitransit._persisted_hashes.clear()
+
+
+def test_documents_use_variables_and_trim_fields_per_output():
+    text = queries.PLAN_QUERIES["text"]
+
+    assert "$origin: PlanLabeledLocationInput!" in text
+    assert "planConnection(origin: $origin, destination: $destination, dateTime: $dateTime)" in text
+    assert "from { name }" in text and "distance" not in text
+    assert "from {" not in queries.PLAN_QUERIES["matrix"]
+    assert "route { shortName }" in queries.PLAN_QUERIES["expanded"]
+
+    batch = queries.batch_query(2, "matrix")
+    assert batch is queries.batch_query(2, "matrix")
+    assert "p1: planConnection(origin: $o1, destination: $d1, dateTime: $t1)" in batch
+    assert set(queries.plan_variables([24.8, 60.1], [24.9, 60.2], "T", index=1)) == {"o1", "d1", "t1"}
+
+
+@patch("journey_service.digitransit.http_client.post")
+def test_field_selections_are_cached_separately(mock_post):
+    mock_post.return_value = MagicMock(status_code=200, json=lambda: {"data": {"planConnection": {"edges": []}}})
+
+    digitransit.query_journeys([24.83, 60.18], [24.93, 60.21], "20250915084500")
+    digitransit.query_journeys([24.83, 60.18], [24.93, 60.21], "20250915084500", fields="matrix")
+    digitransit.query_journeys([24.83, 60.18], [24.93, 60.21], "20250915084500", fields="matrix")
+
+    assert [c.kwargs["json"]["query"] for c in mock_post.call_args_list] == [
+        queries.PLAN_QUERIES["text"], queries.PLAN_QUERIES["matrix"],
+    ]
+
+
+@patch("journey_service.digitransit.http_client.post")
+def test_persisted_queries_send_hash_only_once_registered(mock_post, monkeypatch):
+    monkeypatch.setattr(config, "GRAPHQL_PERSISTED_QUERIES", True)
+    plan = {"data": {"planConnection": {"edges": []}}}
+    missing = {"errors": [{"message": "PersistedQueryNotFound"}]}
+    replies = iter([plan, plan, missing, plan])
+    mock_post.side_effect = lambda url, **kwargs: MagicMock(status_code=200, json=lambda r=next(replies): r)
+    query = queries.PLAN_QUERIES["text"]
+
+    digitransit.post_query(query, {}, None)
+    digitransit.post_query(query, {}, None)
+    digitransit.post_query(query, {}, None)  # router forgot the hash: resent in full
+
+    bodies = [c.kwargs["json"] for c in mock_post.call_args_list]
+    assert [("query" in body) for body in bodies] == [True, False, False, True]
+    assert all(body["extensions"]["persistedQuery"]["sha256Hash"] == queries.query_hash(query) for body in bodies)
+
+
+def test_page_query_declares_cursor_variables_and_page_info():
+    document = queries.PAGE_QUERIES["expanded"]
+    variables = queries.page_variables([24.8, 60.1], [24.9, 60.2], "2025-09-15T08:45:00+03:00", 5, "abc")
+
+    assert "$first: Int, $after: String" in document
+    assert "first: $first, after: $after" in document
+    assert "pageInfo { hasNextPage endCursor }" in document
+    assert "route { shortName }" in document
+    assert (variables["first"], variables["after"]) == (5, "abc")
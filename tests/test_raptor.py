@@ -0,0 +1,145 @@
+import zipfile
+from datetime import datetime
+import pytest
+from unittest.mock import patch
+from journey_service import config, digitransit, gtfs, raptor
+from journey_service.filters import filter_journeys
+from journey_service.gtfs import Timetable, load_timetable
+
+# Bus 1 runs A -> B -> C; tram 2 runs D -> E, with D a short walk from B
+FEED = {
+    "stops.txt": """stop_id,stop_name,stop_lat,stop_lon
+A,Alppila,60.1700,24.9400
+B,Brahenkatu,60.1800,24.9400
+C,Castreninkatu,60.1900,24.9400
+D,Diakonissalaitos,60.1801,24.9401
+E,Eläintarha,60.2000,24.9500
+""",
+    "routes.txt": """route_id,route_short_name,route_type
+R1,1,3
+R2,2,0
+""",
+    "calendar.txt": """service_id,monday,tuesday,wednesday,thursday,friday,saturday,sunday,start_date,end_date
+WK,1,1,1,1,1,0,0,20250101,20251231
+SAT,0,0,0,0,0,1,0,20250101,20251231
+""",
+    "trips.txt": """route_id,service_id,trip_id
+R1,WK,bus-0800
+R1,WK,bus-0810
+R1,WK,bus-0820
+R1,SAT,bus-0830
+R2,WK,tram-0820
+R2,WK,tram-0835
+""",
+    "stop_times.txt": """trip_id,arrival_time,departure_time,stop_id,stop_sequence
+bus-0800,08:00:00,08:00:00,A,1
+bus-0800,08:05:00,08:05:00,B,2
+bus-0800,08:10:00,08:10:00,C,3
+bus-0810,08:10:00,08:10:00,A,1
+bus-0810,08:15:00,08:15:00,B,2
+bus-0810,08:20:00,08:20:00,C,3
+bus-0820,08:20:00,08:20:00,A,1
+bus-0820,08:25:00,08:25:00,B,2
+bus-0820,08:30:00,08:30:00,C,3
+bus-0830,08:30:00,08:30:00,A,1
+bus-0830,08:35:00,08:35:00,B,2
+bus-0830,08:40:00,08:40:00,C,3
+tram-0820,08:20:00,08:20:00,D,1
+tram-0820,08:30:00,08:30:00,E,2
+tram-0835,08:35:00,08:35:00,D,1
+tram-0835,08:45:00,08:45:00,E,2
+""",
+}
+
+A, C, E = [24.9400, 60.1700], [24.9400, 60.1900], [24.9500, 60.2000]
+
+
+@pytest.fixture
+def feed_path(tmp_path):
+    path = tmp_path / "feed.zip"
+    with zipfile.ZipFile(path, "w") as feed:
+        for name, text in FEED.items():
+            feed.writestr(name, text)
+    return str(path)
+
+
+@pytest.fixture
+def timetable(feed_path):
+    return Timetable.from_gtfs(feed_path)
+
+
+def legs_of(edge):
+    return [(leg["mode"], leg["from"]["name"], leg["to"]["name"], leg["start"]["scheduledTime"][11:16])
+            for leg in edge["node"]["legs"]]
+
+
+def test_latest_arrival_on_a_single_route(timetable):
+    result = raptor.plan(A, C, datetime(2025, 9, 15, 8, 25), count=2, timetable=timetable)
+
+    edges = result["data"]["planConnection"]["edges"]
+    assert [legs_of(edge) for edge in edges] == [
+        [("BUS", "Alppila", "Castreninkatu", "08:10")],
+        [("BUS", "Alppila", "Castreninkatu", "08:00")],
+    ]
+    assert edges[0]["node"]["end"] == "2025-09-15T08:20:00+03:00"
+
+
+def test_transfer_walks_between_nearby_stops(timetable):
+    result = raptor.plan(A, E, datetime(2025, 9, 15, 8, 50), count=1, timetable=timetable)
+
+    [edge] = result["data"]["planConnection"]["edges"]
+    assert legs_of(edge) == [
+        ("BUS", "Alppila", "Brahenkatu", "08:20"),
+        ("WALK", "Brahenkatu", "Diakonissalaitos", "08:25"),
+        ("TRAM", "Diakonissalaitos", "Eläintarha", "08:35"),
+    ]
+    lines = filter_journeys(result, "Alppila", "Eläintarha")
+    assert lines[1] == "Time to leave from Alppila : 08:20:00"
+
+
+def test_only_services_running_that_day_are_used(timetable):
+    saturday = raptor.plan(A, C, datetime(2025, 9, 13, 8, 45), count=3, timetable=timetable)
+    too_early = raptor.plan(A, C, datetime(2025, 9, 15, 8, 5), timetable=timetable)
+
+    assert [legs_of(edge) for edge in saturday["data"]["planConnection"]["edges"]] == [
+        [("BUS", "Alppila", "Castreninkatu", "08:30")],
+    ]
+    assert too_early["data"]["planConnection"]["edges"] == []
+
+
+def test_compiled_timetable_is_memory_mapped_and_plans_identically(feed_path, timetable):
+    loaded = load_timetable(feed_path)
+
+    assert isinstance(loaded.departures, memoryview)
+    assert list(loaded.departures) == list(timetable.departures)
+    assert loaded.stop_names == timetable.stop_names
+    arrive_by = datetime(2025, 9, 15, 8, 50)
+    assert raptor.plan(A, E, arrive_by, timetable=loaded) == raptor.plan(A, E, arrive_by, timetable=timetable)
+
+
+def test_timetable_next_to_a_read_only_feed_is_compiled_into_the_temp_directory(feed_path, tmp_path, monkeypatch):
+    temp = tmp_path / "temp"
+    temp.mkdir()
+    monkeypatch.setattr(gtfs.tempfile, "tempdir", str(temp))
+    monkeypatch.setattr(gtfs.os, "access", lambda path, mode: False)
+
+    assert gtfs.writable_path(feed_path + ".timetable", [feed_path]) == str(temp / "feed.zip.timetable")
+    load_timetable(feed_path)
+    assert (temp / "feed.zip.timetable").exists()
+
+    # A timetable shipped next to the feed is still used while it is up to date
+    (temp / "feed.zip.timetable").rename(feed_path + ".timetable")
+    assert gtfs.writable_path(feed_path + ".timetable", [feed_path]) == feed_path + ".timetable"
+
+
+def test_query_journeys_uses_local_backend_when_configured(monkeypatch, timetable):
+    monkeypatch.setattr(config, "ROUTING_BACKEND", "local")
+    monkeypatch.setattr(raptor, "_timetable", timetable)
+    digitransit.get_plan_cache().clear()
+
+    with patch("journey_service.digitransit.http_client.post") as mock_post:
+        result = digitransit.query_journeys(A, C, "20250915082500")
+
+    mock_post.assert_not_called()
+    assert legs_of(result["data"]["planConnection"]["edges"][0]) == [("BUS", "Alppila", "Castreninkatu", "08:10")]
+    digitransit.get_plan_cache().clear()
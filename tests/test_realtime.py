@@ -0,0 +1,131 @@
+from unittest.mock import patch
+from journey_service import digitransit, queries, realtime
+
+# 2025-09-15 00:00 Helsinki, the service day the stop times count from
+SERVICE_DAY = 1757883600
+
+
+def leg(mode, start, end, duration, trip=None, board=None, alight=None):
+    leg = {
+        "from": {"name": board or "A", "stop": {"gtfsId": board} if board else None},
+        "to": {"name": alight or "B", "stop": {"gtfsId": alight} if alight else None},
+        "start": {"scheduledTime": f"2025-09-15T{start}:00+03:00", "estimated": None},
+        "end": {"scheduledTime": f"2025-09-15T{end}:00+03:00", "estimated": None},
+        "mode": mode, "duration": float(duration), "realtimeState": "SCHEDULED",
+        "serviceDate": "20250915" if trip else None, "trip": {"gtfsId": trip} if trip else None,
+    }
+    return leg
+
+
+def tracked_plan():
+    legs = [
+        leg("WALK", "07:55", "08:00", 300),
+        leg("BUS", "08:00", "08:10", 600, "HSL:550_1", "HSL:1", "HSL:2"),
+        leg("WALK", "08:10", "08:12", 120),
+        leg("METRO", "08:15", "08:25", 600, "HSL:M1_1", "HSL:3", "HSL:4"),
+        leg("WALK", "08:25", "08:30", 300),
+    ]
+    node = {"start": legs[0]["start"]["scheduledTime"], "end": legs[-1]["end"]["scheduledTime"], "legs": legs}
+    return {"data": {"planConnection": {"edges": [{"node": node}]}}}
+
+
+def stoptime(stop, scheduled, delay, state="UPDATED"):
+    seconds = int(scheduled[:2]) * 3600 + int(scheduled[3:]) * 60
+    return {
+        "stop": {"gtfsId": stop}, "serviceDay": SERVICE_DAY, "realtimeState": state,
+        "scheduledArrival": seconds, "realtimeArrival": seconds + delay,
+        "scheduledDeparture": seconds, "realtimeDeparture": seconds + delay,
+    }
+
+
+def trip_times(bus_delay, metro_state="UPDATED"):
+    return {"data": {
+        "t0": {"stoptimesForDate": [stoptime("HSL:1", "08:00", bus_delay), stoptime("HSL:2", "08:10", bus_delay)]},
+        "t1": {"stoptimesForDate": [stoptime("HSL:3", "08:15", 0, metro_state),
+                                    stoptime("HSL:4", "08:25", 0, metro_state)]},
+    }}
+
+
+def test_refresh_updates_delays_in_place_and_reflows_walks():
+    with patch.object(digitransit, "post_query", return_value=trip_times(60)) as mock_post:
+        plan, changes, infeasible = realtime.refresh(tracked_plan())
+
+    variables = mock_post.call_args.args[1]
+    assert variables == {"id0": "HSL:550_1", "date0": "20250915", "id1": "HSL:M1_1", "date1": "20250915"}
+    assert infeasible == []
+    assert {(c["leg"], c["at"], c["delay"]) for c in changes} == {(1, "start", 60), (1, "end", 60)}
+    node = plan["data"]["planConnection"]["edges"][0]["node"]
+    assert node["start"] == "2025-09-15T07:56:00+03:00"  # access walk leaves a minute later
+    assert node["legs"][2]["end"]["estimated"]["time"] == "2025-09-15T08:13:00+03:00"
+    assert node["end"] == "2025-09-15T08:30:00+03:00"
+
+
+def test_missed_transfer_or_cancelled_trip_is_infeasible():
+    with patch.object(digitransit, "post_query", return_value=trip_times(240)):
+        _, _, missed = realtime.refresh(tracked_plan())
+    with patch.object(digitransit, "post_query", return_value=trip_times(0, metro_state="CANCELED")):
+        _, changes, cancelled = realtime.refresh(tracked_plan())
+
+    assert missed == [0]
+    assert cancelled == [0]
+    assert {"itinerary": 0, "leg": 3, "kind": "cancelled"} in changes
+
+
+def test_track_replans_only_when_infeasible():
+    realtime.get_tracked_plans().clear()
+    args = ([24.8, 60.1], [24.9, 60.2], "20250915083000")
+    with patch.object(digitransit, "query_journeys", return_value=tracked_plan()) as mock_plan, \
+         patch.object(digitransit, "post_query", side_effect=[trip_times(60), trip_times(240)]):
+        _, first = realtime.track(*args)
+        _, delayed = realtime.track(*args)
+        _, broken = realtime.track(*args)
+
+    assert first == []
+    assert mock_plan.call_count == 2
+    assert mock_plan.call_args.args[4] == "tracked"
+    assert all(change["kind"] == "delay" for change in delayed)
+    assert broken[-1] == {"kind": "replanned", "itineraries": [0]}
+    realtime.get_tracked_plans().clear()
+
+
+def test_meaningful_ignores_small_delay_changes():
+    small = [{"kind": "delay", "delay": 60, "previous": 0}]
+    assert not realtime.meaningful(small, threshold=120)
+    assert realtime.meaningful([{"kind": "delay", "delay": 200, "previous": 0}], threshold=120)
+    assert realtime.meaningful([{"kind": "replanned", "itineraries": [0]}], threshold=120)
+
+
+def test_delay_creeping_up_is_notified_against_the_last_sent_delay():
+    realtime.get_tracked_plans().clear()
+    args = ([24.8, 60.1], [24.9, 60.2], "20250915083000")
+    notified = []
+    with patch.object(digitransit, "query_journeys", return_value=tracked_plan()):
+        realtime.track(*args)
+        for delay in (30, 60, 90, 120, 150):  # never more than 30 s per refresh
+            with patch.object(digitransit, "post_query", return_value=trip_times(delay)):
+                plan, changes = realtime.track(*args)
+            if realtime.meaningful(changes, threshold=120):
+                realtime.mark_notified(plan)
+                notified.append(delay)
+
+    assert notified == [120]  # 150 is within 120 s of the delay already sent
+    realtime.get_tracked_plans().clear()
+
+
+def test_upstream_estimates_give_delays_in_seconds():
+    # As OTP returns them: an estimated time only, delay derived from it
+    plan = tracked_plan()
+    bus = plan["data"]["planConnection"]["edges"][0]["node"]["legs"][1]
+    bus["start"]["estimated"] = {"time": "2025-09-15T08:01:00+03:00"}
+    bus["end"]["estimated"] = {"time": "2025-09-15T08:11:00+03:00"}
+    realtime.mark_notified(plan)
+    assert (bus["start"]["notifiedDelay"], bus["end"]["notifiedDelay"]) == (60, 60)
+
+    with patch.object(digitransit, "post_query", return_value=trip_times(240)):
+        _, changes, _ = realtime.refresh(plan)
+
+    assert {(c["at"], c["delay"], c["previous"], c["notified"]) for c in changes} == {
+        ("start", 240, 60, 60), ("end", 240, 60, 60),
+    }
+    assert realtime.meaningful(changes, threshold=120)
+    assert "delay" not in queries.LEG_FIELDS["tracked"]
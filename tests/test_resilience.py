@@ -0,0 +1,91 @@
+import threading
+from journey_service.resilience import AdaptiveLimiter, CircuitBreaker, TokenBucket
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+
+def test_token_bucket_waits_for_refill_and_honours_retry_after():
+    clock = FakeClock()
+    bucket = TokenBucket(rate=2, burst=2, clock=clock, sleep=clock.sleep)
+
+    assert bucket.acquire(max_wait=0) and bucket.acquire(max_wait=0)
+    assert not bucket.acquire(max_wait=0.1)  # next token is 0.5 s away
+    assert bucket.acquire(max_wait=1)
+    assert clock.now == 1000.5
+
+    bucket.observe({"Retry-After": "10", "X-RateLimit-Remaining": "0"})
+    assert not bucket.acquire(max_wait=5)
+    assert bucket.acquire(max_wait=11)
+    assert clock.now >= 1010.5
+
+
+def test_adaptive_limiter_halves_on_throttle_and_grows_back_additively():
+    limiter = AdaptiveLimiter(8, minimum=1, maximum=8)
+
+    limiter.on_throttle()
+    limiter.on_throttle()
+    assert limiter.limit == 2
+    for _ in range(4):
+        limiter.on_success()
+    assert 3 < limiter.limit < 4
+
+    entered, release = threading.Event(), threading.Event()
+    limiter.limit = 1
+
+    def hold():
+        with limiter:
+            entered.set()
+            release.wait(2)
+
+    worker = threading.Thread(target=hold)
+    worker.start()
+    entered.wait(2)
+    assert limiter.in_flight == 1
+    release.set()
+    worker.join()
+    with limiter:
+        assert limiter.in_flight == 1
+
+
+def test_circuit_breaker_opens_then_probes_once_after_timeout():
+    clock = FakeClock()
+    breaker = CircuitBreaker(threshold=3, reset_timeout=30, clock=clock)
+
+    for _ in range(3):
+        assert breaker.allow()
+        breaker.record_failure()
+    assert not breaker.allow()
+    assert breaker.retry_after() == 30
+
+    clock.now += 30
+    assert breaker.allow()          # the half-open probe
+    assert not breaker.allow()      # everyone else waits for its outcome
+    breaker.record_failure()
+    assert breaker.state == "open"
+
+    clock.now += 30
+    assert breaker.allow()
+    breaker.record_success()
+    assert breaker.state == "closed" and breaker.allow()
+
+
+def test_circuit_breaker_probe_without_outcome_is_not_stuck():
+    clock = FakeClock()
+    breaker = CircuitBreaker(threshold=1, reset_timeout=30, clock=clock, probe_timeout=10)
+    breaker.record_failure()
+    clock.now += 30
+    assert breaker.allow()
+    breaker.release()               # e.g. the probe was throttled
+    assert breaker.allow()
+    assert not breaker.allow()
+    clock.now += 10                 # the probe never reported back
+    assert breaker.allow()
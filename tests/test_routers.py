@@ -0,0 +1,77 @@
+import threading
+import pytest
+from unittest.mock import MagicMock, patch
+from journey_service import config, digitransit, routers
+from journey_service.resilience import UpstreamUnavailable
+
+KAMPPI, OTANIEMI = [24.93, 60.17], [24.83, 60.19]
+TAMPERE, HERVANTA = [23.76, 61.5], [23.85, 61.45]
+
+
+@pytest.fixture(autouse=True)
+def selection(monkeypatch):
+    monkeypatch.setattr(config, "ROUTER_SELECTION", True)
+    monkeypatch.setattr(config, "ROUTING_URL", "https://api.digitransit.fi/routing/v2/hsl/gtfs/v1")
+    routers.reset()
+    digitransit.get_plan_cache().clear()
+    yield
+    routers.reset()
+    digitransit.get_plan_cache().clear()
+
+
+def names(chain):
+    return [router.name for router in chain]
+
+
+def test_chain_prefers_the_smallest_router_covering_both_ends():
+    assert names(routers.chain(KAMPPI, OTANIEMI)) == ["hsl", "finland"]
+    assert names(routers.chain(TAMPERE, HERVANTA)) == ["waltti", "finland"]
+    assert names(routers.chain(KAMPPI, TAMPERE)) == ["finland"]
+    assert names(routers.chain([18.07, 59.33], KAMPPI)) == ["finland"]  # Stockholm: largest router alone
+    assert routers.get_router("waltti").url == "https://api.digitransit.fi/routing/v2/waltti/gtfs/v1"
+
+
+def test_selection_off_uses_routing_url(monkeypatch):
+    monkeypatch.setattr(config, "ROUTER_SELECTION", False)
+    [router] = routers.chain(TAMPERE, HERVANTA)
+    assert (router.url, router.service, router.pool) == (config.ROUTING_URL, "routing", None)
+
+
+@patch("journey_service.digitransit.http_client.post")
+def test_unavailable_regional_router_falls_back_to_the_next(mock_post):
+    plan = {"data": {"planConnection": {"edges": []}}}
+
+    def fake_post(url, **kwargs):
+        if kwargs["service"] == "routing_hsl":
+            raise UpstreamUnavailable("routing_hsl", "circuit open")
+        return MagicMock(status_code=200, json=lambda: plan)
+
+    mock_post.side_effect = fake_post
+    result = digitransit.query_journeys(KAMPPI, OTANIEMI, "20250915084500")
+
+    assert [call.args[0] for call in mock_post.call_args_list] == [
+        routers.get_router("hsl").url, routers.get_router("finland").url,
+    ]
+    assert mock_post.call_args.kwargs["pool"] == "finland"
+    assert result["router"] == "finland"
+
+
+def test_saturated_router_raises_unavailable():
+    router = routers.Router("tiny", "https://example.invalid", max_concurrency=1)
+    held, release = threading.Event(), threading.Event()
+
+    def hold():
+        with router.slot():
+            held.set()
+            release.wait(2)
+
+    thread = threading.Thread(target=hold)
+    thread.start()
+    held.wait(2)
+    with pytest.raises(UpstreamUnavailable):
+        with router.slot(wait=0.01):
+            pass
+    release.set()
+    thread.join()
+    with router.slot(wait=0.01):
+        pass
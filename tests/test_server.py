@@ -0,0 +1,132 @@
+import asyncio
+import gzip
+import http.client
+import json
+import socket
+import threading
+from unittest.mock import patch
+from journey_service import handler, server
+
+
+def test_to_event_matches_api_gateway_shape():
+    scope = {"method": "GET", "path": "/journeys", "query_string": b"origin=Aalto&arriveBy=20250915084500",
+             "headers": [(b"accept", b"application/json")]}
+
+    event = server.to_event(scope, b"")
+
+    assert event["queryStringParameters"] == {"origin": "Aalto", "arriveBy": "20250915084500"}
+    assert event["headers"] == {"accept": "application/json"}
+    assert event["body"] is None
+
+
+def run_server():
+    sock = server.bind("127.0.0.1", 0)
+    stop = asyncio.Event()
+    loop = asyncio.new_event_loop()
+    thread = threading.Thread(target=loop.run_until_complete, args=(server.serve(sock, stop),), daemon=True)
+    thread.start()
+    return sock.getsockname()[1], lambda: (loop.call_soon_threadsafe(stop.set), thread.join(5))
+
+
+def test_server_routes_requests_through_handle_event_over_keep_alive():
+    responses = [
+        {"statusCode": 200, "body": json.dumps({"message": "ok"})},
+        {"statusCode": 503, "headers": {"Retry-After": "30"}, "body": json.dumps({"error": "down"})},
+    ]
+    with patch.object(handler, "handle_event", side_effect=responses) as mock_handle:
+        port, stop = run_server()
+        try:
+            connection = http.client.HTTPConnection("127.0.0.1", port, timeout=5)
+            connection.request("GET", "/journeys?origin=Aalto")
+            first = connection.getresponse()
+            first_body = json.loads(first.read())
+            connection.request("POST", "/journeys/matrix", body=b'{"origins": []}')
+            second = connection.getresponse()
+            second.read()
+            connection.request("GET", "/health")
+            health = connection.getresponse()
+            health.read()
+            connection.close()
+        finally:
+            stop()
+
+    assert first.status == 200 and first_body == {"message": "ok"}
+    assert second.status == 503 and second.getheader("Retry-After") == "30"
+    assert health.status == 200
+    assert mock_handle.call_count == 2  # one connection, health answered in-loop
+    assert mock_handle.call_args.args[0]["body"] == '{"origins": []}'
+
+
+def test_oversized_body_is_rejected(monkeypatch):
+    monkeypatch.setattr(server.config, "SERVER_MAX_BODY", 10)
+    port, stop = run_server()
+    try:
+        connection = http.client.HTTPConnection("127.0.0.1", port, timeout=5)
+        connection.request("POST", "/journeys/batch", body=b"x" * 100)
+        response = connection.getresponse()
+        connection.close()
+    finally:
+        stop()
+
+    assert response.status == 413
+
+
+def test_malformed_requests_get_an_error_status_instead_of_a_dropped_connection():
+    heads = [
+        b"POST /journeys HTTP/1.1\r\nContent-Length: abc\r\n\r\n",
+        b"POST /journeys HTTP/1.1\r\nContent-Length: -4\r\n\r\n",
+        b"NONSENSE\r\n\r\n",
+        b"POST /journeys HTTP/1.1\r\nTransfer-Encoding: chunked\r\n\r\n4\r\nbody\r\n0\r\n\r\n",
+    ]
+    port, stop = run_server()
+    statuses = []
+    try:
+        for head in heads:
+            with socket.create_connection(("127.0.0.1", port), timeout=5) as client:
+                client.sendall(head)
+                statuses.append(client.recv(1024).split(b"\r\n", 1)[0])
+    finally:
+        stop()
+
+    assert statuses == [b"HTTP/1.1 400 Bad Request"] * 3 + [b"HTTP/1.1 411 Length Required"]
+
+
+def test_streamed_bodies_are_sent_chunked():
+    streamed = {"statusCode": 200, "headers": {"Content-Type": "application/x-ndjson"},
+                "body": iter(['{"n": 1}\n', '{"n": 2}\n'])}
+    with patch.object(handler, "handle_event", return_value=streamed):
+        port, stop = run_server()
+        try:
+            connection = http.client.HTTPConnection("127.0.0.1", port, timeout=5)
+            connection.request("GET", "/journeys?stream=true")
+            response = connection.getresponse()
+            lines = response.read().decode().splitlines()
+            connection.close()
+        finally:
+            stop()
+
+    assert response.getheader("Transfer-Encoding") == "chunked"
+    assert [json.loads(line)["n"] for line in lines] == [1, 2]
+
+
+def test_large_bodies_are_gzipped_for_clients_that_accept_it():
+    body = json.dumps({"message": ["line"] * 500})
+    response = {"statusCode": 200, "headers": {"ETag": '"abc"'}, "body": body}
+    with patch.object(handler, "handle_event", return_value=response):
+        port, stop = run_server()
+        try:
+            connection = http.client.HTTPConnection("127.0.0.1", port, timeout=5)
+            connection.request("GET", "/journeys", headers={"Accept-Encoding": "gzip, br"})
+            compressed = connection.getresponse()
+            payload = compressed.read()
+            connection.request("GET", "/journeys")
+            plain = connection.getresponse()
+            plain.read()
+            connection.close()
+        finally:
+            stop()
+
+    assert compressed.getheader("Content-Encoding") == "gzip"
+    assert compressed.getheader("ETag") == '"abc-gzip"'
+    assert gzip.decompress(payload).decode() == body
+    assert plain.getheader("Content-Encoding") is None and plain.getheader("ETag") == '"abc"'
@@ -0,0 +1,120 @@
+import fcntl
+import multiprocessing
+import os
+import threading
+import time
+from unittest.mock import MagicMock, patch
+from journey_service import config, digitransit
+from journey_service.singleflight import FileSingleFlight, SingleFlight
+
+
+def run_together(count, fn):
+    barrier = threading.Barrier(count, timeout=2)
+    results = [None] * count
+
+    def worker(i):
+        barrier.wait()
+        try:
+            results[i] = fn()
+        except Exception as e:
+            results[i] = e
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(count)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
+
+
+def test_concurrent_identical_calls_share_one_execution():
+    flight, calls = SingleFlight(), []
+
+    def slow(value):
+        calls.append(value)
+        time.sleep(0.1)
+        return {"plan": value}
+
+    results = run_together(5, lambda: flight.do("key", slow, 1))
+
+    assert calls == [1]
+    assert all(result is results[0] for result in results)
+    assert flight.do("key", slow, 2) == {"plan": 2}  # finished calls are not reused
+
+
+def test_leader_exception_is_shared_with_waiters():
+    flight = SingleFlight()
+
+    def failing():
+        time.sleep(0.1)
+        raise RuntimeError("router down")
+
+    results = run_together(3, lambda: flight.do("key", failing))
+
+    assert all(isinstance(result, RuntimeError) for result in results)
+
+
+def _file_flight_worker(directory, log_path, barrier, queue):
+    def compute():
+        with open(log_path, "a") as log:
+            log.write("call\n")
+        time.sleep(0.3)
+        return [24.83, 60.18]
+
+    barrier.wait()
+    queue.put(FileSingleFlight(directory).do("geocode:kamppi", compute))
+
+
+def test_file_single_flight_coalesces_across_processes(tmp_path):
+    context = multiprocessing.get_context("fork")
+    barrier, queue = context.Barrier(2), context.Queue()
+    log_path = tmp_path / "calls.log"
+    processes = [
+        context.Process(target=_file_flight_worker, args=(str(tmp_path / "flight"), str(log_path), barrier, queue))
+        for _ in range(2)
+    ]
+    for process in processes:
+        process.start()
+    results = [queue.get(timeout=5) for _ in processes]
+    for process in processes:
+        process.join(5)
+
+    assert results == [[24.83, 60.18], [24.83, 60.18]]
+    assert log_path.read_text() == "call\n"
+
+
+def test_file_single_flight_prunes_old_records(tmp_path, monkeypatch):
+    monkeypatch.setattr(config, "COALESCE_RECORD_TTL", 60)
+    flight = FileSingleFlight(str(tmp_path))
+    for minute in range(3):
+        flight.do(f"plan:0845{minute}", lambda: {"plan": minute})
+    assert len(os.listdir(tmp_path)) == 6
+    for path in tmp_path.iterdir():
+        os.utime(path, (time.time() - 120,) * 2)
+
+    held_path, _ = flight._paths("plan:08450")
+    with open(held_path, "a") as held:
+        fcntl.flock(held, fcntl.LOCK_EX)
+        flight._pruned = time.time() - 120
+        assert flight.do("plan:08460", lambda: {"plan": 9}) == {"plan": 9}
+
+    assert sorted(os.listdir(tmp_path)) == sorted(
+        os.path.basename(path) for path in (held_path, *flight._paths("plan:08460"))
+    )
+
+
+@patch("journey_service.digitransit.http_client.get")
+def test_concurrent_geocodes_of_one_place_make_one_request(mock_get):
+    digitransit.get_geocode_cache().clear()
+
+    def slow_get(url, params, **kwargs):
+        time.sleep(0.1)
+        return MagicMock(status_code=200, json=lambda: {"features": [{"geometry": {"coordinates": [24.8, 60.1]}}]})
+
+    mock_get.side_effect = slow_get
+
+    results = run_together(4, lambda: digitransit.geocode("Kamppi"))
+
+    assert results == [[24.8, 60.1]] * 4
+    assert mock_get.call_count == 1
+    digitransit.get_geocode_cache().clear()
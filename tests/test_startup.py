@@ -0,0 +1,49 @@
+import json
+import os
+import subprocess
+import sys
+
+SRC = os.path.join(os.path.dirname(__file__), "..", "src")
+
+# Modules that only some paths need; importing the handler must not load them
+LAZY_MODULES = ["requests", "smtplib", "email.mime.text", "dotenv", "sqlite3", "zoneinfo", "numpy"]
+
+# Budget for journey_service's own module bodies (dependencies excluded)
+OWN_IMPORT_BUDGET_US = 50_000
+
+PROBE = f"""
+import json, sys, time
+started = time.perf_counter()
+import journey_service.handler
+elapsed = time.perf_counter() - started
+from journey_service import config
+print(json.dumps({{
+    "elapsed": elapsed,
+    "loaded": [m for m in {LAZY_MODULES!r} if m in sys.modules],
+    "config_resolved": config.load.cache_info().currsize,
+}}))
+"""
+
+
+def run_probe():
+    env = dict(os.environ, PYTHONPATH=SRC)
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", PROBE],
+        capture_output=True, text=True, env=env, check=True,
+    )
+    own_us = 0
+    for line in proc.stderr.splitlines():
+        # "import time: self [us] | cumulative | imported package"
+        parts = line.split("|")
+        if len(parts) == 3 and parts[2].strip().startswith("journey_service"):
+            own_us += int(parts[0].split(":")[1])
+    return json.loads(proc.stdout), own_us
+
+
+def test_handler_import_is_lazy_and_within_budget():
+    result, own_us = run_probe()
+    print(f"handler import: {result['elapsed'] * 1000:.1f} ms total, {own_us / 1000:.1f} ms in journey_service")
+
+    assert result["loaded"] == []
+    assert result["config_resolved"] == 0
+    assert own_us < OWN_IMPORT_BUDGET_US
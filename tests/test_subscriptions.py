@@ -0,0 +1,179 @@
+import json
+import time
+from datetime import date
+import pytest
+from journey_service import config, digitransit, subscriptions
+from journey_service.cache import SqliteCache
+from journey_service.resilience import UpstreamUnavailable
+
+
+SUBSCRIBERS = [
+    {"email": "a@example.com", "origin": "Aalto-yliopisto", "destination": "Keilaniemi", "arriveAt": "08:45"},
+    {"email": "b@example.com", "origin": "aalto-yliopisto ", "destination": "Keilaniemi", "arriveAt": "08:45"},
+    {"email": "c@example.com", "origin": "Kamppi", "destination": "Keilaniemi", "arriveAt": "9:00"},
+]
+
+
+@pytest.fixture(autouse=True)
+def prefetch_store(tmp_path, monkeypatch):
+    store = SqliteCache(str(tmp_path / "prefetch.sqlite"), ttl=5400)
+    monkeypatch.setattr(subscriptions, "_prefetch_store", store)
+    return store
+
+
+def test_group_subscriptions_merges_identical_trips():
+    groups = subscriptions.group_subscriptions(SUBSCRIBERS, date(2025, 9, 15))
+
+    assert len(groups) == 2
+    assert [len(members) for members in groups.values()] == [2, 1]
+    assert ("kamppi", "keilaniemi", "20250915090000") in groups
+
+
+def test_load_subscriptions_falls_back_to_to_email(monkeypatch):
+    monkeypatch.setattr(config, "SUBSCRIPTIONS", None)
+    monkeypatch.setattr(config, "SUBSCRIPTIONS_FILE", None)
+    monkeypatch.setattr(config, "TO_EMAIL", "andrea@example.com")
+
+    [subscription] = subscriptions.load_subscriptions()
+    assert subscription["email"] == "andrea@example.com"
+    assert subscription["arriveAt"] == config.DEFAULT_ARRIVE_AT
+
+    monkeypatch.setattr(config, "SUBSCRIPTIONS", json.dumps(SUBSCRIBERS))
+    assert len(subscriptions.load_subscriptions()) == 3
+
+
+def test_run_scheduled_plans_once_per_trip_and_sends_in_one_session(monkeypatch):
+    planned = []
+    sent = []
+
+    def fake_query_journeys_batch(trips):
+        planned.extend(trips)
+        return [{"data": {"planConnection": {"edges": []}}} for _ in trips]
+
+    monkeypatch.setattr(subscriptions, "get_coordinates_many", lambda names, errors: {n: [24.8, 60.1] for n in names})
+    monkeypatch.setattr(subscriptions, "query_journeys_batch", fake_query_journeys_batch)
+    monkeypatch.setattr(subscriptions, "send_emails", lambda messages: sent.append(messages) or ["Email Sent"] * len(messages))
+    monkeypatch.setattr(config, "EMAIL_DELIVERY", "sync")
+
+    summary = subscriptions.run_scheduled(SUBSCRIBERS, day=date(2025, 9, 15))
+
+    assert len(planned) == 2
+    assert len(sent) == 1  # a single send_emails call, i.e. one SMTP session
+    assert [to for to, _, _ in sent[0]] == ["a@example.com", "b@example.com", "c@example.com"]
+    assert summary == {"subscribers": 3, "plans": 2, "sent": 3, "failed": 0}
+
+
+def test_trips_that_fail_to_geocode_do_not_stop_the_others(monkeypatch):
+    def fake_geocode(text, timeout=None):
+        if text == "Kamppi":
+            raise digitransit.PlaceNotFound(f"No results found for '{text}'")
+        if text == "Otaniemi":
+            raise UpstreamUnavailable("geocode", "circuit open")
+        return [24.8, 60.1]
+
+    sent = []
+    monkeypatch.setattr(digitransit, "geocode", fake_geocode)
+    monkeypatch.setattr(subscriptions, "query_journeys_batch",
+                        lambda trips, fields="text": [plan("planned") for _ in trips])
+    monkeypatch.setattr(subscriptions, "send_emails", lambda messages: sent.extend(messages) or ["Email Sent"] * len(messages))
+    monkeypatch.setattr(config, "EMAIL_DELIVERY", "sync")
+    subscribers = SUBSCRIBERS + [
+        {"email": "d@example.com", "origin": "Otaniemi", "destination": "Keilaniemi", "arriveAt": "08:45"},
+    ]
+
+    prefetched = subscriptions.run_prefetch(subscribers, day=date(2025, 9, 16))
+    stored = [group for group in subscriptions.group_subscriptions(subscribers, date(2025, 9, 16))
+                           if subscriptions.get_prefetch_store().get(subscriptions._prefetch_key(group))]
+    summary = subscriptions.run_scheduled(subscribers, day=date(2025, 9, 15))
+
+    assert prefetched == {"plans": 3, "prefetched": 1, "failed": 2}
+    assert stored == [("aalto-yliopisto", "keilaniemi", "20250916084500")]
+    assert [to for to, _, _ in sent] == ["a@example.com", "b@example.com"]
+    assert summary == {"subscribers": 4, "plans": 3, "sent": 2, "failed": 2}
+
+
+def test_run_refresh_emails_only_trips_with_meaningful_changes(monkeypatch):
+    sent = []
+    empty = {"data": {"planConnection": {"edges": []}}}
+
+    def fake_track(origin, destination, arrive_by):
+        delay = 300 if arrive_by.endswith("090000") else 30
+        return empty, [{"kind": "delay", "delay": delay, "previous": 0}]
+
+    monkeypatch.setattr(subscriptions, "get_coordinates_many", lambda names, errors: {n: [24.8, 60.1] for n in names})
+    monkeypatch.setattr(subscriptions, "track", fake_track)
+    monkeypatch.setattr(subscriptions, "send_emails", lambda messages: sent.extend(messages) or ["Email Sent"] * len(messages))
+    monkeypatch.setattr(config, "EMAIL_DELIVERY", "sync")
+
+    summary = subscriptions.run_refresh(SUBSCRIBERS, day=date(2025, 9, 15))
+
+    assert [(to, subject) for to, _, subject in sent] == [("c@example.com", "Journey Update")]
+    assert summary == {"plans": 2, "changed": 1, "sent": 1, "failed": 0}
+
+
+def plan(label):
+    return {"data": {"planConnection": {"edges": [], "label": label}}}
+
+
+def test_prefetch_stores_tracked_plans_for_delivery(monkeypatch, prefetch_store):
+    selections = []
+    monkeypatch.setattr(subscriptions, "get_coordinates_many", lambda names, errors: {n: [24.8, 60.1] for n in names})
+    monkeypatch.setattr(subscriptions, "query_journeys_batch",
+                        lambda trips, fields="text": selections.append(fields) or [plan("prefetched") for _ in trips])
+
+    summary = subscriptions.run_prefetch(SUBSCRIBERS, day=date(2025, 9, 15))
+
+    assert summary == {"plans": 2, "prefetched": 2, "failed": 0}
+    assert selections == ["tracked"]
+    entry = prefetch_store.get("kamppi|keilaniemi|20250915090000")
+    assert entry["plan"] == plan("prefetched")
+
+
+def test_delivery_uses_fresh_prefetched_plans_and_refreshes_older_ones(monkeypatch, prefetch_store):
+    prefetch_store.set("aalto-yliopisto|keilaniemi|20250915084500", {"plan": plan("fresh"), "fetchedAt": time.time()})
+    prefetch_store.set("kamppi|keilaniemi|20250915090000", {"plan": plan("old"), "fetchedAt": time.time() - 3600})
+    rendered, refreshed = [], []
+
+    def fake_refresh(stored):
+        refreshed.append(stored)
+        return plan("refreshed"), [], []
+
+    monkeypatch.setattr(subscriptions, "refresh", fake_refresh)
+    monkeypatch.setattr(subscriptions, "get_coordinates_many", lambda names, errors: pytest.fail("nothing to geocode"))
+    monkeypatch.setattr(subscriptions, "query_journeys_batch", lambda trips: pytest.fail("nothing to plan"))
+    monkeypatch.setattr(subscriptions, "filter_journeys",
+                        lambda result, origin, destination: rendered.append(result["data"]["planConnection"]["label"]) or [])
+    monkeypatch.setattr(subscriptions, "send_emails", lambda messages: ["Email Sent"] * len(messages))
+    monkeypatch.setattr(config, "EMAIL_DELIVERY", "sync")
+
+    summary = subscriptions.run_scheduled(SUBSCRIBERS, day=date(2025, 9, 15))
+
+    assert refreshed == [plan("old")]
+    assert rendered == ["fresh", "refreshed"]
+    assert summary == {"subscribers": 3, "plans": 2, "sent": 3, "failed": 0}
+
+
+def test_delivery_replans_infeasible_and_keeps_plans_during_outages(monkeypatch, prefetch_store):
+    old = time.time() - 3600
+    prefetch_store.set("aalto-yliopisto|keilaniemi|20250915084500", {"plan": plan("broken"), "fetchedAt": old})
+    prefetch_store.set("kamppi|keilaniemi|20250915090000", {"plan": plan("kept"), "fetchedAt": old})
+    planned, rendered = [], []
+
+    def fake_refresh(stored):
+        if stored == plan("broken"):
+            return stored, [], [0]
+        raise UpstreamUnavailable("routing", "circuit open")
+
+    monkeypatch.setattr(subscriptions, "refresh", fake_refresh)
+    monkeypatch.setattr(subscriptions, "get_coordinates_many", lambda names, errors: {n: [24.8, 60.1] for n in names})
+    monkeypatch.setattr(subscriptions, "query_journeys_batch",
+                        lambda trips: planned.extend(trips) or [plan("replanned") for _ in trips])
+    monkeypatch.setattr(subscriptions, "filter_journeys",
+                        lambda result, origin, destination: rendered.append(result["data"]["planConnection"]["label"]) or [])
+    monkeypatch.setattr(subscriptions, "send_emails", lambda messages: ["Email Sent"] * len(messages))
+    monkeypatch.setattr(config, "EMAIL_DELIVERY", "sync")
+
+    subscriptions.run_scheduled(SUBSCRIBERS, day=date(2025, 9, 15))
+
+    assert len(planned) == 1
+    assert sorted(rendered) == ["kept", "replanned"]
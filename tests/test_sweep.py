@@ -0,0 +1,91 @@
+import json
+import threading
+import time
+from unittest.mock import patch
+from journey_service import handler, sweep
+
+
+def edge(start, end, mode="BUS"):
+    leg = {
+        "from": {"name": "Origin"}, "to": {"name": "Destination"},
+        "start": {"scheduledTime": f"2025-09-15T{start}:00+03:00"},
+        "end": {"scheduledTime": f"2025-09-15T{end}:00+03:00"},
+        "mode": mode, "duration": 600.0, "realtimeState": "SCHEDULED",
+    }
+    return {"node": {"start": leg["start"]["scheduledTime"], "end": leg["end"]["scheduledTime"], "legs": [leg]}}
+
+
+def plan(*edges):
+    return {"data": {"planConnection": {"edges": list(edges)}}}
+
+
+def test_arrival_times_cover_window_inclusively():
+    assert sweep.arrival_times("20250915080000", "20250915081500", 5) == [
+        "20250915080000", "20250915080500", "20250915081000", "20250915081500",
+    ]
+    assert sweep.arrival_times("20250915090000", "20250915080000", 5) == []
+
+
+def test_merge_plans_dedupes_by_leg_signature_and_orders_by_departure():
+    merged = sweep.merge_plans([
+        plan(edge("08:10", "08:20"), edge("08:00", "08:10")),
+        plan(edge("08:10", "08:20"), edge("08:20", "08:30")),
+        plan(edge("08:10", "08:20", mode="TRAM")),
+        {"data": {"planConnection": None}},
+    ])
+
+    nodes = [e["node"] for e in merged["data"]["planConnection"]["edges"]]
+    assert [(n["start"][11:16], n["legs"][0]["mode"]) for n in nodes] == [
+        ("08:00", "BUS"), ("08:10", "BUS"), ("08:10", "TRAM"), ("08:20", "BUS"),
+    ]
+
+
+def test_sweep_limits_plans_in_flight():
+    in_flight, peak, lock = [0], [0], threading.Lock()
+
+    def fake_query(origin, destination, arrive_by, timeout=None, fields="text"):
+        with lock:
+            in_flight[0] += 1
+            peak[0] = max(peak[0], in_flight[0])
+        time.sleep(0.01)
+        with lock:
+            in_flight[0] -= 1
+        return plan(edge(arrive_by[8:10] + ":" + arrive_by[10:12], "09:00"))
+
+    with patch.object(sweep, "query_journeys", side_effect=fake_query) as mock_query:
+        merged = sweep.sweep([24.8, 60.1], [24.9, 60.2], "20250915080000", "20250915085500", 5, max_concurrency=3)
+
+    assert mock_query.call_count == 12
+    assert peak[0] <= 3
+    assert len(merged["data"]["planConnection"]["edges"]) == 12
+
+
+def test_handler_sweep_mode_validates_and_returns_json_itineraries():
+    params = {"origin": "Aalto", "destination": "Keilaniemi", "windowStart": "20250915080000"}
+    too_wide = dict(params, windowEnd="20250916080000")
+    valid = dict(params, windowEnd="20250915081000", step="10")
+
+    with patch.object(handler, "get_coordinates", return_value=([24.8, 60.1], [24.9, 60.2])), \
+         patch.object(handler, "sweep", return_value=plan(edge("08:00", "08:10"))) as mock_sweep:
+        rejected = handler._sweep_response(too_wide)
+        result = handler._sweep_response(valid)
+
+    assert rejected["statusCode"] == 400
+    assert result["statusCode"] == 200
+    assert mock_sweep.call_args.args[2:] == ("20250915080000", "20250915081000", 10)
+    [journey] = json.loads(result["body"])["message"]["Journeys"]
+    assert journey["legs"][0]["from"] == "Aalto"
+
+
+def test_handler_sweep_rejects_bad_steps_and_weekend_stretched_windows():
+    params = {"origin": "Aalto", "destination": "Keilaniemi"}
+    huge = dict(params, windowStart="20000101000000", windowEnd="20991231000000", step="1")
+    negative = dict(params, windowStart="20250915080000", windowEnd="20250915090000", step="-5")
+    # Friday 23:30 -> Saturday 00:00 becomes Friday 23:30 -> Monday 00:00
+    weekend = dict(params, windowStart="20250912233000", windowEnd="20250913000000", step="5")
+
+    with patch.object(handler, "sweep") as mock_sweep:
+        for window in (huge, negative, weekend):
+            assert handler._sweep_response(window)["statusCode"] == 400
+    mock_sweep.assert_not_called()
+    assert sweep.step_count("20000101000000", "20991231000000", 1) > 50_000_000